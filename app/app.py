@@ -1,17 +1,41 @@
-import sys, configparser, websocket, json, threading
-import pandas as pd
+import time
+started = time.perf_counter()
 
-from components.logger import Logger
-from components.candles import Candles
-from components.indicators import Indicators
-from components.signals import Signals
-from components.bookmaker import Bookie
+import sys, configparser, argparse, asyncio, json
+
+from components.logger import Logger, flush
+from components.stream import Stream
+from components.klinecache import KlineCache
+from components.history import HistoryStore
+from components.renderer import ChartRenderer
+from components.pipeline import Pipeline
+from components.connection import Connection
+from components.decoder import KlineDecoder
+from components.sharding import ShardPool
+from components.orders import OrderEngine, EXCHANGES
+from components.recorder import Recorder
+from components.replayer import Replayer
+from components.metrics import metrics
+
+
+# Seconds from the start of app.py to the end of every startup phase
+phases = {"imports": time.perf_counter() - started}
 
 
 #
 # Configuration
 #
 
+# Live by default. With --replay, recorded websocket messages are fed through the same pipeline instead, without connecting:
+#
+# python app.py --replay recordings/2024-05-16.tsv.gz --speed 10
+#
+parser = argparse.ArgumentParser(description="Trade the configured streams on the Binance websocket, or on a recording of it")
+parser.add_argument("--replay", nargs="+", metavar="FILE", help="Replay these recordings (see [recorder]) instead of connecting")
+parser.add_argument("--speed", type=float, default=1, help="Replay speed: 1 for real time, N for N times as fast, 0 for as fast as possible")
+
+args = parser.parse_args()
+
 config = configparser.ConfigParser()
 config.read("config/config.ini")
 
@@ -21,7 +45,70 @@ try:
     token       = config["trading"]["token"]
     interval    = config["trading"]["interval"]
     timeframe   = config["trading"]["timeframe"]
+
+    # Comma separated list of <token>@<interval> pairs, all read from one combined websocket.
+    # Defaults to the single token and interval above.
+    streams     = config["trading"].get("streams", fallback="{}@{}".format(token, interval))
+
+    # Comma separated list of higher intervals, resampled locally from the klines of every stream above
+    resample    = config["trading"].get("resample", fallback="")
+    resample    = [derived.strip() for derived in resample.split(",") if derived.strip()]
+    endpoint    = config.get("websocket", "endpoint", fallback="wss://stream.binance.com:9443")
+    decoder     = config.get("websocket", "decoder", fallback="auto")
+
+    reconnect_delay     = config.getfloat("websocket", "reconnect_delay", fallback=1)
+    max_reconnect_delay = config.getfloat("websocket", "max_reconnect_delay", fallback=60)
+    ping_interval       = config.getfloat("websocket", "ping_interval", fallback=20)
+    ping_timeout        = config.getfloat("websocket", "ping_timeout", fallback=20)
+    stale_timeout       = config.getfloat("websocket", "stale_timeout", fallback=60)
+
     heikinashi  = config["trading"].getboolean("heikinashi")
+    capacity    = config["trading"].getint("capacity", fallback=1440)
+
+    incremental     = config.getboolean("indicators", "incremental", fallback=True)
+    verify_interval = config.getint("indicators", "verify_interval", fallback=0)
+    kernels         = config.get("indicators", "kernels", fallback="auto")
+
+    cache_enabled   = config.getboolean("cache", "enabled", fallback=False)
+    cache_directory = config.get("cache", "directory", fallback="cache")
+
+    history_enabled     = config.getboolean("history", "enabled", fallback=False)
+    history_directory   = config.get("history", "directory", fallback="history")
+
+    charts_enabled      = config.getboolean("charts", "enabled", fallback=False)
+    charts_directory    = config.get("charts", "directory", fallback="exports")
+    charts_window       = config.getint("charts", "window", fallback=200)
+    charts_interval     = config.getfloat("charts", "interval", fallback=60)
+    charts_volume       = config.getboolean("charts", "volume", fallback=True)
+
+    orders_enabled      = config.getboolean("orders", "enabled", fallback=False)
+    orders_exchange     = config.get("orders", "exchange", fallback="simulated")
+    orders_size         = config.getfloat("orders", "order_size", fallback=100)
+    orders_max_loss     = config.getfloat("orders", "max_loss", fallback=0.2)
+    orders_fee          = config.getfloat("orders", "fee", fallback=0.001)
+    orders_slippage     = config.getfloat("orders", "slippage", fallback=0.0)
+    entry_weight        = config.getfloat("orders", "entry_weight", fallback=5)
+    exit_weight         = config.getfloat("orders", "exit_weight", fallback=-5)
+
+    queue_size      = config.getint("pipeline", "queue_size", fallback=100)
+    queue_policy    = config.get("pipeline", "queue_policy", fallback="block")
+    offload         = config.getboolean("pipeline", "offload", fallback=True)
+    workers         = config.getint("pipeline", "workers", fallback=4)
+    processes       = config.getint("pipeline", "processes", fallback=0)
+
+    # Evaluate the signals on every update of the open kline as well, as provisional results until it closes
+    provisional     = config.getboolean("provisional", "enabled", fallback=False)
+
+    # Record the raw websocket messages, for replays. Never while replaying.
+    recorder_enabled    = config.getboolean("recorder", "enabled", fallback=False) and not args.replay
+    recorder_directory  = config.get("recorder", "directory", fallback="recordings")
+
+    metrics_enabled  = config.getboolean("metrics", "enabled", fallback=False)
+    metrics_port     = config.getint("metrics", "port", fallback=9100)
+    metrics_interval = config.getint("metrics", "log_interval", fallback=60)
+
+    # Load the history of the streams while the websocket is already connecting, instead of before
+    parallel_startup = config.getboolean("startup", "parallel", fallback=True)
 
     loglevel    = config["logging"].getint("loglevel")
 
@@ -29,15 +116,91 @@ except Exception as e:
     print(e)
     sys.exit("Unable to get all required parameters from configuration file")
 
+phases["config"] = time.perf_counter() - started
+
 try:
-    candles     = Candles(token, interval, timeframe, heikinashi, loglevel)
-    indicators  = Indicators(loglevel=loglevel)
-    signals     = Signals(loglevel=loglevel)
-    bookie      = Bookie(signals)
+    # With processes > 0, indicators and signals are evaluated in a pool of worker processes.
+    # The pool and the chart renderer fork their processes, so they are created first.
+    shards      = ShardPool(processes, loglevel, verify_interval, kernels) if processes > 0 else None
+    renderer    = ChartRenderer(charts_directory, charts_window, charts_interval, volume=charts_volume, loglevel=loglevel) if charts_enabled else None
+
+    decoder     = KlineDecoder(decoder, provisional)
+    cache       = KlineCache(cache_directory, loglevel=loglevel) if cache_enabled else None
+    history     = HistoryStore(history_directory, loglevel=loglevel) if history_enabled else None
+    orders      = OrderEngine(EXCHANGES[orders_exchange](orders_fee, orders_slippage), orders_size, orders_max_loss, loglevel) if orders_enabled else None
+    recorder    = Recorder(recorder_directory, loglevel=loglevel) if recorder_enabled else None
     log         = Logger(name="app", loglevel=loglevel)
+
+    # One chart, set of indicators, signals and bookie per stream, keyed by (token, interval)
+    streams     = [pair.strip().split("@") for pair in streams.split(",") if pair.strip()]
+    streams     = [
+        Stream(
+            pair[0].upper(), pair[1], timeframe,
+            heikinashi=heikinashi, loglevel=loglevel, capacity=capacity, cache=cache,
+            incremental=incremental, verify_interval=verify_interval, kernels=kernels,
+            shards=shards, history=history, renderer=renderer, orders=orders,
+            entry_weight=entry_weight, exit_weight=exit_weight, timeframes=resample,
+            load=not parallel_startup and not args.replay, backfill=not args.replay
+        )
+        for pair in streams
+    ]
+    streams     = {stream.key: stream for stream in streams}
 except:
     sys.exit("Could not instantiate all classes")
 
+phases["components"] = time.perf_counter() - started
+
+
+#
+# Startup
+#
+
+# Records the end of a startup phase, once. Phases are logged, and exported as gauges.
+def startup_phase(name, elapsed=None):
+
+    if name in phases and elapsed is None:
+        return
+
+    phases[name] = elapsed if elapsed is not None else time.perf_counter() - started
+
+    metrics.gauge("trader_startup_seconds", lambda: phases[name], phase=name)
+    log.info("Startup: {} after {:.2f}s", name, phases[name])
+
+# Loads the history of a stream on a thread, retrying with the reconnect delays until it succeeds
+async def load_history(stream):
+
+    delay = reconnect_delay
+
+    while True:
+
+        try:
+            await asyncio.to_thread(stream.load_history)
+            break
+
+        except Exception as e:
+            log.error("Unable to load the history of {} {}, retrying in {:.0f}s: {}", stream.token, stream.interval, delay, e)
+
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_reconnect_delay)
+
+    startup_phase("history {}@{}".format(*stream.key))
+
+    if all(stream.ready for stream in streams.values()):
+        startup_phase("history")
+
+    if stream.evaluations > 0:
+        startup_phase("first signal")
+
+def candle_updated(candle):
+
+    stream = streams.get((candle["s"], candle["i"]))
+
+    if stream is not None:
+        stream.candle_updated(candle)
+
+for name, elapsed in list(phases.items()):
+    startup_phase(name, elapsed)
+
 
 #
 # Websocket
@@ -45,77 +208,200 @@ except:
 
 def open_socket():
 
-    log.info("Connecting to Binance")
-    socket_url = "wss://stream.binance.com:9443/ws/{}@kline_{}".format(token.lower(), interval)
-    
-    ws = websocket.WebSocketApp(socket_url, on_open=websocket_opened, on_close=websocket_closed, on_message=websocket_message)
-    ws.run_forever()
+    log.info("Connecting to Binance ({} streams)", len(streams))
+    socket_url = "{}/stream?streams={}".format(endpoint, "/".join(stream.name for stream in streams.values()))
+
+    asyncio.run(run(socket_url))
+
+# Runs the websocket reader and the processing stage of the pipeline on one event loop. The connection
+# is reopened whenever it drops, and candles that were missed in between are filled in by the streams.
+async def run(socket_url):
+
+    connection = Connection(
+        socket_url, websocket_message, websocket_opened, websocket_closed,
+        reconnect_delay=reconnect_delay, max_reconnect_delay=max_reconnect_delay,
+        ping_interval=ping_interval, ping_timeout=ping_timeout, stale_timeout=stale_timeout,
+        loglevel=loglevel
+    )
+
+    # With parallel startup, the histories load on threads while the websocket connects. Candles that close
+    # in the meantime are queued as usual, and held back by their stream until its history is there.
+    loading    = [asyncio.create_task(load_history(stream)) for stream in streams.values() if not stream.ready]
+
+    async def read():
+
+        try:
+            await connection.run()
+
+        finally:
+            await connection.stop()
+
+            for task in loading:
+                task.cancel()
+
+    await process(read())
+
+# Runs <feed> (the websocket reader, or a replay) alongside the processing stage of the pipeline and the order engine.
+# Once it ends, the candles that are already queued are finished before returning, and then the orders they decided on.
+async def process(feed):
+
+    processing = asyncio.create_task(pipeline.run())
+    ordering   = asyncio.create_task(orders.run()) if orders is not None else None
+
+    try:
+        await feed
+
+    finally:
+        await pipeline.stop()
+        await processing
+
+        if ordering is not None:
+            await orders.stop()
+            await ordering
 
 def websocket_opened(ws):
     log.info("Connected!")
+    startup_phase("connected")
 
 def websocket_closed(ws, close_status_code, close_message):
     log.info("Websocket connection closed!")
-    log.debug('close_status_code: {} close_message: {}'.format(close_status_code, close_message))
+    log.debug('close_status_code: {} close_message: {}', close_status_code, close_message)
+
+async def websocket_message(ws, message):
 
-def websocket_message(ws, message):
+    if recorder is not None:
+        recorder.record(message)
 
-    data = json.loads(message)
+    # Updates of open klines are skipped without being parsed, unless they are evaluated provisionally
+    with parse_timing.time():
+        candle = decoder.decode(message)
 
-    candle = data["k"]
-    
     # When candle is closed
-    if candle["x"]:
+    if candle is not None and candle["x"]:
+
+        # Queue the candle for the processing of the chart, indicators, and signaling. Candles of a
+        # stream are processed one at a time, in order, so they never race each other on its state.
+        await pipeline.put(candle)
+
+    # Updates of the open kline are only decoded in provisional mode. Only the latest one per stream is kept.
+    elif candle is not None:
+        pipeline.update(candle)
+
 
-        # Create a new thread to handle the processing of the chart, indicators, and signaling
-        t = threading.Thread(target=candle_closed, kwargs=candle)
-        t.start()
+def candle_closed(candle):
 
+    stream = streams.get((candle["s"], candle["i"]))
 
-def candle_closed(**candle):
+    if stream is None:
+        log.warning("Received a candle for {} {}, which is not a configured stream", candle["s"], candle["i"])
+        return
 
-    candle_opentime     = candle["t"]
-    candle_open         = float(candle["o"])
-    candle_close        = float(candle["c"])
-    candle_high         = float(candle["h"])
-    candle_low          = float(candle["l"])
-    candle_volume       = float(candle["n"])
-    candle_closetime    = candle["T"]
+    stream.candle_closed(candle)
+
+    if stream.evaluations > 0:
+        startup_phase("first signal")
+
+
+#
+# Replay
+#
 
-    last_candle = pd.DataFrame([[candle_opentime, candle_open, candle_high, candle_low, candle_close, candle_volume, candle_closetime]], columns=candles.chart_columns)
-    last_candle["closetime"] = pd.to_datetime(last_candle["closetime"], unit='ms')
-    last_candle["opentime"] = pd.to_datetime(last_candle["opentime"], unit='ms')
+# Feeds recordings through websocket_message, as if they came in on the websocket, and prints the throughput and latency
+def replay(paths, speed):
 
-    if last_candle["opentime"].iat[-1] == candles.chart["opentime"].iat[-1]:
-        log.warning("Opening time matches the last entry in the chart. This is expected for the first closing candle received via websocket.")
-        log.warning("Dropping the last row of the chart.")
+    log.info("Replaying {} recordings at {}", len(paths), "full speed" if speed <= 0 else "{:g}x speed".format(speed))
 
-        candles.chart.drop(index=candles.chart.index[-1], axis=0, inplace=True)
-        
-    log.debug("Appending latest candle to the chart")
-    
+    replayer    = Replayer(paths, websocket_message, speed, loglevel)
+    starts      = replayer.starts(streams)
 
-    candles.chart = candles.chart.append(last_candle, ignore_index=True)
+    # The charts end where the recording starts, so the replay is the same every time. Without that history there is no replay.
+    for stream in streams.values():
 
-    indicators.calculate(candles.chart)
+        if stream.ready:
+            continue
 
-    signals.check(candles.chart)
-    print("\n")
+        if stream.key not in starts:
+            log.warning("{} {} is not in the recordings, it gets no candles", stream.token, stream.interval)
+            continue
 
-    log.info("Candle closed at {}. O: {}, H: {}, L: {} V: {}".format(candle_close, candle_open, candle_high, candle_low, candle_volume))
-    log.info("Market is bullish") if signals.market_is_bullish else log.info("Market is bearish")
-    log.info("Total weight of signals: {}".format(signals.signals["Weight"].sum()))
+        klines = replay_history(stream, starts[stream.key])
 
-    print("\n")
-    
-    if signals.signals.count != 0:
-        for index, signal in signals.signals.iterrows():
-            log.info("[{}] {} (weight: {})".format(signal["Action"], signal["Description"], signal["Weight"]))
+        if klines is None:
+            flush()
+            sys.exit("Unable to replay {} {} without its history before the recording".format(stream.token, stream.interval))
 
-    print("\n")
+        stream.load_history(klines)
+
+    began       = time.perf_counter()
+    asyncio.run(process(replayer.run()))
+
+    report      = replayer.report(time.perf_counter() - began)
+
+    report["candles"]               = decoder.decoded
+    report["candles_per_second"]    = decoder.decoded / report["seconds"] if report["seconds"] > 0 else 0.0
+    report["latency"]               = pipeline.summary()
+
+    flush()
+    print(json.dumps(report, indent=4))
+
+# Klines of the kline cache before <start>, the opening time of the first recorded kline of the stream, or None if there
+# are none. The history of the timeframe can't stand in for them, as it ends now instead of where the recording starts.
+def replay_history(stream, start):
+
+    if cache is None:
+        log.error("Replays need the kline cache (see [cache]) for the history before the recording of {} {}", stream.token, stream.interval)
+        return None
+
+    klines = cache.read(stream.token, stream.interval)
+    klines = klines[klines[:, 0] < start][-capacity:]
+
+    if len(klines) == 0:
+        log.error("The kline cache has nothing before the recording of {} {}", stream.token, stream.interval)
+        return None
+
+    return klines
+
+
+# Closed candles are queued by the websocket reader and handed to candle_closed in order per stream,
+# with different streams processed in parallel on the worker pool
+pipeline = Pipeline(candle_closed, queue_size, queue_policy, offload, loglevel, workers, candle_updated, lag=not args.replay)
+
+parse_timing = metrics.histogram("trader_stage_seconds", stage="parse")
+
+metrics.gauge("trader_messages_skipped_total", lambda: decoder.skipped)
+metrics.gauge("trader_messages_updates_total", lambda: decoder.updates)
 
-    print(candles.chart.tail(1))
-    
 if __name__ == "__main__":
 
-    open_socket()
+    # Latency histograms on http://127.0.0.1:<port>/metrics, and as a JSON log line every <log_interval> seconds
+    if metrics_enabled:
+        metrics.serve(metrics_port)
+
+        if metrics_interval > 0:
+            metrics.report(Logger(name="metrics", loglevel=loglevel), metrics_interval)
+
+    try:
+        replay(args.replay, args.speed) if args.replay else open_socket()
+    except KeyboardInterrupt:
+        log.info("Stopped")
+
+    if recorder is not None:
+        recorder.close()
+
+    for stream in streams.values():
+        stream.close()
+
+    if shards is not None:
+        shards.close()
+
+    if history is not None:
+        history.close()
+
+    if renderer is not None:
+        renderer.close()
+
+    if orders is not None:
+        for key, position in orders.summary().items():
+            log.info("Position of {} {}: {}, {} trades, realized {:.4f}", key[0], key[1], position["state"], position["trades"], position["realized"])
+
+    metrics.close()
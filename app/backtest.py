@@ -0,0 +1,74 @@
+import sys, configparser, argparse, json
+import pandas as pd
+
+from components.logger import flush
+from components.klinecache import KlineCache
+from components.history import HistoryStore
+from components.indicators import Indicators
+from components.signals import Signals
+from components.bookmaker import Bookie
+from components.backtest import Backtest, load_klines, create_chart
+
+
+#
+# Backtest of the signals over historical klines. Runs on the kline cache or a local file, without network access.
+#
+# python backtest.py SOLUSDT 1m
+# python backtest.py SOLUSDT 1m --file klines.csv --entry 6 --exit -4 --fee 0.00075
+# python backtest.py SOLUSDT 1m --history --start 2024-01-01 --end 2024-07-01
+#
+
+config = configparser.ConfigParser()
+config.read("config/config.ini")
+
+parser = argparse.ArgumentParser(description="Backtest the signals over historical klines")
+parser.add_argument("token", help="Symbol, like SOLUSDT")
+parser.add_argument("interval", help="Kline interval, like 1m")
+parser.add_argument("--file", help="Klines as .npy or .csv (opentime, open, high, low, close, volume, closetime) instead of the kline cache")
+parser.add_argument("--history", action="store_true", help="Read the klines from the history store instead of the kline cache")
+parser.add_argument("--start", help="First day (YYYY-MM-DD, UTC) read from the history store")
+parser.add_argument("--end", help="Day (YYYY-MM-DD, UTC) at which reading from the history store stops, exclusive")
+parser.add_argument("--entry", type=float, default=5, help="Total signal weight to enter the market")
+parser.add_argument("--exit", type=float, default=-5, help="Total signal weight to exit the market")
+parser.add_argument("--fee", type=float, default=0.001, help="Fee per fill, as a fraction")
+parser.add_argument("--slippage", type=float, default=0.0, help="Slippage per fill, as a fraction")
+
+args = parser.parse_args()
+
+heikinashi  = config.getboolean("trading", "heikinashi", fallback=False)
+loglevel    = config.getint("logging", "loglevel", fallback=2)
+kernels     = config.get("indicators", "kernels", fallback="auto")
+
+
+def historical_klines():
+
+    # The history holds the prices as charted, so with Heikin Ashi enabled they are Heikin Ashi prices already
+    if args.history:
+        start, end = (int(pd.Timestamp(day, tz="UTC").timestamp() * 1000) if day else None for day in (args.start, args.end))
+        return HistoryStore(config.get("history", "directory", fallback="history"), loglevel=loglevel).klines(args.token.upper(), args.interval, start, end)
+
+    if args.file is None:
+        return KlineCache(config.get("cache", "directory", fallback="cache"), loglevel=loglevel).read(args.token.upper(), args.interval)
+
+    return load_klines(args.file)
+
+
+if __name__ == "__main__":
+
+    klines = historical_klines()
+
+    if len(klines) < 2:
+        sys.exit("No klines found for {} {}".format(args.token, args.interval))
+
+    chart = create_chart(klines, heikinashi and not args.history)
+
+    Indicators(loglevel=loglevel, kernels=kernels).calculate(chart)
+
+    signals = Signals(loglevel=loglevel)
+    bookie  = Bookie(signals, args.entry, args.exit, args.fee)
+
+    results = Backtest(signals, bookie, args.slippage, loglevel).run(chart, klines)
+
+    # The results come after the log lines of the run
+    flush()
+    print(json.dumps(results, indent=4))
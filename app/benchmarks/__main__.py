@@ -0,0 +1,97 @@
+import sys, argparse, json, platform, datetime
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.suite import Suite, GROUPS
+
+
+#
+# Benchmarks of the trader on a synthetic market, without network access. Run from the app directory:
+#
+# python -m benchmarks --output benchmarks/results.json
+# python -m benchmarks --only indicators,signals --baseline benchmarks/results.json
+#
+
+parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Benchmark the trader on a synthetic market")
+parser.add_argument("--only", help="Comma separated benchmark groups: {}".format(", ".join(GROUPS)))
+parser.add_argument("--sizes", default="1440,10000,100000", help="Comma separated chart sizes of the microbenchmarks")
+parser.add_argument("--candles", type=int, default=500, help="Candles pushed through the end-to-end runs")
+parser.add_argument("--updates", type=int, default=10, help="Websocket messages per candle in the pipeline run")
+parser.add_argument("--repeat", type=int, default=5, help="Runs per benchmark")
+parser.add_argument("--seed", type=int, default=1, help="Seed of the synthetic market")
+parser.add_argument("--output", help="Write the results to this JSON file")
+parser.add_argument("--baseline", help="Compare against the results in this JSON file")
+parser.add_argument("--threshold", type=float, default=0.1, help="Slowdown against the baseline that counts as a regression")
+parser.add_argument("--fail", action="store_true", help="Exit with status 1 if there are regressions")
+
+args = parser.parse_args()
+
+
+# Compares the median of every benchmark against the baseline. Returns the names of the regressions.
+def compare(results, baseline, threshold):
+
+    regressions = []
+
+    print("\n{:<48} {:>12} {:>12} {:>9}".format("", "ms", "baseline", "change"))
+
+    for name, result in results.items():
+
+        if name not in baseline:
+            continue
+
+        change = result["median"] / baseline[name]["median"] - 1
+        flag   = ""
+
+        if change > threshold:
+            regressions.append(name)
+            flag = "  regression"
+
+        print("{:<48} {:>12.3f} {:>12.3f} {:>+8.1%}{}".format(name, result["median"] * 1000, baseline[name]["median"] * 1000, change, flag))
+
+    return regressions
+
+
+if __name__ == "__main__":
+
+    groups  = [group.strip() for group in args.only.split(",")] if args.only else GROUPS
+    unknown = set(groups) - set(GROUPS)
+
+    if unknown:
+        sys.exit("Unknown benchmark groups: {}".format(", ".join(sorted(unknown))))
+
+    suite   = Suite([int(size) for size in args.sizes.split(",")], args.candles, args.updates, args.repeat, args.seed)
+    results = suite.run(groups)
+
+    report  = {
+        "meta": {
+            "time":     datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python":   platform.python_version(),
+            "numpy":    np.__version__,
+            "pandas":   pd.__version__,
+            "machine":  platform.machine(),
+            "groups":   groups,
+            "sizes":    suite.sizes,
+            "candles":  suite.candles,
+            "updates":  suite.updates,
+            "seed":     args.seed
+        },
+        "results": results
+    }
+
+    if args.output is not None:
+        with open(args.output, "w") as h:
+            json.dump(report, h, indent=4)
+
+    if args.baseline is not None:
+
+        with open(args.baseline) as h:
+            baseline = json.load(h)["results"]
+
+        regressions = compare(results, baseline, args.threshold)
+
+        if regressions:
+            print("\n{} regressions of more than {:.0%}".format(len(regressions), args.threshold))
+
+            if args.fail:
+                sys.exit(1)
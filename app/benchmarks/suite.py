@@ -0,0 +1,236 @@
+import asyncio, contextlib, os, statistics, sys, time
+
+from components.logger import Logger, writer
+from components.candles import Candles
+from components.indicators import Indicators
+from components.signals import Signals
+from components.stream import Stream
+from components.pipeline import Pipeline
+from components.decoder import KlineDecoder, BACKENDS
+from components.kernels import BACKENDS as KERNELS
+from components.backtest import create_chart
+from benchmarks.synthetic import SyntheticMarket, SyntheticCache
+
+
+# Log level of the benchmarked components. Below info, so they don't log anything.
+QUIET = -1
+
+GROUPS = ["create_chart", "indicators", "signals", "logger", "decode", "candle_closed", "pipeline"]
+
+
+class Suite:
+
+    def __init__(self, sizes=(1440, 10000, 100000), candles=500, updates=10, repeat=5, seed=1):
+
+        """ Benchmarks of the trader, on a synthetic market, without network access.
+
+            Microbenchmarks time chart creation, every indicator, the signal checks and logging
+            for charts of every size in <sizes>. End-to-end runs push <candles> closed candles
+            through Stream.candle_closed, and through the websocket decoding and the pipeline,
+            with <updates> messages per candle.
+
+            Every benchmark runs <repeat> times, and the median and minimum time per operation are
+            recorded in <results>, by name.
+        """
+
+        self.sizes      = list(sizes)
+        self.candles    = candles
+        self.updates    = updates
+        self.repeat     = repeat
+        self.market     = SyntheticMarket(seed=seed)
+
+        self.results    = {}
+
+        # Progress goes to the console, also while the output of the benchmarked code is silenced
+        self.output     = sys.stdout
+
+
+    # Times <function>, <number> calls per run. <setup> is called before every run, outside of the timing.
+    # <items> is the number of items processed per call, for a throughput figure.
+    def measure(self, name, function, number=1, setup=None, items=None, repeat=None):
+
+        times = []
+
+        for run in range(repeat or self.repeat):
+
+            if setup is not None:
+                setup()
+
+            started = time.perf_counter()
+
+            for call in range(number):
+                function()
+
+            times.append((time.perf_counter() - started) / number)
+
+        result = {"median": statistics.median(times), "min": min(times), "repeat": len(times), "number": number}
+
+        if items is not None:
+            result["per_second"] = items / result["median"]
+
+        self.results[name] = result
+
+        print("{:<48} {:>12.3f} ms".format(name, result["median"] * 1000) + ("  {:>12.0f}/s".format(result["per_second"]) if items else ""), file=self.output, flush=True)
+
+        return result
+
+    def run(self, groups=GROUPS):
+
+        for group in groups:
+            getattr(self, "benchmark_" + group)()
+
+        return self.results
+
+
+#
+# Microbenchmarks
+#
+
+    def benchmark_create_chart(self):
+
+        for size in self.sizes:
+
+            cache = SyntheticCache(self.market, size)
+
+            for heikinashi in (False, True):
+                candles = Candles("SOLUSDT", "1m", "1 day ago UTC", heikinashi, QUIET, size, cache)
+                self.measure("create_chart/{}/{}".format("heikinashi" if heikinashi else "plain", size), candles.create_chart)
+
+    def benchmark_indicators(self):
+
+        for size in self.sizes:
+
+            chart       = create_chart(self.market.klines(size))
+            indicators  = Indicators(loglevel=QUIET)
+
+            # Fills the inputs of every node, so each of them can be timed on its own
+            indicators.calculate(chart)
+
+            for node in indicators.registry:
+                self.measure("indicators/{}/{}".format(node.outputs[0], size), lambda: node.calculate(chart))
+
+            self.measure("indicators/calculate/{}".format(size), lambda: indicators.calculate(chart))
+
+            # The same recompute with pandas, and with every kernel backend. The first calculation checks the kernels, so it isn't timed.
+            for backend in ["pandas"] + list(KERNELS):
+
+                calculated = Indicators(loglevel=QUIET, kernels=backend)
+                calculated.calculate(chart)
+
+                self.measure("indicators/calculate/{}/{}".format(backend, size), lambda: calculated.calculate(chart))
+
+        # Incremental update of a full chart, per appended candle
+        klines      = self.market.klines(1440 + self.candles)
+        state       = {}
+
+        def setup():
+            state["candles"]    = Candles("SOLUSDT", "1m", "1 day ago UTC", False, QUIET, 1440, SyntheticCache(self.market, 1440))
+            state["indicators"] = Indicators(loglevel=QUIET)
+            state["indicators"].warm_up(state["candles"].buffer)
+
+        def update():
+            for kline in klines[1440:]:
+                state["candles"].add_candle(*kline)
+                state["indicators"].update(state["candles"].buffer)
+
+        self.measure("indicators/update", update, setup=setup, items=self.candles)
+
+    def benchmark_signals(self):
+
+        for size in self.sizes:
+
+            chart   = create_chart(self.market.klines(size))
+            signals = Signals(loglevel=QUIET)
+
+            Indicators(loglevel=QUIET).calculate(chart)
+
+            self.measure("signals/check/{}".format(size), lambda: signals.check(chart), number=100)
+            self.measure("signals/evaluate/{}".format(size), lambda: signals.evaluate(chart))
+
+    def benchmark_logger(self):
+
+        enabled     = Logger(name="benchmark", loglevel=3, persist=False)
+        disabled    = Logger(name="benchmark", loglevel=0, persist=False)
+
+        with silenced():
+            self.measure("logger/print_message", lambda: enabled.print_message(3, "Candle {} closed at {}", 1600000000000, 101.25), number=10000)
+            self.measure("logger/disabled", lambda: disabled.debug("Candle {} closed at {}", 1600000000000, 101.25), number=10000)
+
+            # Lets the writer catch up before the output is restored
+            while writer.lines:
+                time.sleep(0.01)
+
+    def benchmark_decode(self):
+
+        messages = self.market.messages(0, 1, 2)
+
+        for backend in BACKENDS:
+
+            decoder = KlineDecoder(backend)
+
+            self.measure("decode/{}/open".format(backend), lambda: decoder.decode(messages[0]), number=10000)
+            self.measure("decode/{}/closed".format(backend), lambda: decoder.decode(messages[1]), number=10000)
+
+
+#
+# End to end
+#
+
+    # Closed candles, as handed to candle_closed, following the 1440 klines of the history
+    def closed_candles(self):
+        return [KlineDecoder().decode(message) for message in self.market.messages(1440, 1440 + self.candles)]
+
+    def stream(self, incremental=True):
+        return Stream("SOLUSDT", "1m", "1 day ago UTC", loglevel=QUIET, capacity=1440, cache=SyntheticCache(self.market, 1440), incremental=incremental)
+
+    def benchmark_candle_closed(self):
+
+        candles = self.closed_candles()
+        state   = {}
+
+        for mode in ("incremental", "full"):
+
+            def setup():
+                state["stream"] = self.stream(mode == "incremental")
+
+            def run():
+                for candle in candles:
+                    state["stream"].candle_closed(candle)
+
+            with silenced():
+                self.measure("candle_closed/{}".format(mode), run, setup=setup, items=len(candles), repeat=min(self.repeat, 3))
+
+    def benchmark_pipeline(self):
+
+        messages    = self.market.messages(1440, 1440 + self.candles, self.updates)
+        state       = {}
+
+        def setup():
+            state["stream"] = self.stream()
+
+        async def feed():
+
+            pipeline    = Pipeline(state["stream"].candle_closed, loglevel=QUIET)
+            processing  = asyncio.create_task(pipeline.run())
+            decoder     = KlineDecoder()
+
+            for message in messages:
+
+                candle = decoder.decode(message)
+
+                if candle is not None:
+                    await pipeline.put(candle)
+
+            await pipeline.stop()
+            await processing
+
+        with silenced():
+            self.measure("pipeline/messages", lambda: asyncio.run(feed()), setup=setup, items=len(messages), repeat=min(self.repeat, 3))
+
+
+# Sends the console output of the benchmarked code (prints, and the log writer) to /dev/null
+@contextlib.contextmanager
+def silenced():
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
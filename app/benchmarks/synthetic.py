@@ -0,0 +1,96 @@
+import json
+import numpy as np
+
+from components.klinecache import interval_to_milliseconds
+
+
+class SyntheticMarket:
+
+    def __init__(self, symbol="SOLUSDT", interval="1m", seed=1, start=1_600_000_000_000, price=100.0, volatility=0.002):
+
+        """ Deterministic random walk market, for benchmarks and offline runs.
+
+            The same seed always gives the same klines, and klines(n) starts with klines(m) for
+            any m < n, so a history and the messages that follow it fit together. Closing prices follow a geometric random
+            walk with <volatility> per bar, every bar opens at the previous close, and highs, lows
+            and volumes are drawn around it.
+
+            klines(n) returns the first <n> klines as an (n, 7) float64 array (opentime, open, high,
+            low, close, volume, closetime), as stored in the chart and the kline cache.
+            messages() returns the websocket messages of klines, in the format of the Binance
+            combined stream.
+        """
+
+        self.symbol     = symbol
+        self.interval   = interval
+        self.seed       = seed
+        self.start      = start
+        self.price      = price
+        self.volatility = volatility
+        self.step       = interval_to_milliseconds(interval)
+
+
+    def klines(self, n):
+
+        # One generator per series, so the first klines are the same whatever the number of klines
+        random  = [np.random.default_rng([self.seed, series]) for series in range(4)]
+
+        close   = self.price * np.exp(np.cumsum(random[0].normal(0, self.volatility, n)))
+        openp   = np.concatenate(([self.price], close[:-1]))
+        spread  = np.abs([random[1].normal(0, self.volatility, n), random[2].normal(0, self.volatility, n)]) * close
+
+        klines  = np.empty((n, 7))
+
+        klines[:, 0] = self.start + np.arange(n) * self.step
+        klines[:, 1] = openp
+        klines[:, 2] = np.maximum(openp, close) + spread[0]
+        klines[:, 3] = np.minimum(openp, close) - spread[1]
+        klines[:, 4] = close
+        klines[:, 5] = random[3].lognormal(6, 1, n)
+        klines[:, 6] = klines[:, 0] + self.step - 1
+
+        return klines
+
+    # The klines as returned by the Binance REST API: lists of ints and numeric strings
+    def rest_klines(self, n):
+        return [[int(k[0]), *("{:.8f}".format(value) for value in k[1:6]), int(k[6]), "0", 0, "0", "0", "0"] for k in self.klines(n)]
+
+    # Websocket messages for the klines <first> to <last>, as compact JSON like Binance sends. Every kline is preceded by
+    # <updates> - 1 updates of the still open kline, as Binance pushes about once a second, and only the last message has "x" set.
+    def messages(self, first, last, updates=1):
+
+        messages = []
+        stream   = "{}@kline_{}".format(self.symbol.lower(), self.interval)
+
+        for k in self.klines(last)[first:]:
+
+            for update in range(updates):
+
+                closed = update == updates - 1
+
+                kline = {
+                    "t": int(k[0]), "T": int(k[6]), "s": self.symbol, "i": self.interval,
+                    "o": "{:.8f}".format(k[1]), "h": "{:.8f}".format(k[2]), "l": "{:.8f}".format(k[3]), "c": "{:.8f}".format(k[4]),
+                    "v": "{:.8f}".format(k[5] if closed else k[5] * (update + 1) / updates), "n": 100, "x": closed
+                }
+
+                messages.append(json.dumps({"stream": stream, "data": {"e": "kline", "E": int(k[0]) + update * 1000, "s": self.symbol, "k": kline}}, separators=(",", ":")))
+
+        return messages
+
+
+class SyntheticCache:
+
+    def __init__(self, market, size):
+
+        """ Stands in for the KlineCache, so charts can be created offline: load() returns the first
+            <size> klines of the market, whatever the window.
+        """
+
+        self.market     = market
+        self.size       = size
+        self.fetcher    = lambda symbol, interval, start: market.rest_klines(size)
+
+
+    def load(self, symbol, interval, start):
+        return self.market.klines(self.size)
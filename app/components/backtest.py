@@ -0,0 +1,173 @@
+import numpy as np
+
+from components.logger import Logger
+from components.chartbuffer import ChartBuffer
+from components.candles import heikin_ashi
+
+
+class Backtest:
+
+    def __init__(self, signals, bookie, slippage=0.0, loglevel=3):
+
+        """ Replays the signals of a historical chart through the entry and exit rules of a Bookie.
+
+            The rules are evaluated for every bar at once by Signals.evaluate(), so a backtest is a
+            handful of array operations instead of a candle by candle replay. Decisions are taken
+            at the close of a bar and filled at the opening price of the next one. Every fill costs
+            the fee of the bookie plus <slippage>, both as a fraction of the price.
+
+            On a Heikin Ashi chart, the signals see the Heikin Ashi prices, but orders fill at the
+            real ones, like they do live. Those come from the klines that the chart was created
+            from, given to run().
+
+            Only long positions are simulated: the bookie is either in the market or not.
+        """
+
+        self.signals    = signals
+        self.bookie     = bookie
+        self.slippage   = slippage
+        self.log        = Logger(name="backtest", loglevel=loglevel)
+
+        # Per bar arrays of the last run
+        self.weights    = None
+        self.position   = None
+        self.equity     = None
+
+        # (entry bar, exit bar, return) of every trade of the last run
+        self.trades     = []
+
+
+    # Runs the backtest over a chart with indicators, and returns a summary of the results. The fills are simulated at the
+    # prices of <klines> (the (n, 7) array the chart was created from), or at the prices of the chart without them.
+    def run(self, chart, klines=None):
+
+        active, values, direction = self.signals.evaluate(chart)
+
+        openprice, closeprice = market_prices(chart, klines)
+
+        self.weights    = self.signals.total_weights(active)
+        self.position   = positions(self.weights, self.bookie.entry_weight, self.bookie.exit_weight)
+
+        cost            = self.bookie.fee + self.slippage
+        held, self.equity = simulate(self.position, openprice, closeprice, cost)
+
+        self.trades     = trades(held, openprice, closeprice, cost)
+
+        summary = self.summary(openprice, closeprice)
+        self.log.info("Backtest of {} bars: {} trades, PnL {:.2%}, max drawdown {:.2%}", summary["bars"], summary["trades"], summary["pnl"], summary["max_drawdown"])
+
+        return summary
+
+    def summary(self, openprice, closeprice):
+
+        returns = np.array([trade[2] for trade in self.trades])
+
+        return {
+            "bars":             len(self.equity),
+            "trades":           len(self.trades),
+            "win_rate":         float(np.mean(returns > 0)) if len(returns) else 0.0,
+            "pnl":              float(self.equity[-1] - 1) if len(self.equity) else 0.0,
+            "max_drawdown":     float(max_drawdown(self.equity)),
+            "exposure":         float(np.mean(self.position)) if len(self.position) else 0.0,
+            "buy_and_hold":     float(closeprice[-1] / openprice[0] - 1) if len(openprice) else 0.0
+        }
+
+
+#
+# Simulation
+#
+
+# The functions below work on a single strategy, with one value per bar, as well as on a batch of
+# strategies, with a (bars, strategies) array and <entry> and <exit> per strategy.
+
+# Reshapes a per bar array, so it broadcasts against an array with <ndim> dimensions
+def per_bar(values, ndim):
+    return values.reshape((-1,) + (1,) * (ndim - 1))
+
+# Position (1 in the market, 0 out) after the close of every bar. Enters when the weight reaches <entry>,
+# exits when it drops to <exit> or below, and otherwise keeps the previous position.
+def positions(weights, entry, exit):
+
+    # Every decision is encoded as 2 * bar + 1 to enter and 2 * bar to exit, and -2 for no decision.
+    # The running maximum carries the last decision forward, and its lowest bit is the position.
+    index       = per_bar(2 * np.arange(len(weights)), weights.ndim)
+    decisions   = np.where(weights >= entry, index + 1, np.where(weights <= exit, index, -2))
+
+    return (np.maximum.accumulate(decisions, axis=0) & 1).astype(np.float64)
+
+# Fills the positions at the opening price of the next bar, and returns the position held during every bar
+# and the equity after every bar, starting from 1. Every change of position costs <cost> of the equity.
+def simulate(position, openprice, closeprice, cost):
+
+    # The position decided at the close of bar i is held from the open of bar i + 1
+    held    = np.concatenate((np.zeros_like(position[:1]), position[:-1]))
+
+    # Returns from the open of each bar to the open of the next one. The last bar is marked at its close.
+    returns = per_bar(np.append(openprice[1:], closeprice[-1:]) / openprice - 1, held.ndim)
+    fills   = np.abs(np.diff(held, axis=0, prepend=np.zeros_like(held[:1])))
+
+    return held, np.cumprod((1 + held * returns) * (1 - cost * fills), axis=0)
+
+# Trades of a per bar <held> position, as (entry bar, exit bar, return after costs).
+# A trade that is still open at the end of the chart is closed at the last closing price.
+def trades(held, openprice, closeprice, cost):
+
+    changes = np.diff(held, prepend=0.0)
+    entries = np.flatnonzero(changes > 0)
+    exits   = np.flatnonzero(changes < 0)
+
+    entry_prices = openprice[entries]
+    exit_prices  = np.append(openprice[exits], closeprice[-1:])[:len(entries)]
+    exits        = np.append(exits, len(held) - 1)[:len(entries)]
+
+    returns = exit_prices / entry_prices * (1 - cost) ** 2 - 1
+
+    return list(zip(entries.tolist(), exits.tolist(), returns.tolist()))
+
+# Number of trades of a per bar <held> position
+def count_trades(held):
+    return np.count_nonzero(np.diff(held, axis=0, prepend=np.zeros_like(held[:1])) > 0, axis=0)
+
+# Largest drop from a peak of the equity curve, as a fraction of the peak
+def max_drawdown(equity):
+
+    if len(equity) == 0:
+        return 0.0
+
+    return np.max(1 - equity / np.maximum.accumulate(equity, axis=0), axis=0)
+
+
+# Real opening and closing prices of the bars of a chart, from the klines it was created from if given
+def market_prices(chart, klines=None):
+
+    if klines is not None:
+        return np.ascontiguousarray(klines[:, 1], dtype=np.float64), np.ascontiguousarray(klines[:, 4], dtype=np.float64)
+
+    return np.asarray(chart["open"], dtype=np.float64), np.asarray(chart["close"], dtype=np.float64)
+
+
+#
+# Historical klines
+#
+
+# Reads klines from a .npy or .csv file, with the columns opentime, open, high, low, close, volume, closetime
+def load_klines(path):
+
+    if path.endswith(".npy"):
+        return np.load(path, mmap_mode="r")
+
+    return np.loadtxt(path, delimiter=",", usecols=range(7), ndmin=2)
+
+# Builds a chart from klines the same way as Candles, so indicators and signals see the same columns as live. With
+# <heikinashi>, the prices of the chart are Heikin Ashi prices, and the klines hold the real ones.
+def create_chart(klines, heikinashi=False):
+
+    columns = {name: klines[:, i] for i, name in enumerate(["opentime", "open", "high", "low", "close", "volume", "closetime"])}
+
+    if heikinashi:
+        columns.update(heikin_ashi(columns["open"], columns["high"], columns["low"], columns["close"]))
+
+    buffer = ChartBuffer(capacity=len(klines))
+    buffer.load(columns)
+
+    return buffer.frame()
@@ -2,16 +2,43 @@
 
 class Bookie:
 
-    def __init__(self, signals):
-        
-        self.signals = signals
+    def __init__(self, signals, entry_weight=5, exit_weight=-5, fee=0.001, orders=None):
+
+        """ Decides when to enter and exit the market from the total weight of the signals.
+
+            A position is opened when the total weight reaches <entry_weight>, and closed when it
+            drops to <exit_weight> or below. <fee> is the exchange fee per fill, as a fraction.
+
+            With <orders> (an OrderEngine), the decisions are placed as orders. The engine knows
+            the position, and ignores the decisions that don't fit it.
+        """
+
+        self.signals        = signals
+
+        self.entry_weight   = entry_weight
+        self.exit_weight    = exit_weight
+        self.fee            = fee
+        self.orders         = orders
+
+
+    # Decision on the total weight of the signals at the close of a candle: "buy", "sell" or None, as in the backtest
+    def evaluate_trading_opportunity(self, weight):
+
+        if weight >= self.entry_weight:
+            return "buy"
+
+        if weight <= self.exit_weight:
+            return "sell"
 
-    
-    def evaluate_trading_opportunity(self):
-        pass
+        return None
 
+    # Places an order for the decision taken at the close of the candle of <symbol> and <interval> that opened at <opentime>.
+    # This only queues the order, it is placed by the OrderEngine on the event loop.
+    def place_order(self, type, symbol=None, interval=None, opentime=None, price=None):
 
-    def place_order(self, type):
+        if self.orders is not None:
+            self.orders.decide(symbol, interval, opentime, type, price)
+            return
 
         if type == "buy":
             print("Placing buy order")
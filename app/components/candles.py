@@ -1,110 +1,272 @@
-import websocket, datetime, json
-from binance.client import Client
-from matplotlib.pyplot import savefig
+import datetime, time
 from components.logger import Logger
+from components.chartbuffer import ChartBuffer
+from components.resampler import Resampler
+from components import renderer
 
 import pandas as pd
 import numpy as np
-import mplfinance as mpf
 
 
 class Candles:
 
-    def __init__(self, token: str, interval="1m", timeframe="6 hours ago UTC", heikinashi=False, loglevel=3):
+    def __init__(self, token: str, interval="1m", timeframe="6 hours ago UTC", heikinashi=False, loglevel=3, capacity=1440, cache=None, buffer=None, load=True, source=None):
 
         self.token              = token
         self.interval           = interval
         self.timeframe          = timeframe
         self.heikinashi         = heikinashi
+        self.capacity           = capacity
 
         self.log                = Logger(name="candles", loglevel=loglevel)
-        self.client             = Client()
+        self.binance            = None
+        self.cache              = cache
         self.last_candle        = pd.Series()
 
         self.chart_columns      = ["opentime", "open", "high", "low", "close", "volume", "closetime"]
-        self.create_chart()
+        self.buffer             = buffer if buffer is not None else ChartBuffer(capacity=capacity)
 
+        # Charts of higher intervals that are resampled from this one, by interval, with their resamplers, and the
+        # klines of them that closed since the last call of closed_timeframes(). A derived chart has its <source>.
+        self.source             = source
+        self.derived            = {}
+        self.rolled             = []
 
-    # Returns market data from Binance, using the instanitated token, interval and timeframe
+        if source is not None:
+            source.derived[interval] = (Resampler(interval, source.interval), self)
+
+        # Whether the last row is a kline that is still forming, written by set_forming()
+        self.forming            = False
+
+        if self.cache is not None and self.cache.fetcher is None:
+            self.cache.fetcher = self.fetch_klines
+
+        # Without <load>, the chart stays empty until create_chart() is called, for example on another thread
+        if load:
+            self.create_chart()
+
+
+    # The Binance client is created on first use, as creating it already connects to Binance.
+    # python-binance is imported here as well, as importing it takes most of a second.
+    @property
+    def client(self):
+
+        if self.binance is None:
+            from binance.client import Client
+            self.binance = Client()
+
+        return self.binance
+
+    def fetch_klines(self, symbol, interval, start, end=None):
+        return self.client.get_historical_klines(symbol, interval, start, end)
+
+    # Returns the klines that opened from <start> to <end> (epoch milliseconds) as an (n, 7) float64 array.
+    # get_historical_klines pages through the range in batches of 1000 klines.
+    def get_klines_between(self, start, end):
+
+        klines = self.fetch_klines(self.token, self.interval, int(start), int(end))
+        return np.array([kline[:7] for kline in klines], dtype=np.float64).reshape(-1, 7)
+
+    # Returns a DataFrame view of the chart. It shares memory with the buffer, and is only valid until the next candle is added.
+    @property
+    def chart(self):
+        return self.buffer.frame()
+
+    # Returns market data from Binance as an (n, 7) float64 array, using the instanitated token, interval and timeframe.
+    # With a kline cache, only the klines after the last cached one are downloaded.
     def get_historical_klines(self):
-        return self.client.get_historical_klines(self.token, self.interval, self.timeframe)
 
-    # Creates a pandas dataframe, representing the chart, or table of "candles".
-    def create_chart(self):
+        if self.cache is not None:
+            from binance.helpers import date_to_milliseconds
+            return self.cache.load(self.token, self.interval, date_to_milliseconds(self.timeframe))
+
+        # Klines come as lists of strings and ints. Converting them in one go is much faster than per value.
+        klines = self.client.get_historical_klines(self.token, self.interval, self.timeframe)
+        return np.array([kline[:7] for kline in klines], dtype=np.float64).reshape(-1, 7)
 
-        klines = self.get_historical_klines()
-        chart = []
+    # Creates the chart, or table of "candles", from the historical klines. The kline that is still forming is left out,
+    # so the first candle from the websocket is appended, instead of replacing the last row.
+    # A derived chart is created by its source, from the same download. With <klines>, the chart is created from those instead.
+    def create_chart(self, klines=None):
+
+        if self.source is None:
+            self.load_klines(klines if klines is not None else self.get_historical_klines())
+
+    # Loads the chart from an (n, 7) array of klines, and the derived charts from the same klines, resampled in one go
+    def load_klines(self, klines):
+
+        klines  = klines[klines[:, 6] < time.time() * 1000]
+        columns = {name: klines[:, i] for i, name in enumerate(self.chart_columns)}
 
         if self.heikinashi:
-            
-            """
+            self.log.info("Heikin Ashi is enabled. Creating Heikin Ashi chart")
+            columns.update(heikin_ashi(columns["open"], columns["high"], columns["low"], columns["close"]))
 
-            Heikin Ashi Formula:
+        # Epochs are kept as milliseconds in the buffer, and exposed as datetime objects by the chart view
+        self.buffer.load(columns)
 
-            High = Maximum of High, Open, or Close (whichever is highest)
-            Low = Minimum of Low, Open, or Close (whichever is lowest)
+        for resampler, candles in self.derived.values():
+            candles.load_klines(resampler.load(klines))
 
-            Open = [Open (previous bar) + Close (previous bar)] /2
-            Close = (Open + High + Low + Close) / 4
+    # Adds a closed candle to the chart. A candle with the same opening time as the last one replaces it.
+    # Returns True if the candle was appended, and False if it replaced the last row.
+    def add_candle(self, opentime, openprice, highprice, lowprice, closeprice, volume, closetime):
 
-            """
+        replace = len(self.buffer) > 0 and self.buffer.last("opentime") == opentime
 
-            self.log.info("Heikin Ashi is enabled. Creating Heikin Ashi chart")
+        # The derived charts are rolled up from the raw prices, also on a Heikin Ashi chart
+        for interval, (resampler, candles) in self.derived.items():
+            self.rolled += [(interval, kline) for kline in resampler.add(opentime, openprice, highprice, lowprice, closeprice, volume)]
+
+        # The previous Heikin Ashi row is one further back if the last row is replaced
+        candle = self.chart_row(opentime, openprice, highprice, lowprice, closeprice, volume, closetime, 2 if replace else 1)
+
+        if replace:
+            self.log.warning("Opening time matches the last entry in the chart.")
+            self.log.warning("Replacing the last row of the chart.")
+
+            self.buffer.replace_last(candle)
+            return False
 
-            for i, data in enumerate(klines):
-
-                opentime    = data[0]
-                openprice   = float(data[1])
-                highprice   = float(data[2])
-                lowprice    = float(data[3])
-                closeprice  = float(data[4])
-                volume      = float(data[5])
-                closetime   = data[6]
-
-                if i == 0:
-
-                    openprice   = (openprice + closeprice) / 2
-                    closeprice  = (openprice + highprice + lowprice + closeprice) / 4
-                
-                else:
-                    
-                    openprice   = (float(klines[i-1][1]) + float(klines[i-1][4])) / 2
-                    highprice   = max([float(data[1]), float(data[2]), float(data[4])])
-                    lowprice    = min([float(data[1]), float(data[3]), float(data[4])])
-                    closeprice  = (float(data[1]) + float(data[2]) + float(data[3]) + float(data[4])) / 4
-                
-                upperwick    = highprice - closeprice
-                lowerwick    = openprice - lowprice
-                bodysize     = closeprice - openprice
-
-                chart.append([opentime, openprice, highprice, lowprice, closeprice, volume, closetime, bodysize, upperwick, lowerwick])
-
-            self.chart = pd.DataFrame(chart, columns=self.chart_columns+["bodysize", "upperwick", "lowerwick"])
-            
         else:
+            self.log.debug("Appending latest candle to the chart")
+            self.buffer.append(candle)
+            return True
+
+    # Returns a candle as a row of the chart, with the Heikin Ashi shape derived from the row <offset> back. Without a previous
+    # row, the raw open and close stand in for it, as for the first bar of the history.
+    def chart_row(self, opentime, openprice, highprice, lowprice, closeprice, volume, closetime, offset=1):
+
+        candle = {
+            "opentime":     opentime,
+            "open":         openprice,
+            "high":         highprice,
+            "low":          lowprice,
+            "close":        closeprice,
+            "volume":       volume,
+            "closetime":    closetime
+        }
+
+        if self.heikinashi:
 
-            for data in klines:
-                chart.append([data[0], float(data[1]), float(data[2]), float(data[3]), float(data[4]), float(data[5]), data[6]])
+            if len(self.buffer) >= offset:
+                previous_open, previous_close = self.buffer.last("open", offset), self.buffer.last("close", offset)
+            else:
+                previous_open, previous_close = openprice, closeprice
 
-            self.chart = pd.DataFrame(chart, columns=self.chart_columns)
+            candle.update(heikin_ashi_candle(previous_open, previous_close, openprice, highprice, lowprice, closeprice))
 
-        # Finalize chart by converting epochs to datetime objects.
-        # Set the dataframe index to be "opentime", and drop that from the columns
-        self.chart["closetime"] = pd.to_datetime(self.chart["closetime"], unit='ms')
-        self.chart["opentime"] = pd.to_datetime(self.chart["opentime"], unit='ms')
+        return candle
 
-    # Exports a plotted pandas dataframe to png format. 
-    def draw_chart(self, chart, type="candle", volume=False, style="binance", filename=None):
+    # Writes a kline that is still forming as the last row of the chart, after the closed candles, or over the forming row
+    # of an earlier update. Returns False, and leaves the chart as it is, if the kline is not newer than the last closed candle.
+    def set_forming(self, opentime, openprice, highprice, lowprice, closeprice, volume, closetime):
 
-        chart = chart.set_index(pd.DatetimeIndex(self.chart["opentime"]))
-        chart = chart.drop(["opentime"], axis=1)
+        if opentime <= self.last_closed():
+            return False
+
+        offset = 2 if self.forming else 1
+
+        candle = self.chart_row(opentime, openprice, highprice, lowprice, closeprice, volume, closetime, offset)
+
+        if self.forming:
+            self.buffer.replace_last(candle)
+        else:
+            self.buffer.append(candle)
+            self.forming = True
+
+        return True
+
+    # Opening time of the last closed candle of the chart, or -1 if there is none
+    def last_closed(self):
+
+        offset = 2 if self.forming else 1
+        return self.buffer.last("opentime", offset) if len(self.buffer) >= offset else -1
+
+    # Removes the forming row, so the chart ends with the last closed candle again
+    def drop_forming(self):
+
+        if self.forming:
+            self.buffer.drop_last()
+            self.forming = False
+
+    # Returns the klines of the derived charts that closed since the last call, in order, as closed klines in the format of the
+    # KlineDecoder, to be added by the Streams of the derived charts
+    def closed_timeframes(self):
+
+        rolled, self.rolled = self.rolled, []
+
+        return [
+            {"s": self.token, "i": interval, "t": int(kline[0]), "T": int(kline[6]), "o": kline[1], "h": kline[2], "l": kline[3], "c": kline[4], "v": kline[5], "x": True}
+            for interval, kline in rolled
+        ]
+
+    # Exports the last <window> rows of a chart to png format, in this process. Streams export their charts
+    # through a ChartRenderer instead, which doesn't hold up the candles.
+    def draw_chart(self, chart, type="candle", volume=False, style="binance", filename=None, window=200):
 
         if filename is None:
             filename = "exports/" + str(datetime.datetime.now()) + ".png"
         
-        self.log.debug("Exporting chart: {}".format(filename))
+        self.log.debug("Exporting chart: {}", filename)
+
+        return renderer.draw_chart(chart, filename, type, volume, style, window)
+
+
+#
+# Heikin Ashi
+#
+
+"""
+
+Heikin Ashi Formula:
+
+Close = (Open + High + Low + Close) / 4
+Open = [Open (previous HA bar) + Close (previous HA bar)] / 2, or (Open + Close) / 2 for the first bar
+
+High = Maximum of High, HA Open, or HA Close (whichever is highest)
+Low = Minimum of Low, HA Open, or HA Close (whichever is lowest)
+
+"""
+
+# Number of previous bars that contribute to the Heikin Ashi open. Each bar back halves the weight,
+# so anything further back than this is below float64 precision.
+HEIKIN_ASHI_DEPTH = 64
+
+# Returns the Heikin Ashi open, high, low and close (plus body and wick sizes) for arrays of raw prices
+def heikin_ashi(openprice, highprice, lowprice, closeprice):
+
+    ha_close    = (openprice + highprice + lowprice + closeprice) / 4
+
+    # The open is the recursion open[i] = (open[i-1] + close[i-1]) / 2, which unrolls to
+    # sum(0.5^k * close[i-k]) for k >= 1, with the first open standing in for the closes
+    # before the first bar. That is a convolution with a halving kernel.
+    first_open  = (openprice[0] + closeprice[0]) / 2
+    padded      = np.concatenate([np.full(HEIKIN_ASHI_DEPTH, first_open), ha_close])
+    kernel      = np.concatenate([[0.0], 0.5 ** np.arange(1, HEIKIN_ASHI_DEPTH + 1)])
+    ha_open     = np.convolve(padded, kernel)[HEIKIN_ASHI_DEPTH:HEIKIN_ASHI_DEPTH + len(ha_close)]
+
+    ha_high     = np.maximum(highprice, np.maximum(ha_open, ha_close))
+    ha_low      = np.minimum(lowprice, np.minimum(ha_open, ha_close))
+
+    return candle_shape(ha_open, ha_high, ha_low, ha_close)
+
+# Returns a single Heikin Ashi candle, derived from the previous Heikin Ashi open and close
+def heikin_ashi_candle(previous_open, previous_close, openprice, highprice, lowprice, closeprice):
 
-        return mpf.plot(chart, type=type, volume=volume, style=style, savefig=filename)
+    ha_open     = (previous_open + previous_close) / 2
+    ha_close    = (openprice + highprice + lowprice + closeprice) / 4
 
+    return candle_shape(ha_open, max(highprice, ha_open, ha_close), min(lowprice, ha_open, ha_close), ha_close)
 
+def candle_shape(openprice, highprice, lowprice, closeprice):
 
+    return {
+        "open":         openprice,
+        "high":         highprice,
+        "low":          lowprice,
+        "close":        closeprice,
+        "bodysize":     closeprice - openprice,
+        "upperwick":    highprice - np.maximum(openprice, closeprice),
+        "lowerwick":    np.minimum(openprice, closeprice) - lowprice
+    }
@@ -0,0 +1,231 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+
+class ChartBuffer:
+
+    def __init__(self, capacity=1440, columns=("open", "high", "low", "close", "volume"), time_columns=("opentime", "closetime"), memory=None):
+
+        """ Fixed capacity storage for the chart, backed by preallocated NumPy arrays.
+
+            Rows live in arrays that are twice the capacity. Appending writes the next slot and
+            moves the start of the window forward once the capacity is reached. When the end of
+            the arrays is hit, the newest rows are copied back to the front, so every append is
+            O(1) amortized and the valid rows are always one contiguous slice. That slice is what
+            view() and frame() hand out, without copying.
+
+            Epoch columns (opentime, closetime) are stored as int64 milliseconds, everything else
+            (prices, volume and derived columns) as float64. New float columns can be added with
+            add_column(), and are NaN for rows that were appended before they existed.
+
+            With <memory> (a buffer such as SharedMemory.buf), the arrays are placed in that memory
+            instead of being allocated, and the set of columns is fixed. See shared() and attach().
+        """
+
+        self.capacity       = int(capacity)
+        self.size           = 2 * self.capacity
+
+        self.start          = 0
+        self.end            = 0
+
+        self.memory         = memory
+        self.shm            = None
+
+        if memory is None:
+            self.times      = np.zeros((len(time_columns), self.size), dtype=np.int64)
+            self.values     = np.full((len(columns), self.size), np.nan, dtype=np.float64)
+        else:
+            self.times      = np.ndarray((len(time_columns), self.size), dtype=np.int64, buffer=memory)
+            self.values     = np.ndarray((len(columns), self.size), dtype=np.float64, buffer=memory, offset=self.times.nbytes)
+
+        self.time_columns   = list(time_columns)
+        self.value_columns  = list(columns)
+
+        # Chart order: opentime first, closetime after the OHLCV columns, derived columns last
+        self.columns        = self.time_columns[:1] + self.value_columns + self.time_columns[1:]
+
+        self.layout         = {}
+        self.index_columns()
+
+
+    # Bytes needed to hold a buffer with the given columns
+    @staticmethod
+    def nbytes(capacity, columns, time_columns=("opentime", "closetime")):
+        return 2 * int(capacity) * 8 * (len(columns) + len(time_columns))
+
+    # Creates a buffer in a new shared memory block, so other processes can attach() to it
+    @classmethod
+    def shared(cls, capacity, columns, time_columns=("opentime", "closetime")):
+
+        shm         = shared_memory.SharedMemory(create=True, size=cls.nbytes(capacity, columns, time_columns))
+        buffer      = cls(capacity, columns, time_columns, memory=shm.buf)
+        buffer.shm  = shm
+
+        buffer.times[:]  = 0
+        buffer.values[:] = np.nan
+
+        return buffer
+
+    # Attaches to a buffer created with shared() in another process. The window (start, end) is not
+    # shared, and must be set by the caller.
+    @classmethod
+    def attach(cls, name, capacity, columns, time_columns=("opentime", "closetime")):
+
+        shm         = shared_memory.SharedMemory(name=name)
+        buffer      = cls(capacity, columns, time_columns, memory=shm.buf)
+        buffer.shm  = shm
+
+        return buffer
+
+    # Releases the shared memory block. The creating process also removes it with unlink.
+    def close(self, unlink=False):
+
+        if self.shm is None:
+            return
+
+        self.times  = None
+        self.values = None
+        self.layout = {}
+
+        self.shm.close()
+
+        if unlink:
+            self.shm.unlink()
+
+        self.shm = None
+
+
+    def index_columns(self):
+
+        for row, name in enumerate(self.time_columns):
+            self.layout[name] = (self.times, row)
+
+        for row, name in enumerate(self.value_columns):
+            self.layout[name] = (self.values, row)
+
+    def __len__(self):
+        return self.end - self.start
+
+    def __contains__(self, name):
+        return name in self.layout
+
+    # Returns a view of a single column, containing only the valid rows
+    def __getitem__(self, name):
+        array, row = self.layout[name]
+        return array[row, self.start:self.end]
+
+    # Overwrites a whole column. Unknown columns are added as float columns.
+    def __setitem__(self, name, values):
+
+        if name not in self.layout:
+            self.add_column(name)
+
+        array, row = self.layout[name]
+        array[row, self.start:self.end] = values
+
+    def add_column(self, name):
+
+        if name in self.layout:
+            return
+
+        if self.memory is not None:
+            raise ValueError("Cannot add column {}: the columns of a shared chart buffer are fixed".format(name))
+
+        self.values = np.vstack([self.values, np.full((1, self.size), np.nan)])
+        self.value_columns.append(name)
+        self.columns.append(name)
+
+        self.index_columns()
+
+    # Makes room for one more row. Returns the slot index to write to.
+    def next_slot(self):
+
+        if self.end == self.size:
+
+            # Keep the newest capacity-1 rows, so the appended row brings the length up to capacity
+            keep = self.capacity - 1
+
+            self.times[:, :keep]  = self.times[:, self.end-keep:self.end]
+            self.values[:, :keep] = self.values[:, self.end-keep:self.end]
+
+            self.start = 0
+            self.end   = keep
+
+        slot = self.end
+        self.end += 1
+
+        if self.end - self.start > self.capacity:
+            self.start += 1
+
+        return slot
+
+    def write(self, slot, row):
+
+        self.values[:, slot] = np.nan
+
+        for name, value in row.items():
+            array, index = self.layout[name]
+            array[index, slot] = value
+
+    # Appends a row given as {column: value}. Columns that are left out are NaN.
+    def append(self, row):
+        self.write(self.next_slot(), row)
+
+    # Replaces the newest row in place
+    def replace_last(self, row):
+        self.write(self.end - 1, row)
+
+    def drop_last(self):
+        if len(self) > 0:
+            self.end -= 1
+
+    def last(self, name, offset=1):
+        array, row = self.layout[name]
+        return array[row, self.end - offset]
+
+    # Returns a row as {column: value}, in chart order, with the epoch columns as datetimes
+    def row(self, offset=1):
+        return {name: np.datetime64(int(self.last(name, offset)), "ms") if name in self.time_columns else self.last(name, offset) for name in self.columns}
+
+    def set_last(self, name, value):
+
+        if name not in self.layout:
+            self.add_column(name)
+
+        array, row = self.layout[name]
+        array[row, self.end - 1] = value
+
+    # Replaces the content of the buffer. Only the newest rows are kept if there are more than fit.
+    def load(self, columns):
+
+        length = min(len(next(iter(columns.values()))), self.capacity)
+
+        self.start = 0
+        self.end   = length
+        self.values[:] = np.nan
+
+        for name, values in columns.items():
+
+            if name not in self.layout:
+                self.add_column(name)
+
+            values = np.asarray(values)
+            array, row = self.layout[name]
+            array[row, :length] = values[len(values)-length:]
+
+    # Returns a dict of column views, in chart order
+    def view(self):
+        return {name: self[name] for name in self.columns}
+
+    # Returns a DataFrame on top of the buffer, with the epoch columns as datetimes.
+    # The frame shares memory with the buffer, and is only valid until the next append.
+    def frame(self):
+
+        columns = self.view()
+
+        for name in self.time_columns:
+            columns[name] = columns[name].view("datetime64[ms]")
+
+        return pd.DataFrame(columns, copy=False)
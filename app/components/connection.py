@@ -0,0 +1,147 @@
+import asyncio, random
+
+import websockets
+
+from components.logger import Logger
+from components.metrics import metrics
+
+
+class Connection:
+
+    def __init__(self, url, on_message, on_open=None, on_close=None, reconnect_delay=1.0, max_reconnect_delay=60.0, ping_interval=20.0, ping_timeout=20.0, stale_timeout=60.0, loglevel=3):
+
+        """ Websocket connection that stays up until it is stopped.
+
+            Messages are passed to the on_message(ws, message) coroutine, one at a time. Exceptions
+            that it raises are logged, and the connection keeps reading. When the connection closes
+            or fails, or can't be opened, it is opened again after a delay that starts at
+            <reconnect_delay> seconds and doubles with every failed attempt, up to
+            <max_reconnect_delay>. A random part of the delay (up to half) is left out, so many
+            clients don't reconnect in lockstep. The delay is reset once a message comes in.
+
+            The connection is checked in two ways: the client pings the server every <ping_interval>
+            seconds and gives up when there is no pong within <ping_timeout>, and a connection that
+            stays silent for <stale_timeout> seconds is dropped. Kline streams push updates every
+            few seconds, so silence means the stream is stuck, even if pings still work.
+
+            Candles that closed while the connection was down are not replayed by Binance. They are
+            detected and filled in by the streams, when the next candle comes in.
+        """
+
+        self.url                    = url
+        self.on_message             = on_message
+        self.on_open                = on_open
+        self.on_close               = on_close
+
+        self.reconnect_delay        = reconnect_delay
+        self.max_reconnect_delay    = max_reconnect_delay
+        self.ping_interval          = ping_interval
+        self.ping_timeout           = ping_timeout
+        self.stale_timeout          = stale_timeout
+
+        self.log                    = Logger(name="connection", loglevel=loglevel)
+
+        self.ws                     = None
+        self.running                = False
+        self.stopped                = None
+
+        self.connects               = 0
+        self.failures               = 0
+        self.errors                 = 0
+
+        metrics.gauge("trader_websocket_connects_total", lambda: self.connects)
+        metrics.gauge("trader_websocket_failures_total", lambda: self.failures)
+        metrics.gauge("trader_websocket_message_errors_total", lambda: self.errors)
+
+
+    # Connects, and keeps reconnecting, until stop() is called
+    async def run(self):
+
+        self.running = True
+        self.stopped = asyncio.Event()
+
+        delay = self.reconnect_delay
+
+        while self.running:
+
+            ws          = None
+            received    = False
+
+            try:
+                async with websockets.connect(self.url, ping_interval=self.ping_interval, ping_timeout=self.ping_timeout) as ws:
+
+                    self.ws = ws
+                    self.connects += 1
+
+                    if self.on_open is not None:
+                        self.on_open(ws)
+
+                    received = await self.read(ws)
+
+            except (OSError, asyncio.TimeoutError, websockets.WebSocketException) as e:
+                self.failures += 1
+                self.log.warning("Websocket connection failed: {}", lambda: repr(e))
+
+            finally:
+                self.ws = None
+
+            if ws is not None and self.on_close is not None:
+                self.on_close(ws, ws.close_code, ws.close_reason)
+
+            if not self.running:
+                break
+
+            # A connection that delivered messages was healthy, so the next attempt starts with the shortest delay again
+            if received:
+                delay = self.reconnect_delay
+
+            wait = delay * random.uniform(0.5, 1.0)
+            self.log.info("Reconnecting in {:.1f}s", wait)
+
+            try:
+                await asyncio.wait_for(self.stopped.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    # Passes the messages of an open connection to on_message until it closes. Returns True if any message came in.
+    async def read(self, ws):
+
+        received = False
+
+        while self.running:
+
+            try:
+                message = await asyncio.wait_for(ws.recv(), timeout=self.stale_timeout)
+
+            except asyncio.TimeoutError:
+                self.failures += 1
+                self.log.warning("No message for {}s, dropping the connection", self.stale_timeout)
+                break
+
+            except websockets.ConnectionClosed:
+                break
+
+            received = True
+
+            # A message that can't be handled is logged and skipped, it doesn't take the connection down
+            try:
+                await self.on_message(ws, message)
+
+            except Exception as e:
+                self.errors += 1
+                self.log.error("Unable to handle a message: {}", lambda: repr(e))
+
+        return received
+
+    # Closes the connection, and stops reconnecting
+    async def stop(self):
+
+        self.running = False
+
+        if self.stopped is not None:
+            self.stopped.set()
+
+        if self.ws is not None:
+            await self.ws.close()
@@ -0,0 +1,97 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Decoders of the JSON backends, by name. orjson is optional, the standard library is always there.
+BACKENDS = {"json": json.loads}
+
+if orjson is not None:
+    BACKENDS["orjson"] = orjson.loads
+
+# Binance sends compact JSON, so an open kline always contains this, and a closed one never does
+OPEN_KLINE = '"x":false'
+OPEN_KLINE_BYTES = OPEN_KLINE.encode()
+
+
+class KlineDecoder:
+
+    def __init__(self, backend="auto", provisional=False):
+
+        """ Decodes kline messages of the Binance websocket, keeping only closed klines.
+
+            Binance pushes an update of the open kline about once a second, and only the last one
+            of every interval (with "x" set) is used. Those updates are recognized by a substring
+            search on the raw message, and skipped without being parsed. Messages that don't match
+            (closed klines, or JSON with unexpected spacing) are parsed, and checked again.
+
+            decode() returns the closed kline as a dict with the symbol and interval ("s", "i"), the
+            opening and closing times ("t", "T") as ints, and the prices and volume ("o", "h", "l",
+            "c", "v") converted to floats, so they can be written to the chart as they are. All the
+            other fields are dropped. Messages without a kline are skipped as well.
+
+            The backend is "orjson" (if it is installed), "json" (the standard library), or "auto"
+            for the fastest available one.
+
+            With <provisional>, the updates of open klines are decoded as well, in the same format
+            with "x" set to False, for provisional evaluation of the forming candle.
+        """
+
+        if backend == "auto":
+            backend = "orjson" if "orjson" in BACKENDS else "json"
+
+        if backend not in BACKENDS:
+            raise ValueError("Unknown or unavailable JSON backend: {}".format(backend))
+
+        self.backend        = backend
+        self.loads          = BACKENDS[backend]
+        self.provisional    = provisional
+
+        self.decoded        = 0
+        self.skipped        = 0
+        self.updates        = 0
+
+
+    # Returns the closed kline of a message (str or bytes), or None if the kline is still open, unless open klines are decoded as well
+    def decode(self, message):
+
+        if not self.provisional and (OPEN_KLINE if isinstance(message, str) else OPEN_KLINE_BYTES) in message:
+            self.skipped += 1
+            return None
+
+        data = self.loads(message)
+
+        # Messages of the combined stream wrap the kline event as {"stream": <name>, "data": <event>}
+        event = data.get("data", data) if isinstance(data, dict) else None
+        kline = event.get("k") if isinstance(event, dict) else None
+
+        # Other messages, like the reply to a subscription ({"result": null, "id": 1}) or an error, have no kline
+        if not isinstance(kline, dict):
+            self.skipped += 1
+            return None
+
+        closed = bool(kline["x"])
+
+        if closed:
+            self.decoded += 1
+        elif self.provisional:
+            self.updates += 1
+        else:
+            self.skipped += 1
+            return None
+
+        return {
+            "s":    kline["s"],
+            "i":    kline["i"],
+            "t":    int(kline["t"]),
+            "T":    int(kline["T"]),
+            "o":    float(kline["o"]),
+            "h":    float(kline["h"]),
+            "l":    float(kline["l"]),
+            "c":    float(kline["c"]),
+            "v":    float(kline["v"]),
+            "x":    closed
+        }
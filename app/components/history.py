@@ -0,0 +1,363 @@
+import json, os, threading, time
+import numpy as np
+import pandas as pd
+
+from components.logger import Logger
+
+
+DAY = 24 * 60 * 60 * 1000
+
+# File extension of every column type. Integer columns (epochs, codes) are stored as int64, everything else as float64.
+EXTENSIONS = {"i64": np.int64, "f64": np.float64}
+
+# Fill value of a column for rows that were written before the column existed
+FILL = {"i64": 0, "f64": np.nan}
+
+
+class HistoryStore:
+
+    def __init__(self, directory="history", loglevel=3):
+
+        """ Append-only columnar store of closed candles, their indicator columns and signal events.
+
+            Every stream (symbol and interval) has its tables ("candles" and "signals"), and every
+            table is split in one directory per UTC day. A day holds one file per column, with the
+            raw values of its rows one after another, so it can be appended to and memory-mapped
+            as it is:
+
+            history/SOLUSDT-1m/candles/2024-05-16/opentime.i64
+            history/SOLUSDT-1m/candles/2024-05-16/close.f64
+            history/SOLUSDT-1m/candles/2024-05-16/SMA-20-close.f64
+
+            Rows are ordered by "opentime", and rows that are not newer than the last one of their
+            table are skipped, so a table never has to be sorted or rewritten. Columns that show up
+            later (like a new indicator) are padded for the rows before them, so all columns of a
+            day always have the same length.
+
+            chunks() reads a time range lazily, one day at a time, as memory-mapped arrays. Only the
+            days and columns that are asked for are touched, so years of history can be read at the
+            speed of the disk. Signal names are stored once per stream, and signal events refer to
+            them by code.
+
+            A store is shared by the streams, which are processed on a pool of threads, so writing
+            (and the state it keeps) is serialized by a lock.
+        """
+
+        self.directory  = directory
+        self.log        = Logger(name="history", loglevel=loglevel)
+
+        # Open append handles, the row count and columns of the last day of every table, and the last opentime of every table
+        self.handles    = {}
+        self.days       = {}
+        self.last       = {}
+
+        # Signal name codes per stream
+        self.codes      = {}
+
+        # Reentrant, as record_signals() appends, and append() looks up the last opentime
+        self.lock       = threading.RLock()
+
+        os.makedirs(self.directory, exist_ok=True)
+
+
+    def path(self, symbol, interval, *parts):
+        return os.path.join(self.directory, "{}-{}".format(symbol.upper(), interval), *parts)
+
+#
+# Writing
+#
+
+    # Appends rows given as {column: array}. All columns have the same length, and "opentime" (epoch milliseconds) is one of them.
+    # Returns the number of rows that were written.
+    def append(self, symbol, interval, columns, table="candles"):
+
+        with self.lock:
+            return self.append_rows(symbol, interval, columns, table)
+
+    def append_rows(self, symbol, interval, columns, table):
+
+        key         = (symbol.upper(), interval, table)
+        columns     = {name: np.atleast_1d(np.asarray(values)) for name, values in columns.items()}
+        opentime    = columns["opentime"].astype(np.int64)
+
+        # Only rows newer than the last stored one are kept. Candles must be strictly newer, events may share an opentime.
+        last        = self.last_opentime(symbol, interval, table)
+        newer       = opentime > last if table == "candles" else opentime >= last
+
+        if not newer.all():
+            columns  = {name: values[newer] for name, values in columns.items()}
+            opentime = opentime[newer]
+
+        if len(opentime) == 0:
+            return 0
+
+        days = opentime // DAY
+
+        for day in np.unique(days):
+
+            rows = days == day
+            self.write_day(key, int(day), {name: values[rows] for name, values in columns.items()})
+
+        self.last[key] = int(opentime[-1])
+
+        return len(opentime)
+
+    def write_day(self, key, day, columns):
+
+        directory = self.path(key[0], key[1], key[2], time.strftime("%Y-%m-%d", time.gmtime(day * DAY // 1000)))
+
+        if self.days.get(key, (None,))[0] != day:
+            self.open_day(key, day, directory)
+
+        day, rows, existing = self.days[key]
+        length = len(columns["opentime"])
+
+        # Columns of the day that this append doesn't have are filled, new columns are padded for the rows before them
+        for name in set(existing) - set(columns):
+            columns[name] = np.full(length, FILL[existing[name]], dtype=EXTENSIONS[existing[name]])
+
+        for name, values in columns.items():
+
+            extension = existing.get(name) or ("i64" if values.dtype.kind in "iub" or name in ("opentime", "closetime") else "f64")
+
+            if name not in existing:
+                existing[name] = extension
+                self.write_column(os.path.join(directory, "{}.{}".format(name, extension)), np.full(rows, FILL[extension], dtype=EXTENSIONS[extension]))
+
+            self.write_column(os.path.join(directory, "{}.{}".format(name, extension)), values.astype(EXTENSIONS[extension]))
+
+        for path in [path for path in self.handles if path.startswith(directory + os.sep)]:
+            self.handles[path].flush()
+
+        self.days[key] = (day, rows + length, existing)
+
+    def write_column(self, path, values):
+
+        if path not in self.handles:
+            self.handles[path] = open(path, "ab")
+
+        self.handles[path].write(values.tobytes())
+
+    # Switches the appends of a table to another day. The files of the previous day are closed.
+    def open_day(self, key, day, directory):
+
+        previous = self.days.get(key)
+
+        if previous is not None:
+            self.close_directory(os.path.dirname(directory) + os.sep)
+
+        os.makedirs(directory, exist_ok=True)
+
+        existing    = dict(os.path.splitext(name) for name in os.listdir(directory) if name.endswith((".i64", ".f64")))
+        existing    = {name: extension[1:] for name, extension in existing.items()}
+        rows        = self.day_length(directory, existing)
+
+        # Columns that are longer than the shortest one (an append that was cut off) are truncated, so all of them line up again
+        for name, extension in existing.items():
+
+            path = os.path.join(directory, "{}.{}".format(name, extension))
+
+            if os.path.getsize(path) > rows * 8:
+                os.truncate(path, rows * 8)
+
+        self.days[key] = (day, rows, existing)
+
+    def close_directory(self, prefix):
+
+        for path in [path for path in self.handles if path.startswith(prefix)]:
+            self.handles.pop(path).close()
+
+    def close(self):
+
+        with self.lock:
+
+            for handle in self.handles.values():
+                handle.close()
+
+            self.handles = {}
+            self.days    = {}
+
+    # Last opentime of a table, or -1 if it is empty
+    def last_opentime(self, symbol, interval, table="candles"):
+
+        key = (symbol.upper(), interval, table)
+
+        with self.lock:
+
+            if key not in self.last:
+
+                self.last[key] = -1
+
+                for day in reversed(self.list_days(symbol, interval, table)):
+
+                    opentime = self.read_day(symbol, interval, table, day, ["opentime"])["opentime"]
+
+                    if len(opentime) > 0:
+                        self.last[key] = int(opentime[-1])
+                        break
+
+            return self.last[key]
+
+    # Records changes of signals at the candle that opens at <opentime>, as (signal name, active, weight, value)
+    def record_signals(self, symbol, interval, opentime, events):
+
+        if not events:
+            return 0
+
+        names, active, weights, values = zip(*events)
+
+        with self.lock:
+
+            return self.append(symbol, interval, {
+                "opentime": np.full(len(events), opentime, dtype=np.int64),
+                "signal":   np.array([self.code(symbol, interval, name) for name in names], dtype=np.int64),
+                "active":   np.array(active, dtype=np.int64),
+                "weight":   np.array(weights, dtype=np.float64),
+                "value":    np.array(values, dtype=np.float64)
+            }, table="signals")
+
+    # Code of a signal name. New names get the next code, and the names file is replaced atomically.
+    def code(self, symbol, interval, name):
+
+        names = self.signal_names(symbol, interval)
+
+        if name not in names:
+
+            names.append(name)
+
+            path = self.path(symbol, interval, "signals.json")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+            with open(path + ".tmp", "w") as handle:
+                json.dump(names, handle)
+
+            os.replace(path + ".tmp", path)
+
+            self.codes[(symbol.upper(), interval)] = {name: code for code, name in enumerate(names)}
+
+        return self.codes[(symbol.upper(), interval)][name]
+
+    # Signal names of a stream, in the order of their codes
+    def signal_names(self, symbol, interval):
+
+        key = (symbol.upper(), interval)
+
+        with self.lock:
+
+            if key not in self.codes:
+
+                try:
+                    with open(self.path(symbol, interval, "signals.json")) as handle:
+                        names = json.load(handle)
+                except FileNotFoundError:
+                    names = []
+
+                self.codes[key] = {name: code for code, name in enumerate(names)}
+
+            return list(self.codes[key])
+
+#
+# Reading
+#
+
+    # Days of a table, as YYYY-MM-DD, oldest first
+    def list_days(self, symbol, interval, table="candles"):
+
+        directory = self.path(symbol, interval, table)
+
+        if not os.path.isdir(directory):
+            return []
+
+        return sorted(os.listdir(directory))
+
+    def day_length(self, directory, extensions):
+
+        sizes = [os.path.getsize(os.path.join(directory, "{}.{}".format(name, extension))) for name, extension in extensions.items()]
+        return min(sizes) // 8 if sizes else 0
+
+    # Memory-maps the columns of one day. Columns that don't exist are left out.
+    def read_day(self, symbol, interval, table, day, columns=None):
+
+        directory   = self.path(symbol, interval, table, day)
+        extensions  = {name: extension[1:] for name, extension in (os.path.splitext(name) for name in os.listdir(directory)) if extension in (".i64", ".f64")}
+
+        # A column may be longer than the others if an append was cut off, so only the rows that all of them have are valid
+        rows        = self.day_length(directory, extensions)
+        names       = [name for name in (columns or extensions) if name in extensions]
+
+        if columns is not None and "opentime" not in names and "opentime" in extensions:
+            names.insert(0, "opentime")
+
+        if rows == 0:
+            return {name: np.empty(0, dtype=EXTENSIONS[extensions[name]]) for name in names}
+
+        return {name: np.memmap(os.path.join(directory, "{}.{}".format(name, extensions[name])), dtype=EXTENSIONS[extensions[name]], mode="r", shape=(rows,)) for name in names}
+
+    # Yields the rows of a table with an opentime from <start> until before <end> (epoch milliseconds, None for no limit),
+    # one day at a time, as {column: memory-mapped array}. Only the <columns> that are asked for are read (all by default).
+    def chunks(self, symbol, interval, start=None, end=None, columns=None, table="candles"):
+
+        first   = time.strftime("%Y-%m-%d", time.gmtime(start // 1000)) if start is not None else ""
+        last    = time.strftime("%Y-%m-%d", time.gmtime(end // 1000)) if end is not None else "9999"
+
+        for day in self.list_days(symbol, interval, table):
+
+            if not first <= day <= last:
+                continue
+
+            chunk       = self.read_day(symbol, interval, table, day, columns)
+            opentime    = chunk["opentime"]
+
+            lower       = np.searchsorted(opentime, start, side="left") if start is not None else 0
+            upper       = np.searchsorted(opentime, end, side="left") if end is not None else len(opentime)
+
+            if upper > lower:
+                yield {name: values[lower:upper] for name, values in chunk.items()}
+
+    # Reads a time range into one array per column. Unlike chunks(), this copies the rows.
+    def read(self, symbol, interval, start=None, end=None, columns=None, table="candles"):
+
+        chunks = list(self.chunks(symbol, interval, start, end, columns, table))
+
+        if not chunks:
+            return {name: np.empty(0) for name in (columns or ["opentime"])}
+
+        names = [name for name in chunks[-1] if all(name in chunk for chunk in chunks)]
+
+        return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in names}
+
+    # Reads a time range as a DataFrame, with the epoch columns as datetimes, like the chart
+    def frame(self, symbol, interval, start=None, end=None, columns=None):
+
+        columns = self.read(symbol, interval, start, end, columns)
+
+        for name in ("opentime", "closetime"):
+            if name in columns:
+                columns[name] = columns[name].astype(np.int64).view("datetime64[ms]")
+
+        return pd.DataFrame(columns, copy=False)
+
+    # Reads a time range as an (n, 7) float64 array of klines, in the format of the KlineCache
+    def klines(self, symbol, interval, start=None, end=None):
+
+        names   = ["opentime", "open", "high", "low", "close", "volume", "closetime"]
+        columns = self.read(symbol, interval, start, end, names)
+
+        if len(columns["opentime"]) == 0:
+            return np.empty((0, 7))
+
+        return np.column_stack([columns[name].astype(np.float64) for name in names])
+
+    # Reads the signal events of a time range as a list of (opentime, signal name, active, weight, value)
+    def signals(self, symbol, interval, start=None, end=None):
+
+        names   = self.signal_names(symbol, interval)
+        events  = self.read(symbol, interval, start, end, table="signals")
+
+        if "signal" not in events:
+            return []
+
+        return [
+            (int(opentime), names[signal], bool(active), float(weight), float(value))
+            for opentime, signal, active, weight, value in zip(events["opentime"], events["signal"], events["active"], events["weight"], events["value"])
+        ]
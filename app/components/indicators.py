@@ -1,10 +1,23 @@
+import configparser, time
+import numpy as np
+import pandas as pd
 
-import configparser
 from components.logger import Logger
+from components.registry import IndicatorRegistry
+from components.kernels import load_kernels
+from components.metrics import metrics
 
 class Indicators:
 
-    def __init__(self, configfile="indicators.ini", loglevel=3):
+    def __init__(self, configfile="indicators.ini", loglevel=3, verify_interval=0, kernels="auto"):
+
+        """ The indicators of one chart, as configured in config/<configfile>.
+
+            Full recomputes run on the kernels of a backend (see kernels.py): "numba" when it is
+            installed, "numpy", "auto" for the fastest of the two, or "pandas" to keep the pandas
+            calculations. The first chart calculated with the kernels is checked against pandas,
+            and if any column doesn't match, pandas is used from then on.
+        """
 
         self.log        = Logger(name="indicators", loglevel=loglevel)
 
@@ -12,99 +25,187 @@ class Indicators:
         self.config     = configparser.ConfigParser()
         self.configfile = configfile
 
+        self.updates    = 0
+
+        # Kernels for full recomputes, None for pandas. Checked against pandas on their first chart.
+        self.kernels    = load_kernels(kernels)
+        self.checked    = self.kernels is None
+
+        # Buffer that is known to have every indicator column
+        self.ready      = None
+
+        # Compare the incremental columns against a full recompute every <verify_interval> updates (0 = never)
+        self.verify_interval = verify_interval
+
+        self.get_config()
+
+        # Every configured indicator, expanded into calculation nodes in dependency order.
+        # Nodes also hold the running state of the incremental mode.
+        self.registry   = IndicatorRegistry(self.config, self.sources)
+
+        self.log.debug("Indicator columns: {}", lambda: ", ".join(self.registry.outputs()))
+
+        # Time spent per node, for full recomputes and for incremental updates
+        self.timings    = {
+            mode: [metrics.histogram("trader_indicator_seconds", indicator=node.outputs[0], mode=mode) for node in self.registry]
+            for mode in ("calculate", "update")
+        }
+
 
-        
     def get_config(self):
-        self.config.read(f"config/{self.configfile}")
-        
+
+        if not self.config.read(f"config/{self.configfile}"):
+            self.log.warning("Indicator configuration (config/{}) not found. No indicators will be calculated.", self.configfile)
+
 
     def is_valid_source(self, source):
         return source in self.sources
 
 
+    # Full recompute of every indicator over a DataFrame chart. Shared intermediates are calculated once.
     def calculate(self, chart):
 
-        # This should be populated based on config
+        if self.kernels is None:
+            return self.calculate_pandas(chart)
 
-        self.calculate_bollinger_bands(chart)
-        self.calculate_stochastic_rsi(chart)
-        self.calculate_simple_moving_average(chart, 300, "close")
-        self.calculate_simple_moving_average(chart, 200, "close")
-        self.calculate_simple_moving_average(chart, 150, "close")
-        self.calculate_simple_moving_average(chart, 100, "close")
-        self.calculate_simple_moving_average(chart, 50, "close")
-        self.calculate_simple_moving_average(chart, 20, "close")
-        self.calculate_simple_moving_average(chart, 20, "volume")
-        self.calculate_macd(chart)
+        columns = self.compute({source: chart[source].to_numpy(dtype=np.float64) for source in self.sources})
 
-#
-# SMA
-#
+        for column in self.registry.outputs():
+            chart[column] = columns[column]
 
-    def calculate_simple_moving_average(self, chart, period, source):
+    def calculate_pandas(self, chart):
 
-        self.log.debug("Calculating SMA")
+        for node, timing in zip(self.registry, self.timings["calculate"]):
+            with timing.time():
+                node.calculate(chart)
 
-        if self.is_valid_source(source):
-            column_name = "SMA-{}-{}".format(period, source)
-            chart[column_name] = chart[source].rolling(period).mean()
+    # Full recompute with the kernels, over a dict with the source columns as arrays. Returns the dict, with the indicator
+    # columns added. Fused nodes are timed together, on the node that calculates them.
+    def compute(self, sources):
 
-#
-# EMA
-#
+        arrays  = {source: np.ascontiguousarray(values, dtype=np.float64) for source, values in sources.items()}
+        started = time.perf_counter()
 
-    def calculate_exponential_moving_average(self, chart, period, source):
-        
-        self.log.debug("Calculating EMA")
+        for node, timing in zip(self.registry, self.timings["calculate"]):
 
-        if self.is_valid_source(source):
-            column_name = "EMA-{}-{}".format(period, source)                
-            chart[column_name] = chart[source].ewm(span=period, adjust=False).mean()
+            node.compute(arrays, self.kernels)
 
+            finished = time.perf_counter()
+            timing.observe(finished - started)
+            started  = finished
 
-#
-# Bollinger Bands
-#
+        if not self.checked:
+            self.check_kernels(arrays)
 
-    def calculate_bollinger_bands(self, chart):
+        return arrays
 
-        self.log.debug("Calculating Bollinger Bands")
-        
-        # Check if the desired SMA is already calculated
-        self.calculate_simple_moving_average(chart, 20, "close")
+    # Compares the columns calculated with the kernels against pandas. If any of them doesn't match, the kernels are
+    # dropped, and pandas is used from then on. Returns the columns that don't match.
+    def check_kernels(self, arrays, tolerance=1e-6):
 
-        std            = chart["close"].rolling(20).std(ddof=0)
-        chart["BBU"]   = chart["SMA-20-close"] + 2*std
-        chart["BBL"]   = chart["SMA-20-close"] - 2*std
+        self.checked = True
 
- 
-#
-# Stochastic RSI
-#
+        chart = pd.DataFrame({source: arrays[source] for source in self.sources})
+        self.calculate_pandas(chart)
+
+        mismatches = [
+            column for column in self.registry.outputs()
+            if not np.allclose(arrays[column], chart[column].to_numpy(), rtol=tolerance, atol=tolerance, equal_nan=True)
+        ]
+
+        if mismatches:
+            self.log.warning("The {} kernels do not match pandas for {}. Using pandas instead.", self.kernels.name, ", ".join(mismatches))
+
+            self.kernels = None
 
-    def calculate_stochastic_rsi(self, chart, window=14):
+            for column in mismatches:
+                arrays[column] = chart[column].to_numpy()
 
-        self.log.debug("Calculating Stochastic RSI")
+        return mismatches
 
-        high = chart["high"].rolling(window).max()
-        low  = chart["low"].rolling(window).min()
-        
-        chart["stoch_k"] = k_line = (chart["close"] - low)*100 / (high - low)
-        chart["stoch_d"] = d_line = k_line.rolling(3).mean()
 
 #
-# MACD
+# Incremental mode
 #
 
-    def calculate_macd(self, chart):
-        
-        self.log.debug("Calculating MACD")
-        
-        ema12 = chart["close"].ewm(span=12, adjust=False).mean()
-        ema26 = chart["close"].ewm(span=26, adjust=False).mean()
-        
-        chart["MACD"]   = ema12 - ema26
-        chart["MACD-S"] = chart["MACD"].ewm(span=9, adjust=False).mean()
+    # Full recompute over a chart buffer. Used to fill the indicator columns for the history,
+    # before switching to update(). Also resets the incremental state, which is seeded again
+    # from the fresh columns on the next update.
+    def warm_up(self, buffer):
+
+        self.log.debug("Warming up indicators")
+
+        if self.kernels is not None:
+            columns = self.compute({source: buffer[source] for source in self.sources})
+        else:
+            columns = buffer.frame()
+            self.calculate_pandas(columns)
+
+        for column in self.registry.outputs():
+            buffer[column] = columns[column]
+
+        self.registry.reset()
+        self.ready = buffer
+
+    # Calculates the indicators for the newest row of a chart buffer only, in O(1) per indicator.
+    # Must be called once for every appended row.
+    def update(self, buffer):
+
+        if not self.has_columns(buffer):
+            return self.warm_up(buffer)
+
+        started = time.perf_counter()
+
+        # Nodes come in dependency order, and every node sees the new row exactly once
+        for node, timing in zip(self.registry, self.timings["update"]):
+
+            node.update(buffer)
+
+            finished = time.perf_counter()
+            timing.observe(finished - started)
+            started  = finished
+
+        self.updates += 1
+        if self.verify_interval and self.updates % self.verify_interval == 0:
+            self.verify(buffer)
+
+    # Calculates the indicators for the newest row of a chart buffer, a candle that is still forming, from the running state
+    # of the rows before it. The state is left as it is, so the row can be calculated again with every update of the candle,
+    # and update() continues from the same state once it closes. Returns False if the indicators are not warmed up yet.
+    def peek(self, buffer):
+
+        if not self.has_columns(buffer):
+            return False
+
+        for node in self.registry:
+            node.peek(buffer)
+
+        return True
+
+    # Columns are never removed from a buffer, so once a buffer has all of them, it isn't checked again
+    def has_columns(self, buffer):
+
+        if buffer is not self.ready and all(column in buffer for column in self.registry.outputs()):
+            self.ready = buffer
+
+        return buffer is self.ready
+
+    # Compares the incrementally calculated columns against a full recompute. Returns the columns that don't match.
+    # Only the last <rows> rows are compared, as the first rows of a recompute over the buffer are still warming up.
+    def verify(self, buffer, rows=100, tolerance=1e-6):
+
+        chart = buffer.frame().copy()
+        self.calculate(chart)
+
+        mismatches = []
+
+        for column in self.registry.outputs():
 
+            expected = chart[column].to_numpy()[-rows:]
+            actual   = buffer[column][-rows:]
 
+            if not np.allclose(actual, expected, rtol=tolerance, atol=tolerance, equal_nan=True):
+                mismatches.append(column)
+                self.log.warning("Incremental indicator {} does not match the full recompute", column)
 
+        return mismatches
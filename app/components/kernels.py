@@ -0,0 +1,356 @@
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+# Largest power of the inverse decay in a block of an exponential average calculated in closed form, so it stays far from
+# the limits of float64. Slow averages get long blocks, fast ones short blocks.
+SCALE = 1e100
+
+
+class NumpyKernels:
+
+    """ Bulk calculations of the indicators over contiguous float64 arrays, without pandas.
+
+        Every kernel takes the values of one source column and a list of windows (or spans), and
+        returns one array per window, so several indicators over the same column share a pass.
+        The results match pandas: rolling statistics are NaN until the window is full and while
+        it contains a NaN, and exponential averages match ewm(span, adjust=False).mean(), with NaN
+        inputs leaving the average unchanged, like the incremental ExponentialAverage.
+    """
+
+    name = "numpy"
+
+    # Rolling means from one cumulative sum. The values are taken relative to the first finite one, which keeps the sums small.
+    def rolling_means(self, values, windows):
+
+        finite      = values == values
+        complete    = finite.all()
+        reference   = values[np.argmax(finite)] if finite.any() else 0.0
+
+        sums        = np.empty(len(values) + 1)
+        sums[0]     = 0.0
+
+        np.cumsum(values - reference if complete else np.where(finite, values - reference, 0.0), out=sums[1:])
+
+        nans        = None if complete else np.concatenate(([0], np.cumsum(~finite)))
+
+        results = []
+
+        for window in windows:
+
+            out = np.full(len(values), np.nan)
+
+            if len(values) >= window:
+
+                means = out[window - 1:]
+
+                np.subtract(sums[window:], sums[:-window], out=means)
+                means /= window
+                means += reference
+
+                if nans is not None:
+                    means[nans[window:] != nans[:-window]] = np.nan
+
+            results.append(out)
+
+        return results
+
+    # Rolling population standard deviations (ddof=0), as the mean squared distance from the rolling mean. That takes one
+    # pass over the chart per position in the window, but doesn't lose precision like a cumulative sum of squares would.
+    def rolling_stds(self, values, windows):
+
+        results = []
+
+        for window, means in zip(windows, self.rolling_means(values, windows)):
+
+            out = np.full(len(values), np.nan)
+
+            if len(values) >= window:
+
+                means   = means[window - 1:]
+                squares = np.zeros(len(means))
+
+                for offset in range(window):
+                    squares += (values[offset:offset + len(means)] - means) ** 2
+
+                out[window - 1:] = np.sqrt(squares / window)
+
+            results.append(out)
+
+        return results
+
+    def rolling_maxs(self, values, windows):
+        return [self.extremes(values, window, np.maximum) for window in windows]
+
+    def rolling_mins(self, values, windows):
+        return [self.extremes(values, window, np.minimum) for window in windows]
+
+    # Rolling maximum or minimum (with <function> np.maximum or np.minimum), from the extremes of windows of doubling width.
+    # A window is covered by two overlapping windows of the largest power of two that fits. NaNs propagate.
+    def extremes(self, values, window, function):
+
+        out = np.full(len(values), np.nan)
+
+        if len(values) < window:
+            return out
+
+        width   = 1
+        result  = values
+
+        while width * 2 <= window:
+            result  = function(result[:-width], result[width:])
+            width  *= 2
+
+        out[window - 1:] = function(result[:len(values) - window + 1], result[window - width:])
+
+        return out
+
+    def ewms(self, values, spans):
+        return [self.ewm(values, span) for span in spans]
+
+    # Exponential average with alpha = 2 / (span + 1), in blocks. Within a block, y[j] = d^(j+1) * (y[-1] + alpha * sum(x[k] / d^(k+1))),
+    # with d = 1 - alpha, which is a cumulative sum.
+    def ewm(self, values, span):
+
+        alpha   = 2 / (span + 1)
+        decay   = 1 - alpha
+
+        out     = np.full(len(values), np.nan)
+        finite  = values == values
+
+        if not finite.any():
+            return out
+
+        # NaNs leave the average unchanged, so it is calculated over the finite values, and carried forward over the NaNs
+        x       = values if finite.all() else values[finite]
+        y       = out if finite.all() else np.empty(len(x))
+        y[0]    = x[0]
+
+        length  = max(1, min(len(x), int(np.log(SCALE) / -np.log(decay))))
+        powers  = decay ** np.arange(1, length + 1)
+
+        for start in range(1, len(x), length):
+
+            block   = x[start:start + length]
+            scale   = powers[:len(block)]
+
+            y[start:start + length] = scale * (y[start - 1] + alpha * np.cumsum(block / scale))
+
+        if y is not out:
+            first = np.argmax(finite)
+            out[first:] = y[np.cumsum(finite[first:]) - 1]
+
+        return out
+
+
+class NumbaKernels(NumpyKernels):
+
+    """ The kernels as compiled loops, which calculate all windows of a source in a single pass
+        over its values. The loops are compiled by Numba on first use, and cached on disk.
+    """
+
+    name = "numba"
+
+    def __init__(self):
+        self.compiled = {}
+
+    # Returns the compiled loop. Without Numba the loop runs as plain Python, which is far too slow for charts but
+    # calculates the same, so the loops can be tested where Numba is not installed.
+    def loop(self, function):
+
+        if numba is None:
+            return function
+
+        if function not in self.compiled:
+            self.compiled[function] = numba.njit(cache=True, nogil=True)(function)
+
+        return self.compiled[function]
+
+    def run(self, function, values, windows, *args):
+
+        values  = np.ascontiguousarray(values, dtype=np.float64)
+        out     = np.empty((len(windows), len(values)))
+
+        self.loop(function)(values, np.asarray(windows, dtype=np.float64), out, *args)
+
+        return list(out)
+
+    def rolling_means(self, values, windows):
+        return self.run(rolling_means_loop, values, windows)
+
+    def rolling_stds(self, values, windows):
+        return self.run(rolling_stds_loop, values, windows)
+
+    def rolling_maxs(self, values, windows):
+        return self.run(rolling_extremes_loop, values, windows, 1.0)
+
+    def rolling_mins(self, values, windows):
+        return self.run(rolling_extremes_loop, values, windows, -1.0)
+
+    def ewms(self, values, spans):
+        return self.run(ewms_loop, values, spans)
+
+
+# Kernel backends, by name. Numba is optional, NumPy is always there.
+BACKENDS = {"numpy": NumpyKernels}
+
+if numba is not None:
+    BACKENDS["numba"] = NumbaKernels
+
+# Returns the kernels of a backend: "numba" (if it is installed), "numpy", "auto" for the fastest available one,
+# or "pandas" for none, which keeps the pandas calculations
+def load_kernels(backend="auto"):
+
+    if backend == "auto":
+        backend = "numba" if "numba" in BACKENDS else "numpy"
+
+    if backend == "pandas":
+        return None
+
+    if backend not in BACKENDS:
+        raise ValueError("Unknown or unavailable kernel backend: {}".format(backend))
+
+    return BACKENDS[backend]()
+
+
+#
+# Loops
+#
+
+# Plain Python loops over float64 arrays, compiled by Numba. Every loop handles all windows of a source in one pass,
+# and writes one row of <out> per window. Running sums are rebuilt from the window every <window> values, so rounding
+# errors can't accumulate over long charts.
+
+def rolling_means_loop(values, windows, out):
+
+    sums = np.zeros(len(windows))
+    nans = np.zeros(len(windows))
+
+    for i in range(len(values)):
+
+        value = values[i]
+
+        for j in range(len(windows)):
+
+            window = int(windows[j])
+
+            if value == value:
+                sums[j] += value
+            else:
+                nans[j] += 1
+
+            if i >= window:
+                evicted = values[i - window]
+
+                if evicted == evicted:
+                    sums[j] -= evicted
+                else:
+                    nans[j] -= 1
+
+            if (i + 1) % window == 0:
+                sums[j] = 0.0
+
+                for k in range(i + 1 - window, i + 1):
+                    if values[k] == values[k]:
+                        sums[j] += values[k]
+
+            out[j, i] = sums[j] / window if i >= window - 1 and nans[j] == 0 else np.nan
+
+def rolling_stds_loop(values, windows, out):
+
+    sums        = np.zeros(len(windows))
+    squares     = np.zeros(len(windows))
+    nans        = np.zeros(len(windows))
+    reference   = np.zeros(len(windows))
+
+    for i in range(len(values)):
+
+        value = values[i]
+
+        for j in range(len(windows)):
+
+            window = int(windows[j])
+
+            if value == value:
+                sums[j]    += value - reference[j]
+                squares[j] += (value - reference[j]) ** 2
+            else:
+                nans[j] += 1
+
+            if i >= window:
+                evicted = values[i - window]
+
+                if evicted == evicted:
+                    sums[j]    -= evicted - reference[j]
+                    squares[j] -= (evicted - reference[j]) ** 2
+                else:
+                    nans[j] -= 1
+
+            # Sums are rebuilt relative to the newest value, which keeps them close to zero
+            if (i + 1) % window == 0 and value == value:
+
+                reference[j]    = value
+                sums[j]         = 0.0
+                squares[j]      = 0.0
+
+                for k in range(max(0, i + 1 - window), i + 1):
+                    if values[k] == values[k]:
+                        sums[j]    += values[k] - value
+                        squares[j] += (values[k] - value) ** 2
+
+            if i >= window - 1 and nans[j] == 0:
+                out[j, i] = np.sqrt(max((squares[j] - sums[j] * sums[j] / window) / window, 0.0))
+            else:
+                out[j, i] = np.nan
+
+# Rolling maximum (sign 1) or minimum (sign -1), with a monotonic queue of positions per window
+def rolling_extremes_loop(values, windows, out, sign):
+
+    for j in range(len(windows)):
+
+        window  = int(windows[j])
+        queue   = np.empty(len(values), dtype=np.int64)
+        head    = 0
+        tail    = 0
+        nans    = 0
+
+        for i in range(len(values)):
+
+            value = values[i]
+
+            if value == value:
+                while tail > head and sign * values[queue[tail - 1]] <= sign * value:
+                    tail -= 1
+
+                queue[tail] = i
+                tail += 1
+            else:
+                nans += 1
+
+            if i >= window and values[i - window] != values[i - window]:
+                nans -= 1
+
+            while tail > head and queue[head] <= i - window:
+                head += 1
+
+            out[j, i] = values[queue[head]] if i >= window - 1 and nans == 0 and tail > head else np.nan
+
+def ewms_loop(values, spans, out):
+
+    for j in range(len(spans)):
+
+        alpha   = 2 / (spans[j] + 1)
+        average = np.nan
+
+        for i in range(len(values)):
+
+            value = values[i]
+
+            if value == value:
+                average = value if average != average else average + alpha * (value - average)
+
+            out[j, i] = average
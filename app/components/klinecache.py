@@ -0,0 +1,105 @@
+import os, time
+import numpy as np
+
+from components.logger import Logger
+
+
+INTERVAL_UNITS = {
+    "s": 1000,
+    "m": 60 * 1000,
+    "h": 60 * 60 * 1000,
+    "d": 24 * 60 * 60 * 1000,
+    "w": 7 * 24 * 60 * 60 * 1000
+}
+
+# Converts a Binance interval (1m, 15m, 4h, 1d, 1w, ..) to milliseconds
+def interval_to_milliseconds(interval):
+    return int(interval[:-1]) * INTERVAL_UNITS[interval[-1]]
+
+
+class KlineCache:
+
+    def __init__(self, directory="cache", fetcher=None, loglevel=3):
+
+        """ Persistent on-disk cache of historical klines, one file per symbol and interval.
+
+            Klines are stored as an (n, 7) float64 array (opentime, open, high, low, close, volume,
+            closetime) in NumPy's .npy format, and read back memory-mapped. load() returns the klines
+            from a start time until now, and only fetches what is missing after the last cached kline,
+            so a warm start costs time proportional to the gap instead of the window. Fetched klines
+            are added to the cached ones, so the cache builds up a history longer than the window.
+
+            The fetcher is any callable fetcher(symbol, interval, start) that returns klines in the
+            format of python-binance's get_historical_klines, with start in epoch milliseconds.
+        """
+
+        self.directory  = directory
+        self.fetcher    = fetcher
+        self.log        = Logger(name="klinecache", loglevel=loglevel)
+
+        os.makedirs(self.directory, exist_ok=True)
+
+
+    def path(self, symbol, interval):
+        return os.path.join(self.directory, "{}-{}.npy".format(symbol.upper(), interval))
+
+    def read(self, symbol, interval):
+
+        path = self.path(symbol, interval)
+
+        if not os.path.exists(path):
+            return np.empty((0, 7))
+
+        try:
+            return np.load(path, mmap_mode="r")
+        except Exception as e:
+            self.log.error("Unable to read kline cache {}, ignoring it", path)
+            self.log.debug(e)
+
+            return np.empty((0, 7))
+
+    # Replaces the cache file atomically, so an interrupted write never leaves a corrupt cache behind
+    def write(self, symbol, interval, klines):
+
+        path = self.path(symbol, interval)
+        temp = path + ".tmp.npy"
+
+        np.save(temp, np.ascontiguousarray(klines))
+        os.replace(temp, path)
+
+    def fetch(self, symbol, interval, start):
+
+        klines = self.fetcher(symbol, interval, int(start))
+        return np.array([kline[:7] for kline in klines], dtype=np.float64).reshape(-1, 7)
+
+    # Returns klines for <symbol> and <interval> with an opening time from <start> (epoch milliseconds) until now. The fetched
+    # klines are added to the cache, which keeps everything it ever stored, also from before <start>.
+    def load(self, symbol, interval, start):
+
+        cached  = self.read(symbol, interval)
+        window  = cached[cached[:, 0] >= start]
+
+        # The cache is only usable if it reaches back to the start of the window
+        if len(window) > 0 and window[0, 0] - start < interval_to_milliseconds(interval):
+            fetch_from = cached[-1, 6] + 1
+        else:
+            window     = window[:0]
+            fetch_from = start
+
+        self.log.debug("Kline cache for {} {} has {} klines of the window, fetching from {}", symbol, interval, len(window), int(fetch_from))
+
+        fetched = self.fetch(symbol, interval, fetch_from)
+        klines  = np.concatenate([cached, fetched])
+
+        # Sorted and unique by opening time, newest version wins
+        klines  = klines[np.argsort(klines[:, 0], kind="stable")]
+        last    = np.append(klines[1:, 0] != klines[:-1, 0], True) if len(klines) else np.empty(0, dtype=bool)
+        klines  = klines[last]
+
+        # Only closed klines are persisted. The one that is still forming is returned, but fetched again next time.
+        closed  = klines[klines[:, 6] < time.time() * 1000]
+
+        if len(fetched) > 0:
+            self.write(symbol, interval, closed)
+
+        return klines[klines[:, 0] >= start]
@@ -1,5 +1,253 @@
-from datetime import timezone
-import datetime, json
+import datetime, json, os, sys, time, threading, atexit
+from collections import deque
+import multiprocessing.util
+
+
+class LogWriter:
+
+    def __init__(self, maxsize=10000, flush_interval=1.0, flush_size=65536):
+
+        """ Writes the output of every Logger on a background thread, so logging a message costs
+            little more than putting it on a queue.
+
+            Lines are taken off the bounded queue in batches. Log files are kept open, and flushed
+            when <flush_size> bytes were written or <flush_interval> seconds passed since the last
+            flush. Console output is flushed at the end of every batch. When the queue is full,
+            lines are dropped and counted instead of blocking the caller.
+
+            The writer is safe to fork: the files are flushed before a fork, and the child starts
+            with an empty queue and its own writer thread.
+        """
+
+        self.maxsize        = maxsize
+        self.flush_interval = flush_interval
+        self.flush_size     = flush_size
+
+        self.reset()
+
+        os.register_at_fork(before=self.before_fork, after_in_parent=self.after_fork_in_parent, after_in_child=self.after_fork_in_child)
+        atexit.register(self.close)
+        multiprocessing.util.register_after_fork(self, LogWriter.after_process_start)
+
+
+    def reset(self):
+
+        # Appending to a deque is atomic, and much cheaper than a queue.Queue. The event wakes up the writer.
+        self.lines          = deque()
+        self.ready          = threading.Event()
+        self.thread         = None
+        self.files          = {}
+
+        # Held while a batch is written, and across a fork
+        self.lock           = threading.Lock()
+        self.start_lock     = threading.Lock()
+
+        self.pending        = 0
+        self.flushed        = time.monotonic()
+
+        self.dropped        = 0
+        self.reported       = 0
+
+    def start(self):
+
+        with self.start_lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="logwriter", daemon=True)
+                self.thread.start()
+
+    # Queues a line for the console (if <console>) and for the file at <path> (if not None)
+    def write(self, path, line, console=True, flush=True):
+
+        if self.thread is None:
+            self.start()
+
+        if len(self.lines) >= self.maxsize:
+            self.dropped += 1
+            return
+
+        self.lines.append((path, line, console, flush))
+
+        if not self.ready.is_set():
+            self.ready.set()
+
+    def run(self):
+
+        running = True
+
+        while running:
+
+            self.ready.wait(self.flush_interval)
+            self.ready.clear()
+
+            # Everything that is queued goes in one batch. It is taken under the lock, so a flush() can't write later lines first.
+            with self.lock:
+
+                batch = []
+
+                while self.lines:
+                    batch.append(self.lines.popleft())
+
+                running = None not in batch
+
+                self.write_batch([item for item in batch if item is not None])
+
+        with self.lock:
+            self.flush_files()
+
+            for handle in self.files.values():
+                handle.close()
+
+            self.files = {}
+
+    def write_batch(self, batch):
+
+        console = []
+        files   = {}
+        flush   = False
+
+        if self.dropped != self.reported:
+            console.append("{} log lines were dropped, the log queue was full".format(self.dropped - self.reported))
+            self.reported = self.dropped
+
+        for path, line, to_console, flush_console in batch:
+
+            if to_console:
+                console.append(line)
+                flush = flush or flush_console
+
+            if path is not None:
+                files.setdefault(path, []).append(line)
+
+        try:
+            for path, lines in files.items():
+
+                if path not in self.files:
+                    self.files[path] = open(path, "a+")
+
+                text = "\n".join(lines) + "\n"
+                self.files[path].write(text)
+                self.pending += len(text)
+
+            if self.pending >= self.flush_size or time.monotonic() - self.flushed >= self.flush_interval:
+                self.flush_files()
+
+        except Exception as e:
+            console.append("Unable to write log file: {}".format(e))
+
+        if console:
+            sys.stdout.write("\n".join(console) + "\n")
+
+            if flush:
+                sys.stdout.flush()
+
+    def flush_files(self):
+
+        for handle in self.files.values():
+            handle.flush()
+
+        self.pending = 0
+        self.flushed = time.monotonic()
+
+    # Writes everything that is queued on the calling thread, and flushes the files and the console, so output that
+    # doesn't go through the writer comes after it
+    def flush(self):
+
+        with self.lock:
+
+            batch = []
+
+            while self.lines:
+                batch.append(self.lines.popleft())
+
+            # A close() that is under way still stops the writer thread
+            if None in batch:
+                self.lines.append(None)
+
+            self.write_batch([item for item in batch if item is not None])
+            self.flush_files()
+
+        sys.stdout.flush()
+
+    # Closes a file, for example after a log rotation. The writer reopens it if more lines come in.
+    def release(self, path):
+
+        with self.lock:
+            handle = self.files.pop(path, None)
+
+            if handle is not None:
+                handle.close()
+
+    # Writes everything that is queued, and stops the writer thread
+    def close(self):
+
+        if self.thread is not None:
+            self.lines.append(None)
+            self.ready.set()
+            self.thread.join(timeout=5)
+            self.thread = None
+
+    def before_fork(self):
+        self.lock.acquire()
+        self.flush_files()
+        sys.stdout.flush()
+
+    def after_fork_in_parent(self):
+        self.lock.release()
+
+    # The writer thread does not exist in the child. Its file objects are dropped without flushing,
+    # so nothing the parent buffered is written twice.
+    def after_fork_in_child(self):
+        self.reset()
+
+    # Worker processes of multiprocessing exit without running atexit handlers, so the queue is written out by their exit hook
+    def after_process_start(self):
+        multiprocessing.util.Finalize(self, self.close, exitpriority=0)
+
+
+# Shared by every Logger of the process
+writer = LogWriter()
+
+# Logger method of every level
+LEVEL_METHODS = {
+    0: "info",
+    1: "warning",
+    2: "error",
+    3: "debug"
+}
+
+# Stands in for the methods of disabled levels
+def discard(message, *args):
+    pass
+
+# Writes out the log lines that are queued so far, before printing to the console directly
+def flush():
+    writer.flush()
+
+# Renders a message from a format string and its arguments. Callables are called first.
+def render(message, args):
+
+    if callable(message):
+        message = message()
+
+    if args:
+        return str(message).format(*(arg() if callable(arg) else arg for arg in args))
+
+    return message
+
+# Formatted timestamps are cached per second, so most log lines don't pay for strftime
+cached_timestamp = (None, None)
+
+def timestamp():
+
+    global cached_timestamp
+
+    second = int(time.time())
+
+    if cached_timestamp[0] != second:
+        cached_timestamp = (second, time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(second)))
+
+    return cached_timestamp[1]
+
 
 class Logger:
 
@@ -9,7 +257,7 @@ class Logger:
             of the logfiles, if persistence is enabled. If rotation_interval (log rotation interval) is set 
             to 0 (default), all output will be written to a single log file. When rotation is enabled, 
             the name of the logfiles will be <date>-<instance name>.log (example: 2020-05-16-logger.log)
-            
+
             The available loglevels are:
             0 = Info
             1 = Warning
@@ -17,16 +265,24 @@ class Logger:
             3 = Debug 
 
             Output will only be displayed according to the initialized loglevel.
+
+            Messages are written by the shared LogWriter on a background thread.
+
+            Messages can be format strings with arguments, which are only rendered if the level is
+            enabled. Arguments (and the message itself) that are callables are called first, so
+            expensive values cost nothing when the level is disabled:
+
+            log.debug("Weight: {}, chart: {}", weight, lambda: chart.tail(1))
         """
 
         self.name       = name
-        self.loglevel   = loglevel
         self.persist    = persist
         self.flush      = flush
         self.format     = format
-        
+
         self.rotation_interval = rotation_interval # (int) days
 
+        self.set_loglevel(loglevel)
         self.initialize()
 
 
@@ -34,6 +290,11 @@ class Logger:
 
         self.date        = datetime.datetime.today().date().isoformat()
         self.logfile     = self.date + "-" + self.name + ".log"
+        self.path        = "./logs/" + self.logfile
+        self.json        = self.format.lower() == "json"
+
+        # Epoch at which the log is rotated next. Checked on every message instead of building dates.
+        self.rotation_due = float("inf")
 
         self.levels = {
             0: "INFO",
@@ -46,64 +307,80 @@ class Logger:
 
             try:
                 self.rotation_interval = int(self.rotation_interval)
-                self.log_needs_rotation()
+                self.set_rotation_due()
 
             except Exception as e:
                 self.error("Log retention interval is invalid.")
                 self.debug(e)
-                
+
                 # Disable log rotation
                 self.rotation_interval = 0
                 self.debug("Log rotation has been disabled due to an error with the configuration.")
 
 
-        self.debug('Logger "{}", Loglevel: {}, Logfile: {}'.format(
-            self.name, self.loglevel, self.logfile
-        ))
+        self.debug('Logger "{}", Loglevel: {}, Logfile: {}', self.name, self.loglevel, self.logfile)
+
+    # The methods of disabled levels are replaced by a no-op on the instance, so a filtered
+    # message costs one function call, without evaluating the level or formatting anything.
+    def set_loglevel(self, loglevel):
+
+        self.loglevel = loglevel
+
+        for level, method in LEVEL_METHODS.items():
+
+            if self.enabled_for(level):
+                self.__dict__.pop(method, None)
+            else:
+                setattr(self, method, discard)
+
+    # Quick check for call sites that prepare more than one message
+    def enabled_for(self, level):
+        return level <= self.loglevel
 
     def timestamp(self):
-        return datetime.datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        return timestamp()
 
     def message_level_string(self, level):
         try:
             return self.levels[level]
         except:
             # Default to "debug" if provided loglevel is invalid
-            self.debug("An invalid loglevel was requested ({}). Defaulting to level 3 (debug)".format(level))
+            self.debug("An invalid loglevel was requested ({}). Defaulting to level 3 (debug)", level)
             return self.levels[3]
 
-    def print_message(self, level, message):
+    def print_message(self, level, message, *args):
 
-        if self.format.lower() == "json":
-            logline = json.dumps({"timestamp": self.timestamp(), "loglevel": self.message_level_string(level), "message": message})
+        message = render(message, args)
+
+        if self.json:
+            logline = json.dumps({"timestamp": timestamp(), "loglevel": self.message_level_string(level), "message": message})
         else:
-            logline = "{} [{}] {}".format(self.timestamp(), self.message_level_string(level), message) 
+            logline = "{} [{}] {}".format(timestamp(), self.message_level_string(level), message)
 
-        if self.persist:
+        if self.persist and time.time() >= self.rotation_due:
             self.log_needs_rotation()
 
-            with open("./logs/" + self.logfile, 'a+') as h:
-                h.write(logline + "\n")
+        writer.write(self.path if self.persist else None, logline, True, self.flush)
 
-        print(logline, flush=self.flush)
+    def info(self, message, *args):
+        self.print_message(0, message, *args)
 
-    def info(self, message):
-        self.print_message(0, message)
+    def warning(self, message, *args):
+        self.print_message(1, message, *args)
 
-    def warning(self, message):
-        self.print_message(1, message) if self.loglevel >= 1 else None
+    def error(self, message, *args):
+        self.print_message(2, message, *args)
 
-    def error(self, message):
-        self.print_message(2, message) if self.loglevel >= 2 else None
+    def debug(self, message, *args):
+        self.print_message(3, message, *args)
 
-    def debug(self, message):
-        self.print_message(3, message) if self.loglevel >= 3 else None
+    # Writes a message to the console as it is, without a timestamp or level, whatever the loglevel. It goes through the
+    # writer like the log lines, so it stays in order with them.
+    def console(self, message, *args):
+        writer.write(None, render(message, args), True, self.flush)
 
     def custom_log(self, logfile, message):
-
-        with open("./logs/" + logfile, 'a') as h:
-            message = str(message)
-            h.write(message + "\n")
+        writer.write("./logs/" + logfile, str(message), console=False)
 
     def log_needs_rotation(self):
 
@@ -111,14 +388,24 @@ class Logger:
 
             # isoformat must be applied after checking timedelta
             current_day = datetime.datetime.today()
-            
-            if (current_day - datetime.timedelta(days=self.rotation_interval)).date().isoformat() == self.date:
+
+            if (current_day - datetime.timedelta(days=self.rotation_interval)).date().isoformat() >= self.date:
+                writer.release(self.path)
+
                 self.date = current_day.date().isoformat()
+                self.set_rotation_due()
                 self.set_logfile_name()
 
                 self.debug("New day, new log! Rotating logs now")
 
+    # The log is due for rotation at midnight, <rotation_interval> days after its date
+    def set_rotation_due(self):
+
+        due = datetime.date.fromisoformat(self.date) + datetime.timedelta(days=self.rotation_interval)
+        self.rotation_due = datetime.datetime.combine(due, datetime.time.min).timestamp()
+
     def set_logfile_name(self):
         self.logfile = "{}-{}".format(self.date, self.name + ".log")
+        self.path    = "./logs/" + self.logfile
 
-        self.debug("Creating new log file ({})".format(self.logfile))
\ No newline at end of file
+        self.debug("Creating new log file ({})", self.logfile)
@@ -0,0 +1,245 @@
+import bisect, json, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Bucket bounds of every histogram, in seconds: from 1 microsecond to about 5 minutes, 4 buckets per doubling.
+# Percentiles are read from these, so they are accurate to about 19%.
+BUCKETS = [1e-6 * 2 ** (i / 4) for i in range(113)]
+
+# Every 4th bound (powers of two) is exported to Prometheus, which keeps the exposition small
+EXPORTED_BUCKETS = range(0, len(BUCKETS), 4)
+
+
+class Histogram:
+
+    __slots__ = ("counts", "count", "sum", "max", "lock")
+
+    def __init__(self):
+
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count  = 0
+        self.sum    = 0.0
+        self.max    = 0.0
+        self.lock   = threading.Lock()
+
+
+    def observe(self, value):
+
+        bucket = bisect.bisect_left(BUCKETS, value)
+
+        with self.lock:
+            self.counts[bucket] += 1
+            self.count  += 1
+            self.sum    += value
+
+            if value > self.max:
+                self.max = value
+
+    # Times a block: with histogram.time(): ...
+    def time(self):
+        return Timer(self)
+
+    # Upper bound of the bucket that holds the <q> quantile, capped at the largest observed value
+    def quantile(self, q):
+
+        if self.count == 0:
+            return 0.0
+
+        rank    = q * self.count
+        total   = 0
+
+        for bucket, count in enumerate(self.counts):
+
+            total += count
+
+            if total >= rank:
+                return min(BUCKETS[bucket], self.max) if bucket < len(BUCKETS) else self.max
+
+        return self.max
+
+    def summary(self):
+        return {"count": self.count, "p50": self.quantile(0.5), "p99": self.quantile(0.99), "max": self.max}
+
+
+class Timer:
+
+    __slots__ = ("histogram", "started")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exception):
+        self.histogram.observe(time.perf_counter() - self.started)
+
+
+class Metrics:
+
+    def __init__(self):
+
+        """ Latency histograms and gauges of the running process.
+
+            Histograms are identified by a metric name and labels, and created on first use.
+            Hot paths should look their histograms up once and keep them, as observing a value
+            is much cheaper than finding the histogram:
+
+            timing = metrics.histogram("trader_stage_seconds", stage="parse")
+
+            with timing.time():
+                ...
+
+            Gauges are callables that are read when the metrics are exported. Everything can be
+            exported in the Prometheus text format by an HTTP endpoint, and written to a log as
+            JSON with the p50, p99 and max of every histogram.
+        """
+
+        self.histograms = {}
+        self.gauges     = {}
+        self.lock       = threading.Lock()
+
+        self.server     = None
+
+
+    def histogram(self, name, **labels):
+
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(key, Histogram())
+
+        return histogram
+
+    def observe(self, name, value, **labels):
+        self.histogram(name, **labels).observe(value)
+
+    # Registers a gauge, or a counter if the name ends with _total, read by calling <function>
+    def gauge(self, name, function, **labels):
+        self.gauges[(name, tuple(sorted(labels.items())))] = function
+
+    # p50, p99 and max of every histogram, and the value of every gauge, keyed by name{labels}
+    def snapshot(self):
+
+        snapshot = {series(name, labels): histogram.summary() for (name, labels), histogram in list(self.histograms.items())}
+        snapshot.update({series(name, labels): read(function) for (name, labels), function in list(self.gauges.items())})
+
+        return snapshot
+
+    # Prometheus text exposition format
+    def render(self):
+
+        lines   = []
+        typed   = set()
+
+        for (name, labels), histogram in sorted(self.histograms.items()):
+
+            if name not in typed:
+                lines.append("# TYPE {} histogram".format(name))
+                typed.add(name)
+
+            with histogram.lock:
+                counts, count, total, maximum = list(histogram.counts), histogram.count, histogram.sum, histogram.max
+
+            cumulative = 0
+            exported   = iter(EXPORTED_BUCKETS)
+            bound      = next(exported)
+
+            for bucket, bucket_count in enumerate(counts[:-1]):
+
+                cumulative += bucket_count
+
+                if bucket == bound:
+                    lines.append("{} {}".format(series(name + "_bucket", labels + (("le", "{:.6g}".format(BUCKETS[bucket])),)), cumulative))
+                    bound = next(exported, None)
+
+            lines.append("{} {}".format(series(name + "_bucket", labels + (("le", "+Inf"),)), count))
+            lines.append("{} {}".format(series(name + "_sum", labels), total))
+            lines.append("{} {}".format(series(name + "_count", labels), count))
+
+        for (name, labels), histogram in sorted(self.histograms.items()):
+
+            if name + "_max" not in typed:
+                lines.append("# TYPE {}_max gauge".format(name))
+                typed.add(name + "_max")
+
+            lines.append("{} {}".format(series(name + "_max", labels), histogram.max))
+
+        for (name, labels), function in sorted(self.gauges.items(), key=lambda item: item[0]):
+
+            if name not in typed:
+                lines.append("# TYPE {} {}".format(name, "counter" if name.endswith("_total") else "gauge"))
+                typed.add(name)
+
+            lines.append("{} {}".format(series(name, labels), read(function)))
+
+        return "\n".join(lines) + "\n"
+
+    # Serves the metrics on http://<host>:<port>/metrics from a background thread
+    def serve(self, port=9100, host="127.0.0.1"):
+
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+
+                body = metrics.render().encode()
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+
+        threading.Thread(target=self.server.serve_forever, name="metrics", daemon=True).start()
+
+    # Writes the snapshot to <log> as one JSON line every <interval> seconds, from a background thread
+    def report(self, log, interval=60):
+
+        def run():
+            while True:
+                time.sleep(interval)
+                log.info("{}", lambda: json.dumps(self.snapshot()))
+
+        threading.Thread(target=run, name="metrics-report", daemon=True).start()
+
+    def close(self):
+
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+# Formats a metric name with its labels: name{label="value",...}
+def series(name, labels):
+
+    if not labels:
+        return name
+
+    return "{}{{{}}}".format(name, ",".join('{}="{}"'.format(label, str(value).replace("\\", "\\\\").replace('"', '\\"')) for label, value in labels))
+
+def read(function):
+
+    try:
+        return function()
+    except Exception:
+        return float("nan")
+
+
+# Shared by every component of the process
+metrics = Metrics()
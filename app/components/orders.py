@@ -0,0 +1,359 @@
+import asyncio, threading, time
+
+from components.logger import Logger
+from components.metrics import metrics
+
+
+# States of a position. Orders move it from flat to long and back, through the pending states while an order is open.
+FLAT        = "flat"
+ENTERING    = "entering"
+LONG        = "long"
+EXITING     = "exiting"
+HALTED      = "halted"
+
+
+class Order:
+
+    __slots__ = ("client_id", "symbol", "interval", "opentime", "side", "type", "quantity", "price", "status", "fill_price", "fee", "decided", "acknowledged", "filled")
+
+    def __init__(self, client_id, symbol, interval, opentime, side, quantity, type="market", price=None, decided=None):
+
+        self.client_id      = client_id
+        self.symbol         = symbol
+        self.interval       = interval
+        self.opentime       = opentime
+        self.side           = side
+        self.type           = type
+        self.quantity       = quantity
+        self.price          = price
+
+        self.status         = "new"
+        self.fill_price     = None
+        self.fee            = 0.0
+
+        # perf_counter() of the decision, of the acknowledgement by the exchange, and of the fill
+        self.decided        = decided
+        self.acknowledged   = None
+        self.filled         = None
+
+
+    def __repr__(self):
+        return "Order({} {} {} {:.8g} {})".format(self.client_id, self.side, self.type, self.quantity, self.status)
+
+
+# Client order id of the decision taken at the close of a candle. Deciding twice on the same candle gives the same id,
+# so the order is only placed once. Binance accepts up to 36 characters of [A-Za-z0-9._:/-].
+def client_order_id(symbol, interval, opentime, side):
+    return "{}{}{}{}".format(side[0], symbol, interval, int(opentime))[:36]
+
+
+class Exchange:
+
+    def __init__(self, fee=0.001):
+
+        """ Interface of the exchanges the OrderEngine places orders on.
+
+            submit() places an order and returns it once the exchange has acknowledged it. An order
+            with the client id of an open order must not be placed again: the open order is returned
+            instead. update() is called with every closed candle of a stream (the
+            streams of a symbol trade separately), and returns the orders that were filled, with
+            their fill price and fee set. Exchanges that report fills on their own can return them
+            there as well.
+        """
+
+        self.fee = fee
+
+
+    async def submit(self, order):
+        raise NotImplementedError
+
+    def update(self, symbol, interval, bar):
+        return []
+
+
+class SimulatedExchange(Exchange):
+
+    def __init__(self, fee=0.001, slippage=0.0):
+
+        """ Matching engine that fills orders against the candles of the chart, for offline runs and tests.
+
+            Orders are matched against the candles of their stream that open after the candle they
+            were decided on, as a decision is taken at its close. Market orders fill at its opening price. Limit orders fill if
+            the candle reaches their price, at the better of their price and the opening price,
+            and stay open otherwise. Fills are <slippage> worse than that price, and cost <fee>,
+            both as a fraction of the price.
+        """
+
+        super().__init__(fee)
+
+        self.slippage   = slippage
+
+        # Open orders by client id, and by stream. Filled orders are forgotten.
+        self.orders     = {}
+        self.open       = {}
+
+
+    async def submit(self, order):
+
+        if order.client_id in self.orders:
+            return self.orders[order.client_id]
+
+        order.status = "open"
+
+        self.orders[order.client_id] = order
+        self.open.setdefault((order.symbol, order.interval), []).append(order)
+
+        return order
+
+    # Matches the open orders of a stream against its closed candle, given as {"opentime", "open", "high", "low", "close"}
+    def update(self, symbol, interval, bar):
+
+        filled  = []
+        waiting = []
+
+        for order in self.open.pop((symbol, interval), []):
+
+            price = self.match(order, bar) if bar["opentime"] > order.opentime else None
+
+            if price is None:
+                waiting.append(order)
+                continue
+
+            direction           = 1 if order.side == "buy" else -1
+
+            order.fill_price    = price * (1 + direction * self.slippage)
+            order.fee           = order.fill_price * order.quantity * self.fee
+            order.status        = "filled"
+            order.filled        = time.perf_counter()
+
+            del self.orders[order.client_id]
+            filled.append(order)
+
+        if waiting:
+            self.open[(symbol, interval)] = waiting
+
+        return filled
+
+    # Price at which an order fills on a candle, or None if it doesn't
+    def match(self, order, bar):
+
+        if order.type == "market":
+            return bar["open"]
+
+        if order.side == "buy" and bar["low"] <= order.price:
+            return min(bar["open"], order.price)
+
+        if order.side == "sell" and bar["high"] >= order.price:
+            return max(bar["open"], order.price)
+
+        return None
+
+
+# Exchange adapters, by the name used in the configuration. Adapters are created with (fee, slippage).
+EXCHANGES = {"simulated": SimulatedExchange}
+
+
+class Position:
+
+    __slots__ = ("state", "quantity", "entry_price", "entry_fee", "realized", "trades", "order")
+
+    def __init__(self):
+
+        self.state          = FLAT
+        self.quantity       = 0.0
+        self.entry_price    = None
+        self.entry_fee      = 0.0
+
+        # Profit and loss of the closed trades, in quote currency, after fees
+        self.realized       = 0.0
+        self.trades         = 0
+
+        # The open order, while entering or exiting
+        self.order          = None
+
+
+class OrderEngine:
+
+    def __init__(self, exchange, order_size=100.0, max_loss=0.2, loglevel=3):
+
+        """ Turns the decisions of the bookies into orders, off the candle processing path.
+
+            Decisions and candles are put on an async queue from any thread, which only schedules
+            them on the event loop, and are handled one at a time, in order, by run(). Every stream
+            (symbol and interval) has its own position, which goes from flat to entering when a buy
+            order is placed, to long when it fills, to exiting when a sell order is placed, and back
+            to flat. Decisions that don't fit the state (buying while long, or while an order is
+            still open) are ignored.
+
+            A buy is sized to <order_size> in the quote currency, and a sell closes the position.
+            When the realized loss of a stream reaches <max_loss> of the order size, its position
+            is halted and takes no new entries.
+
+            Client order ids are derived from the candle that a decision was taken on, so handling
+            the same decision twice (for example when a candle is replaced) never places a second order,
+            and the exchange can recognize an order that is sent again. Only the ids of orders that
+            are open are kept in <placed>. Once an order is filled or rejected, its position has
+            moved on, and a repeated decision doesn't fit its state anymore.
+            The time from the decision to the acknowledgement of the order by the exchange is
+            measured for every order.
+        """
+
+        self.exchange   = exchange
+        self.order_size = order_size
+        self.max_loss   = max_loss
+        self.log        = Logger(name="orders", loglevel=loglevel)
+
+        self.positions  = {}
+
+        # Client ids of the orders that are placed and not filled or rejected yet
+        self.placed     = set()
+
+        # Items that were put before run() started, and the lock that hands them over
+        self.loop       = None
+        self.queue      = None
+        self.waiting    = []
+        self.lock       = threading.Lock()
+
+        self.latency    = {stage: metrics.histogram("trader_order_latency_seconds", stage=stage) for stage in ("queue", "acknowledge")}
+
+
+    def position(self, symbol, interval):
+
+        if (symbol, interval) not in self.positions:
+            self.positions[(symbol, interval)] = Position()
+
+        return self.positions[(symbol, interval)]
+
+    # Puts an item on the queue. Safe to call from any thread, and never blocks.
+    def put(self, item):
+
+        with self.lock:
+            if self.loop is None:
+                self.waiting.append(item)
+                return
+
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, item)
+
+    # Queues a decision to buy or sell <symbol> on <interval>, taken at the close of the candle that opened at <opentime>
+    def decide(self, symbol, interval, opentime, side, price):
+        self.put(("decision", symbol, interval, opentime, side, price, time.perf_counter()))
+
+    # Queues a closed candle ({"opentime", "open", "high", "low", "close"}), which the exchange may fill open orders against
+    def market(self, symbol, interval, bar):
+        self.put(("bar", symbol, interval, bar))
+
+    async def run(self):
+
+        with self.lock:
+
+            self.queue  = asyncio.Queue()
+            self.loop   = asyncio.get_running_loop()
+
+            for item in self.waiting:
+                self.queue.put_nowait(item)
+
+            self.waiting = []
+
+        while True:
+
+            item = await self.queue.get()
+
+            if item is None:
+                break
+
+            try:
+                if item[0] == "bar":
+                    self.fill(self.exchange.update(*item[1:]))
+                else:
+                    await self.place(*item[1:])
+
+            except Exception as e:
+                self.log.error("Order handling failed: {}", e)
+
+    # Handles the queued items, then stops
+    async def stop(self):
+        self.put(None)
+
+    async def place(self, symbol, interval, opentime, side, price, decided):
+
+        self.latency["queue"].observe(time.perf_counter() - decided)
+
+        position    = self.position(symbol, interval)
+        client_id   = client_order_id(symbol, interval, opentime, side)
+
+        if client_id in self.placed:
+            self.log.debug("Order {} was placed already", client_id)
+            return
+
+        if side == "buy" and position.state == FLAT:
+            order = Order(client_id, symbol, interval, opentime, "buy", self.order_size / price, decided=decided)
+            position.state = ENTERING
+
+        elif side == "sell" and position.state == LONG:
+            order = Order(client_id, symbol, interval, opentime, "sell", position.quantity, decided=decided)
+            position.state = EXITING
+
+        else:
+            self.log.debug("Ignoring {} decision on {} {}, position is {}", side, symbol, interval, position.state)
+            return
+
+        self.placed.add(client_id)
+        position.order = order
+
+        try:
+            order = await self.exchange.submit(order)
+
+        except Exception as e:
+            position.state = FLAT if side == "buy" else LONG
+            position.order = None
+
+            self.placed.discard(client_id)
+
+            self.log.error("Order {} was rejected: {}", client_id, e)
+            return
+
+        order.acknowledged = time.perf_counter()
+        self.latency["acknowledge"].observe(order.acknowledged - decided)
+
+        self.log.info("Placed {} order {} for {:.8g} {} ({:.2f} ms after the decision)", side, client_id, order.quantity, symbol, lambda: (order.acknowledged - decided) * 1000)
+
+        # Exchanges may fill market orders right away
+        if order.status == "filled":
+            self.fill([order])
+
+    # Applies filled orders to their positions
+    def fill(self, orders):
+
+        for order in orders:
+
+            position = self.position(order.symbol, order.interval)
+            self.placed.discard(order.client_id)
+
+            self.log.info("Filled {} {} {} order {} at {:.8g}", order.symbol, order.interval, order.side, order.client_id, order.fill_price)
+
+            if order.side == "buy":
+                position.state          = LONG
+                position.quantity       = order.quantity
+                position.entry_price    = order.fill_price
+                position.entry_fee      = order.fee
+
+            else:
+                pnl = (order.fill_price - position.entry_price) * order.quantity - position.entry_fee - order.fee
+
+                position.realized      += pnl
+                position.trades        += 1
+                position.state          = FLAT
+                position.quantity       = 0.0
+                position.entry_price    = None
+
+                self.log.info("Closed {} {} position: {:.4f} ({:.2%}), realized {:.4f}", order.symbol, order.interval, pnl, pnl / self.order_size, position.realized)
+
+                if position.realized <= -self.max_loss * self.order_size:
+                    position.state = HALTED
+                    self.log.warning("Realized loss of {} {} reached the limit, no new positions are opened", order.symbol, order.interval)
+
+            position.order = None
+
+    # State, closed trades and realized profit and loss of every position, by (symbol, interval)
+    def summary(self):
+        return {key: {"state": position.state, "trades": position.trades, "realized": position.realized} for key, position in self.positions.items()}
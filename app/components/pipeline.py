@@ -0,0 +1,268 @@
+import asyncio, time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from components.logger import Logger
+from components.metrics import metrics
+
+
+class CandleQueue:
+
+    def __init__(self, maxsize=100, policy="block"):
+
+        """ Bounded queue between the websocket reader and the processing stage.
+
+            The policy decides what happens when the queue is full:
+
+            block   The reader waits until there is room. Backpressure propagates to the socket.
+            drop    The oldest queued candle is dropped to make room for the new one.
+            merge   A candle with the same key as a queued one replaces it in place. If there is no
+                    such candle, the oldest one is dropped, as with "drop".
+
+            Merging also applies when the queue isn't full, so a burst of updates for the same candle
+            only ever takes one slot.
+        """
+
+        if policy not in ("block", "drop", "merge"):
+            raise ValueError("Unknown queue policy: {}".format(policy))
+
+        self.maxsize    = maxsize
+        self.policy     = policy
+
+        self.items      = deque()
+        self.keys       = {}
+        self.condition  = asyncio.Condition()
+
+        self.dropped    = 0
+        self.merged     = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    async def put(self, item, key=None):
+
+        async with self.condition:
+
+            if self.policy == "merge" and key is not None and key in self.keys:
+                self.keys[key][1] = item
+                self.merged += 1
+                return
+
+            if len(self.items) >= self.maxsize:
+
+                if self.policy == "block":
+                    await self.condition.wait_for(lambda: len(self.items) < self.maxsize)
+                else:
+                    self.pop()
+                    self.dropped += 1
+
+            entry = [key, item]
+            self.items.append(entry)
+
+            if key is not None:
+                self.keys[key] = entry
+
+            self.condition.notify_all()
+
+    # Puts the end marker behind the queued items. It bypasses the size limit and the policy, so it never replaces or drops a queued item.
+    async def close(self):
+
+        async with self.condition:
+            self.items.append([None, None])
+            self.condition.notify_all()
+
+    async def get(self):
+
+        async with self.condition:
+            await self.condition.wait_for(lambda: len(self.items) > 0)
+
+            item = self.pop()
+            self.condition.notify_all()
+
+            return item
+
+    def pop(self):
+
+        key, item = self.items.popleft()
+
+        if key is not None and self.keys.get(key) is not None and self.keys[key][1] is item:
+            del self.keys[key]
+
+        return item
+
+
+class Pipeline:
+
+    def __init__(self, handler, maxsize=100, policy="block", offload=True, loglevel=3, workers=1, update_handler=None, lag=True):
+
+        """ Ordered processing of closed candles on an asyncio event loop.
+
+            Candles are put on a bounded CandleQueue by the websocket reader, and taken off by the
+            processing stage. Candles of the same stream (symbol and interval) are handled one at a
+            time and in the order they arrived, while different streams are processed concurrently
+            on a pool of <workers> threads. With offload disabled, the handler runs on the event loop
+            itself, and everything is processed strictly one candle at a time.
+
+            The latency from the kline close time ("T") to the end of processing is measured for
+            every candle, and so is the processing time: from put() to the end of processing,
+            which leaves out the delay before the candle was received. Without <lag> (for replays,
+            whose close times are in the past), only the processing time is measured.
+
+            Updates of open klines (put with update()) are handed to <update_handler> in the same
+            order as the candles of their stream, but they don't take a place on the queue. Only
+            the latest update of a stream is kept until it is handled, so a stream that falls
+            behind skips to the newest price instead of building up a backlog.
+        """
+
+        self.handler    = handler
+        self.updated    = update_handler
+        self.queue      = CandleQueue(maxsize, policy)
+        self.executor   = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pipeline") if offload else None
+        self.log        = Logger(name="pipeline", loglevel=loglevel)
+
+        # Last processing task of every stream. Each task waits for its predecessor, which keeps every stream in order.
+        self.tails      = {}
+        self.tasks      = set()
+
+        # Latest update of an open kline per stream, waiting to be handled
+        self.updates    = {}
+        self.coalesced  = 0
+
+        # Limits the candles taken off the queue but not yet processed, so a full queue still means backpressure
+        self.in_flight  = asyncio.Semaphore(workers)
+
+        self.lag        = lag
+        self.processed  = 0
+        self.latency    = 0.0
+        self.max_latency = 0.0
+
+        self.running    = False
+
+        # Lag from the kline close time to the end of processing, and time from put() to the end of processing, per stream
+        self.lags       = {}
+        self.durations  = {}
+
+        metrics.gauge("trader_queue_depth", lambda: len(self.queue))
+        metrics.gauge("trader_candles_dropped_total", lambda: self.queue.dropped)
+        metrics.gauge("trader_candles_merged_total", lambda: self.queue.merged)
+        metrics.gauge("trader_candles_processed_total", lambda: self.processed)
+        metrics.gauge("trader_updates_coalesced_total", lambda: self.coalesced)
+
+    # Queues a closed candle (the "k" object of a kline message), with the time it arrived. Candles are keyed by stream and opening time.
+    async def put(self, candle):
+        await self.queue.put((candle, time.perf_counter()), key=(candle.get("s"), candle.get("i"), candle.get("t")))
+
+    # Queues an update of an open kline. If the stream already has one waiting, it is replaced.
+    def update(self, candle):
+
+        key = (candle.get("s"), candle.get("i"))
+
+        if key in self.updates:
+            self.updates[key] = candle
+            self.coalesced += 1
+            return
+
+        self.updates[key] = candle
+
+        task = asyncio.create_task(self.process_update(key, self.tails.get(key)))
+
+        self.tails[key] = task
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def process_update(self, key, previous):
+
+        if previous is not None:
+            await asyncio.wait([previous])
+
+        candle = self.updates.pop(key)
+
+        try:
+            if self.executor is not None:
+                await asyncio.get_running_loop().run_in_executor(self.executor, self.updated, candle)
+            else:
+                self.updated(candle)
+
+        except Exception as e:
+            self.log.error("Processing of the update of candle {} failed: {}", candle.get("t"), e)
+
+    async def run(self):
+
+        self.running = True
+
+        while self.running:
+
+            item = await self.queue.get()
+
+            if item is None:
+                break
+
+            candle, arrived = item
+
+            await self.in_flight.acquire()
+
+            key  = (candle.get("s"), candle.get("i"))
+            task = asyncio.create_task(self.process(candle, arrived, self.tails.get(key)))
+
+            self.tails[key] = task
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+        if self.tasks:
+            await asyncio.wait(self.tasks)
+
+        self.running = False
+
+    async def process(self, candle, arrived, previous):
+
+        try:
+            if previous is not None:
+                await asyncio.wait([previous])
+
+            if self.executor is not None:
+                await asyncio.get_running_loop().run_in_executor(self.executor, self.handler, candle)
+            else:
+                self.handler(candle)
+
+        except Exception as e:
+            self.log.error("Processing of candle {} failed: {}", candle.get("t"), e)
+
+        finally:
+            self.in_flight.release()
+
+        self.record(candle, arrived)
+
+    def record(self, candle, arrived):
+
+        self.processed  += 1
+
+        key = (candle.get("s"), candle.get("i"))
+
+        if key not in self.durations:
+            self.durations[key] = metrics.histogram("trader_candle_processing_seconds", stream="{}@{}".format(*key))
+
+        duration = time.perf_counter() - arrived
+        self.durations[key].observe(duration)
+
+        if self.lag:
+
+            self.latency     = time.time() * 1000 - candle["T"]
+            self.max_latency = max(self.max_latency, self.latency)
+
+            if key not in self.lags:
+                self.lags[key] = metrics.histogram("trader_candle_lag_seconds", stream="{}@{}".format(*key))
+
+            self.lags[key].observe(self.latency / 1000)
+
+        self.log.debug("Candle {} processed {:.1f} ms after it arrived, {} (queued: {}, dropped: {}, merged: {})",
+            candle["t"], duration * 1000, lambda: "{:.1f} ms after close".format(self.latency) if self.lag else "replayed", len(self.queue), self.queue.dropped, self.queue.merged
+        )
+
+    # Processing time of the candles per stream, as {"SOLUSDT@1m": {"count": .., "p50": .., "p99": .., "max": ..}}, in seconds
+    def summary(self):
+        return {"{}@{}".format(*key): histogram.summary() for key, histogram in self.durations.items()}
+
+    # Lets the processing stage finish the queued candles, then stop
+    async def stop(self):
+        await self.queue.close()
+
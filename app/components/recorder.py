@@ -0,0 +1,124 @@
+import datetime, gzip, os, threading, time, zlib
+from collections import deque
+
+from components.logger import Logger
+from components.metrics import metrics
+
+
+class Recorder:
+
+    def __init__(self, directory="recordings", flush_interval=1.0, loglevel=3):
+
+        """ Append-only recording of the raw websocket messages, for replaying them later.
+
+            Every message is stored as one line with the time it was received (epoch milliseconds),
+            a tab, and the message exactly as it came in. The lines go to one gzip file per UTC day
+            of receipt:
+
+            recordings/2024-05-16.tsv.gz
+
+            record() only puts the message on a queue. A background thread writes the queue out
+            every <flush_interval> seconds, as a gzip member of its own that is appended to the
+            file. A file is a valid gzip stream after every write, so a recording that is still
+            going, or that was cut short by a crash, can be read up to its last write.
+        """
+
+        self.directory      = directory
+        self.flush_interval = flush_interval
+        self.log            = Logger(name="recorder", loglevel=loglevel)
+
+        # Appending to a deque is atomic, so record() needs no lock
+        self.messages       = deque()
+        self.stopped        = threading.Event()
+
+        self.recorded       = 0
+        self.written        = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        self.thread         = threading.Thread(target=self.run, name="recorder", daemon=True)
+        self.thread.start()
+
+        metrics.gauge("trader_messages_recorded_total", lambda: self.written)
+
+
+    def path(self, day):
+        return os.path.join(self.directory, "{}.tsv.gz".format(day))
+
+    # Queues a message (str or bytes) with the current time
+    def record(self, message):
+
+        self.messages.append((time.time_ns() // 1000000, message))
+        self.recorded += 1
+
+    def run(self):
+
+        while not self.stopped.wait(self.flush_interval):
+            self.flush()
+
+        self.flush()
+
+    # Writes the queued messages, one gzip member per file
+    def flush(self):
+
+        days = {}
+
+        while self.messages:
+
+            received, message = self.messages.popleft()
+
+            if isinstance(message, bytes):
+                message = message.decode()
+
+            day = datetime.datetime.fromtimestamp(received / 1000, datetime.timezone.utc).strftime("%Y-%m-%d")
+            days.setdefault(day, []).append("{}\t{}\n".format(received, message))
+
+        for day, lines in days.items():
+
+            try:
+                with open(self.path(day), "ab") as file:
+                    file.write(gzip.compress("".join(lines).encode()))
+
+                self.written += len(lines)
+
+            except OSError as e:
+                self.log.error("Unable to write {} messages to the recording of {}: {}", len(lines), day, e)
+
+    # Writes everything that is queued, and stops the writer thread
+    def close(self):
+
+        self.stopped.set()
+        self.thread.join(timeout=10)
+
+        self.log.info("Recorded {} messages", self.written)
+
+
+# Returns the recordings in <directory> in chronological order
+def recordings(directory="recordings"):
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".tsv.gz"))
+
+# Yields (received, message) for every message of a recording, in the order they were received. A member that was cut
+# short at the end of the file, by a crash during a write, ends the recording.
+def read_recording(path):
+
+    with open(path, "rb") as file:
+        data = file.read()
+
+    while data:
+
+        decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+
+        try:
+            text = decompressor.decompress(data)
+        except zlib.error:
+            break
+
+        if not decompressor.eof:
+            break
+
+        for line in text.decode().splitlines():
+
+            received, message = line.split("\t", 1)
+            yield int(received), message
+
+        data = decompressor.unused_data
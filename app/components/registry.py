@@ -0,0 +1,408 @@
+import numpy as np
+
+from components.rolling import RollingMean, RollingStd, RollingMax, RollingMin, ExponentialAverage
+
+
+#
+# Nodes
+#
+
+class Node:
+
+    """ A single calculation in the indicator graph. Every node declares the columns it reads
+        (inputs) and the columns it writes (outputs), and implements both a full recompute over a
+        DataFrame chart (calculate) and an O(1) update of the newest row of a ChartBuffer (update).
+
+        compute() is the full recompute over a dict of float64 arrays instead, with the kernels of
+        a backend (see kernels.py). Nodes with the same fusion() key share one kernel call.
+
+        peek() calculates the newest row like update(), but leaves the running state as it is, so
+        a row that is still forming can be calculated again and again before it is appended.
+    """
+
+    def __init__(self, inputs, outputs):
+
+        self.inputs     = list(inputs)
+        self.outputs    = list(outputs)
+        self.state      = None
+
+    # Identifies the calculation, so the same output requested twice is only calculated once
+    def signature(self):
+        return (type(self).__name__, tuple(self.inputs), tuple(self.outputs))
+
+    def reset(self):
+        self.state = None
+
+    def calculate(self, chart):
+        raise NotImplementedError
+
+    def update(self, buffer):
+        raise NotImplementedError
+
+    def compute(self, arrays, kernels):
+        raise NotImplementedError
+
+    # Nodes that are calculated together by one kernel call have the same key. None for nodes that are calculated on their own.
+    def fusion(self):
+        return None
+
+    # Nodes without running state calculate a forming row the same way as a new one
+    def peek(self, buffer):
+        self.update(buffer)
+
+
+class RollingNode(Node):
+
+    # pandas Rolling method, running state class and kernel, set by subclasses
+    method  = None
+    factory = None
+    prefix  = None
+    kernel  = None
+
+    def __init__(self, period, source, output=None):
+
+        self.period = int(period)
+        self.source = source
+
+        # Nodes with the same fusion key, this one included. Set by the registry.
+        self.fused  = [self]
+
+        super().__init__([source], [output or "{}-{}-{}".format(self.prefix, self.period, source)])
+
+    def signature(self):
+        return super().signature() + (self.period,)
+
+    def rolling(self, series):
+        return getattr(series.rolling(self.period), self.method)()
+
+    def calculate(self, chart):
+        chart[self.outputs[0]] = self.rolling(chart[self.source])
+
+    # Rolling nodes of the same kind over the same source are calculated in one pass, for all of their periods
+    def fusion(self):
+        return (self.kernel, self.source)
+
+    # Calculates the fused nodes along with this one. The nodes after it find their column already there.
+    def compute(self, arrays, kernels):
+
+        if self.outputs[0] in arrays:
+            return
+
+        results = getattr(kernels, self.kernel)(arrays[self.source], [node.period for node in self.fused])
+
+        for node, values in zip(self.fused, results):
+            arrays[node.outputs[0]] = values
+
+    # Creates the running state from the rows before the newest one
+    def prepare(self, buffer):
+
+        if self.state is None:
+            self.state = self.factory(self.period)
+            self.state.seed(buffer[self.source][:-1])
+
+    def update(self, buffer):
+
+        self.prepare(buffer)
+        buffer.set_last(self.outputs[0], self.state.update(buffer.last(self.source)))
+
+    def peek(self, buffer):
+
+        self.prepare(buffer)
+        buffer.set_last(self.outputs[0], self.state.peek(buffer.last(self.source)))
+
+
+class SimpleMovingAverage(RollingNode):
+    method  = "mean"
+    factory = RollingMean
+    prefix  = "SMA"
+    kernel  = "rolling_means"
+
+
+class StandardDeviation(RollingNode):
+    factory = RollingStd
+    prefix  = "STD"
+    kernel  = "rolling_stds"
+
+    def rolling(self, series):
+        return series.rolling(self.period).std(ddof=0)
+
+
+class RollingMaximum(RollingNode):
+    method  = "max"
+    factory = RollingMax
+    prefix  = "MAX"
+    kernel  = "rolling_maxs"
+
+
+class RollingMinimum(RollingNode):
+    method  = "min"
+    factory = RollingMin
+    prefix  = "MIN"
+    kernel  = "rolling_mins"
+
+
+class ExponentialMovingAverage(RollingNode):
+    prefix  = "EMA"
+    kernel  = "ewms"
+
+    def rolling(self, series):
+        return series.ewm(span=self.period, adjust=False).mean()
+
+    def prepare(self, buffer):
+
+        output = self.outputs[0]
+
+        if self.state is None:
+            self.state = ExponentialAverage(self.period)
+
+            # Continue from the calculated column if there is one, otherwise replay the input
+            if output in buffer and len(buffer) > 1:
+                self.state.resume(buffer.last(output, offset=2))
+            else:
+                self.state.seed(buffer[self.source][:-1])
+
+
+class BollingerBands(Node):
+
+    def __init__(self, period=20, deviations=2, source="close"):
+
+        period          = int(period)
+        self.deviations = float(deviations)
+        self.sma        = "SMA-{}-{}".format(period, source)
+        self.std        = "STD-{}-{}".format(period, source)
+
+        super().__init__([self.sma, self.std], ["BBU", "BBL"])
+
+    def signature(self):
+        return super().signature() + (self.deviations,)
+
+    def calculate(self, chart):
+        chart["BBU"] = chart[self.sma] + self.deviations*chart[self.std]
+        chart["BBL"] = chart[self.sma] - self.deviations*chart[self.std]
+
+    def update(self, buffer):
+
+        sma = buffer.last(self.sma)
+        std = buffer.last(self.std)
+
+        buffer.set_last("BBU", sma + self.deviations*std)
+        buffer.set_last("BBL", sma - self.deviations*std)
+
+    def compute(self, arrays, kernels):
+        arrays["BBU"] = arrays[self.sma] + self.deviations*arrays[self.std]
+        arrays["BBL"] = arrays[self.sma] - self.deviations*arrays[self.std]
+
+
+class StochasticK(Node):
+
+    def __init__(self, window=14, output="stoch_k"):
+
+        window      = int(window)
+        self.high   = "MAX-{}-high".format(window)
+        self.low    = "MIN-{}-low".format(window)
+
+        super().__init__(["close", self.high, self.low], [output])
+
+    def calculate(self, chart):
+        chart[self.outputs[0]] = (chart["close"] - chart[self.low])*100 / (chart[self.high] - chart[self.low])
+
+    def update(self, buffer):
+
+        high    = buffer.last(self.high)
+        low     = buffer.last(self.low)
+
+        # Same as pandas: NaN when the range is empty
+        buffer.set_last(self.outputs[0], (buffer.last("close") - low)*100 / (high - low) if high != low else np.nan)
+
+    def compute(self, arrays, kernels):
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            arrays[self.outputs[0]] = (arrays["close"] - arrays[self.low])*100 / (arrays[self.high] - arrays[self.low])
+
+
+class Difference(Node):
+
+    def __init__(self, minuend, subtrahend, output):
+        super().__init__([minuend, subtrahend], [output])
+
+    def calculate(self, chart):
+        chart[self.outputs[0]] = chart[self.inputs[0]] - chart[self.inputs[1]]
+
+    def update(self, buffer):
+        buffer.set_last(self.outputs[0], buffer.last(self.inputs[0]) - buffer.last(self.inputs[1]))
+
+    def compute(self, arrays, kernels):
+        arrays[self.outputs[0]] = arrays[self.inputs[0]] - arrays[self.inputs[1]]
+
+
+#
+# Indicator types
+#
+
+# Each indicator type in indicators.ini expands to the nodes it needs, intermediates included.
+# Intermediates that several indicators need (like SMA-20-close) end up as one shared node.
+
+def simple_moving_average(period, source="close"):
+    return [SimpleMovingAverage(period, source)]
+
+def exponential_moving_average(period, source="close"):
+    return [ExponentialMovingAverage(period, source)]
+
+def bollinger_bands(period=20, deviations=2, source="close"):
+    return [
+        SimpleMovingAverage(period, source),
+        StandardDeviation(period, source),
+        BollingerBands(period, deviations, source)
+    ]
+
+# The output columns can be renamed, so several variants of the same indicator fit in one chart
+def stochastic_rsi(window=14, smoothing=3, k="stoch_k", d="stoch_d"):
+    return [
+        RollingMaximum(window, "high"),
+        RollingMinimum(window, "low"),
+        StochasticK(window, output=k),
+        SimpleMovingAverage(smoothing, k, output=d)
+    ]
+
+def macd(fast=12, slow=26, signal=9, source="close", output="MACD", signal_output="MACD-S"):
+
+    fast, slow = int(fast), int(slow)
+
+    return [
+        ExponentialMovingAverage(fast, source),
+        ExponentialMovingAverage(slow, source),
+        Difference("EMA-{}-{}".format(fast, source), "EMA-{}-{}".format(slow, source), output),
+        ExponentialMovingAverage(signal, output, output=signal_output)
+    ]
+
+
+INDICATOR_TYPES = {
+    "sma":          simple_moving_average,
+    "ema":          exponential_moving_average,
+    "bollinger":    bollinger_bands,
+    "stochastic":   stochastic_rsi,
+    "macd":         macd
+}
+
+
+#
+# Registry
+#
+
+class IndicatorRegistry:
+
+    def __init__(self, config, sources):
+
+        """ Builds the indicator graph from a ConfigParser, where every section is one indicator:
+
+            [bollinger]
+            type = bollinger
+            period = 20
+
+            The "type" key selects the indicator, the other keys are passed as its parameters.
+            Nodes are deduplicated by output column and sorted so that every node comes after
+            the nodes producing its inputs. Iterating over the registry yields the nodes in
+            that order.
+        """
+
+        self.sources    = list(sources)
+        self.nodes      = []
+        self.producers  = {}
+
+        for section in config.sections():
+
+            parameters = dict(config[section])
+            kind       = parameters.pop("type", None)
+
+            if kind not in INDICATOR_TYPES:
+                raise ValueError("Indicator {} has an unknown type: {}".format(section, kind))
+
+            for node in INDICATOR_TYPES[kind](**parameters):
+                self.add(node)
+
+        self.nodes = self.sort()
+        self.fuse()
+
+    def __iter__(self):
+        return iter(self.nodes)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    # Adds a node, unless an identical one already produces the same outputs
+    def add(self, node):
+
+        existing = self.producers.get(node.outputs[0])
+
+        if existing is not None:
+
+            if existing.signature() != node.signature():
+                raise ValueError("Column {} is produced by two different calculations".format(node.outputs[0]))
+
+            return
+
+        for output in node.outputs:
+            self.producers[output] = node
+
+        self.nodes.append(node)
+
+    # Topological sort (Kahn's algorithm), keeping the configured order where possible
+    def sort(self):
+
+        dependencies = {}
+
+        for node in self.nodes:
+
+            dependencies[node] = set()
+
+            for column in node.inputs:
+
+                if column in self.producers:
+                    dependencies[node].add(self.producers[column])
+
+                elif column not in self.sources:
+                    raise ValueError("Column {} is not a source, and no indicator produces it".format(column))
+
+        order = []
+
+        while dependencies:
+
+            ready = [node for node in self.nodes if node in dependencies and not dependencies[node] - set(order)]
+
+            if not ready:
+                raise ValueError("Indicator dependencies contain a cycle")
+
+            for node in ready:
+                order.append(node)
+                del dependencies[node]
+
+        return order
+
+    # Groups the nodes by fusion key. Fused nodes read the same column, so it is there as soon as the first of them comes up.
+    def fuse(self):
+
+        groups = {}
+
+        for node in self.nodes:
+
+            key = node.fusion()
+
+            if key is not None:
+                groups.setdefault(key, []).append(node)
+                node.fused = groups[key]
+
+    # Full recompute over <arrays>, a dict with the source columns as float64 arrays, with the kernels of a backend.
+    # The output columns are added to the dict.
+    def compute(self, arrays, kernels):
+
+        for node in self.nodes:
+            node.compute(arrays, kernels)
+
+        return arrays
+
+    def outputs(self):
+        return [output for node in self.nodes for output in node.outputs]
+
+    def reset(self):
+        for node in self.nodes:
+            node.reset()
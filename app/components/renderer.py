@@ -0,0 +1,198 @@
+import multiprocessing, os, queue, time
+import numpy as np
+import pandas as pd
+
+from components.logger import Logger
+
+
+# Columns of the chart that are sent to the renderer
+COLUMNS = ["opentime", "open", "high", "low", "close", "volume"]
+
+
+class ChartRenderer:
+
+    def __init__(self, directory="exports", window=200, interval=60.0, type="candle", volume=True, style="binance", maxsize=100, loglevel=3):
+
+        """ Renders chart images in a separate process, so drawing never holds up the candles.
+
+            submit() copies the last <window> rows of a chart and puts them on a bounded job
+            queue, which takes microseconds and never blocks. If the queue is full, the job is
+            dropped. The renderer process only keeps the latest job of every stream, and renders
+            a stream at most once every <interval> seconds, so a burst of candles results in one
+            image of the newest state.
+
+            Every stream is drawn to <directory>/<symbol>-<interval>.png, which is replaced
+            atomically. The figure and axes of a stream are created once and reused. matplotlib
+            and mplfinance are only imported by the renderer process, on its first render.
+
+            The process is forked, so it starts without running app.py again. Create the renderer
+            before starting any threads.
+        """
+
+        self.window     = window
+        self.log        = Logger(name="renderer", loglevel=loglevel)
+
+        self.context    = multiprocessing.get_context("fork")
+        self.jobs       = self.context.Queue(maxsize)
+        self.dropped    = 0
+
+        self.process    = self.context.Process(target=renderer_main, args=(self.jobs, directory, interval, type, volume, style, loglevel), name="renderer", daemon=True)
+        self.process.start()
+
+
+    # Queues a render of the last rows of <buffer> (a ChartBuffer) for the stream <key>, as (symbol, interval)
+    def submit(self, key, buffer):
+
+        rows = {name: buffer[name][-self.window:].copy() for name in COLUMNS}
+
+        try:
+            self.jobs.put_nowait((key, rows))
+        except queue.Full:
+            self.dropped += 1
+            self.log.debug("Render queue is full, dropped the chart of {} {}", *key)
+
+    # Renders the queued charts, and stops the renderer process
+    def close(self):
+
+        self.jobs.put(None)
+        self.process.join(timeout=30)
+
+
+# Entry point of the renderer process
+def renderer_main(jobs, directory, interval, type, volume, style, loglevel):
+
+    log         = Logger(name="renderer", loglevel=loglevel)
+    plotter     = Plotter(type, volume, style)
+
+    pending     = {}
+    rendered    = {}
+    running     = True
+
+    os.makedirs(directory, exist_ok=True)
+
+    while running or pending:
+
+        # Waits for a job, or until the next pending chart is due
+        due     = min((rendered.get(key, -interval) + interval for key in pending), default=None)
+        timeout = None if due is None else max(0.0, due - time.monotonic())
+
+        try:
+            batch = [jobs.get(timeout=timeout)] if running else []
+
+            while running:
+                batch.append(jobs.get_nowait())
+
+        except queue.Empty:
+            pass
+
+        # Latest wins: a newer job of a stream replaces the one that is pending
+        for job in batch:
+
+            if job is None:
+                running = False
+            else:
+                pending[job[0]] = job[1]
+
+        now = time.monotonic()
+
+        for key in [key for key in pending if not running or now - rendered.get(key, -interval) >= interval]:
+
+            rows = pending.pop(key)
+            rendered[key] = now
+
+            try:
+                plotter.render(key, rows, os.path.join(directory, "{}-{}.png".format(*key)))
+            except Exception as e:
+                log.error("Unable to render the chart of {} {}: {}", key[0], key[1], e)
+
+    plotter.close()
+
+
+class Plotter:
+
+    def __init__(self, type="candle", volume=True, style="binance"):
+
+        self.type       = type
+        self.volume     = volume
+        self.style      = style
+
+        # Figure and axes of every stream, reused between renders
+        self.figures    = {}
+
+        self.mpf        = None
+
+
+    # Draws <rows> ({column: array}) to <filename>. The image is written next to it first, and moved into place.
+    def render(self, key, rows, filename):
+
+        if self.mpf is None:
+            self.mpf = load_mplfinance()
+
+        if key not in self.figures:
+
+            figure  = self.mpf.figure(style=self.style, figsize=(12, 8))
+            axes    = figure.add_subplot(4, 1, (1, 3)) if self.volume else figure.add_subplot(1, 1, 1)
+            volume  = figure.add_subplot(4, 1, 4, sharex=axes) if self.volume else None
+
+            self.figures[key] = (figure, axes, volume)
+
+        figure, axes, volume = self.figures[key]
+
+        axes.clear()
+
+        if volume is not None:
+            volume.clear()
+
+        self.mpf.plot(chart_frame(rows), ax=axes, volume=volume if volume is not None else False, type=self.type)
+
+        # The volume panel below shows the times
+        if volume is not None:
+            axes.tick_params(labelbottom=False)
+
+        if key is not None:
+            axes.set_title("{} {}".format(*key))
+
+        temp = filename + ".tmp.png"
+        figure.savefig(temp)
+        os.replace(temp, filename)
+
+    def close(self):
+
+        if self.mpf is not None:
+
+            import matplotlib.pyplot
+
+            for figure, axes, volume in self.figures.values():
+                matplotlib.pyplot.close(figure)
+
+        self.figures = {}
+
+
+# Imports mplfinance with a backend that doesn't need a display
+def load_mplfinance():
+
+    import matplotlib
+    matplotlib.use("Agg")
+
+    import mplfinance
+
+    return mplfinance
+
+# Builds the DataFrame mplfinance expects from chart columns: indexed by opening time, with capitalized OHLCV columns
+def chart_frame(rows):
+
+    index = pd.DatetimeIndex(np.asarray(rows["opentime"]).astype("datetime64[ms]"))
+    return pd.DataFrame({name.capitalize(): np.asarray(rows[name], dtype=np.float64) for name in COLUMNS[1:]}, index=index)
+
+# Draws a chart (a DataFrame like Candles.chart) to <filename> in this process. Only the last <window> rows are drawn.
+def draw_chart(chart, filename, type="candle", volume=False, style="binance", window=200):
+
+    rows    = {name: chart[name].to_numpy()[-window:] for name in COLUMNS}
+    plotter = Plotter(type, volume, style)
+
+    try:
+        plotter.render(None, rows, filename)
+    finally:
+        plotter.close()
+
+    return filename
@@ -0,0 +1,105 @@
+import asyncio, json, time
+
+from components.logger import Logger
+from components.recorder import read_recording
+
+
+class Replayer:
+
+    def __init__(self, paths, on_message, speed=1.0, loglevel=3):
+
+        """ Feeds recorded websocket messages (see Recorder) to the on_message(ws, message) coroutine,
+            the same way the Connection does, with None for the websocket.
+
+            The recordings in <paths> are replayed one after another. With a <speed> of 1, the
+            messages come in with the same gaps as they were received, with N they come in N times
+            as fast, and with 0 as fast as on_message takes them. A replay that can't keep up with
+            its speed falls behind instead of skipping messages, and the largest delay behind the
+            schedule is reported.
+        """
+
+        self.paths          = list(paths)
+        self.on_message     = on_message
+        self.speed          = speed
+        self.log            = Logger(name="replayer", loglevel=loglevel)
+
+        self.messages       = 0
+        self.first          = None
+        self.last           = None
+        self.behind         = 0.0
+
+        self.started        = None
+        self.stopped        = None
+
+
+    def read(self):
+
+        for path in self.paths:
+            yield from read_recording(path)
+
+    # Opening time of the kline in the first message of every stream, as {(symbol, interval): opentime}. The chart of a stream
+    # has to end right before it. Stops reading once every stream in <streams> is found.
+    def starts(self, streams=None):
+
+        starts = {}
+
+        for received, message in self.read():
+
+            data    = json.loads(message)
+            event   = data.get("data", data) if isinstance(data, dict) else None
+            kline   = event.get("k") if isinstance(event, dict) else None
+
+            # Replies and errors have no kline, like the KlineDecoder skips them
+            if isinstance(kline, dict):
+                starts.setdefault((kline["s"], kline["i"]), kline["t"])
+
+            if streams is not None and set(streams) <= set(starts):
+                break
+
+        return starts
+
+    async def run(self):
+
+        self.started = time.perf_counter()
+
+        for received, message in self.read():
+
+            if self.first is None:
+                self.first = received
+
+            self.last = received
+
+            if self.speed > 0:
+
+                delay = self.started + (received - self.first) / 1000 / self.speed - time.perf_counter()
+
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    self.behind = max(self.behind, -delay)
+
+            await self.on_message(None, message)
+            self.messages += 1
+
+            # As fast as possible still gives the processing stage its turn on the event loop
+            if self.speed <= 0:
+                await asyncio.sleep(0)
+
+        self.stopped = time.perf_counter()
+
+        self.log.info("Replayed {} messages in {:.2f}s", self.messages, self.stopped - self.started)
+
+    # Throughput of the replay. <seconds> is the time it took including the processing that was left at the end of the
+    # recording, and defaults to the time it took to feed the messages.
+    def report(self, seconds=None):
+
+        seconds = seconds if seconds is not None else (self.stopped or time.perf_counter()) - (self.started or time.perf_counter())
+
+        return {
+            "messages":             self.messages,
+            "speed":                self.speed,
+            "recorded_seconds":     (self.last - self.first) / 1000 if self.first is not None else 0.0,
+            "seconds":              seconds,
+            "messages_per_second":  self.messages / seconds if seconds > 0 else 0.0,
+            "behind_seconds":       self.behind
+        }
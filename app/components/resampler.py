@@ -0,0 +1,120 @@
+import numpy as np
+
+from components.klinecache import interval_to_milliseconds
+
+
+DAY = 24 * 60 * 60 * 1000
+
+
+class Resampler:
+
+    def __init__(self, interval, base_interval="1m"):
+
+        """ Rolls up the klines of <base_interval> into klines of a higher <interval>.
+
+            A higher kline opens at a multiple of its interval since the epoch, like the klines of
+            Binance, and takes the open of its first base kline, the close of its last one, the
+            highest high, the lowest low and the total volume. Intervals up to a day are supported,
+            as weeks and months are not aligned to the epoch.
+
+            load() resamples the history in one go, and keeps the kline that is still forming.
+            add() then continues it one base kline at a time, and returns the higher klines that
+            closed with it. A higher kline closes with its last base kline, or, if that never
+            comes (a gap in the base klines), as soon as a base kline of a later one comes in.
+
+            A higher kline without its first base kline would have the wrong open and volume, so
+            it is left out, both by load() (the history usually starts within one) and by add().
+            Emitting starts at the next boundary of the interval.
+        """
+
+        self.interval   = interval
+        self.step       = interval_to_milliseconds(interval)
+        self.base_step  = interval_to_milliseconds(base_interval)
+
+        if DAY % self.step != 0 or self.step % self.base_step != 0 or self.step <= self.base_step:
+            raise ValueError("Can't resample {} klines to {}".format(base_interval, interval))
+
+        # The kline that is forming, as [opentime, open, high, low, close, volume, closetime], and the opentime of the last base kline
+        self.current    = None
+        self.last       = -1
+
+
+    # Resamples an (n, 7) array of base klines, ordered by opentime, and returns the higher klines that are complete.
+    # The one that is still forming is kept, and continued by add().
+    def load(self, klines):
+
+        self.last = int(klines[-1, 0]) if len(klines) > 0 else -1
+
+        klines, self.current = resample(klines, self.step, self.base_step)
+
+        return klines
+
+    # Adds a closed base kline, and returns the higher klines that closed with it, oldest first, as
+    # (opentime, open, high, low, close, volume, closetime). Base klines that are not newer than the last one are ignored.
+    def add(self, opentime, openprice, highprice, lowprice, closeprice, volume):
+
+        closed = []
+
+        if opentime <= self.last:
+            return closed
+
+        bucket = opentime - opentime % self.step
+
+        if self.current is not None and self.current[0] != bucket:
+            closed.append(tuple(self.current))
+            self.current = None
+
+        if self.current is None:
+
+            # The first base klines of this one are missing, like those of a kline that the history starts within
+            if opentime != bucket:
+                self.last = opentime
+                return closed
+
+            self.current = [bucket, openprice, highprice, lowprice, closeprice, volume, bucket + self.step - 1]
+        else:
+            self.current[2] = max(self.current[2], highprice)
+            self.current[3] = min(self.current[3], lowprice)
+            self.current[4] = closeprice
+            self.current[5] += volume
+
+        self.last = opentime
+
+        if opentime + self.base_step >= bucket + self.step:
+            closed.append(tuple(self.current))
+            self.current = None
+
+        return closed
+
+
+# Resamples an (n, 7) array of base klines, ordered by opentime, to klines of <step> milliseconds. Returns the
+# complete klines as an array, and the one that is still forming as a list, or None.
+def resample(klines, step, base_step):
+
+    if len(klines) == 0:
+        return np.empty((0, 7)), None
+
+    opentime    = klines[:, 0].astype(np.int64)
+    buckets     = opentime - opentime % step
+
+    starts      = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends        = np.r_[starts[1:], len(klines)] - 1
+
+    resampled   = np.column_stack([
+        buckets[starts],
+        klines[starts, 1],
+        np.maximum.reduceat(klines[:, 2], starts),
+        np.minimum.reduceat(klines[:, 3], starts),
+        klines[ends, 4],
+        np.add.reduceat(klines[:, 5], starts),
+        buckets[starts] + step - 1
+    ]).astype(np.float64)
+
+    # The history usually starts within a kline, which is left out, as its first base klines are missing
+    first = 1 if opentime[0] - buckets[0] >= base_step else 0
+
+    # Only the last kline can still be forming: all the others have base klines of a later one after them
+    if opentime[-1] + base_step >= buckets[-1] + step:
+        return resampled[first:], None
+
+    return resampled[first:-1], resampled[-1].tolist() if len(resampled) > first else None
@@ -0,0 +1,256 @@
+import itertools, math
+from collections import deque
+
+
+nan = float("nan")
+
+
+class RollingWindow:
+
+    def __init__(self, window):
+
+        """ Base class for O(1) rolling statistics over the last <window> values.
+
+            Values are pushed one at a time with update(), which returns the statistic for the
+            window ending at that value. Like pandas' rolling(window), the result is NaN until the
+            window is full, and while it contains a NaN.
+        """
+
+        self.window     = int(window)
+        self.values     = deque(maxlen=self.window)
+        self.nans       = 0
+
+    def push(self, value):
+
+        evicted = self.values[0] if len(self.values) == self.window else None
+
+        self.values.append(value)
+
+        if value != value:
+            self.nans += 1
+
+        if evicted is not None and evicted != evicted:
+            self.nans -= 1
+
+        return evicted
+
+    def ready(self):
+        return len(self.values) == self.window and self.nans == 0
+
+    # Oldest value that pushing one more would evict, or None while the window isn't full
+    def evictable(self):
+        return self.values[0] if len(self.values) == self.window else None
+
+    # Whether the window would be ready after pushing <value>
+    def ready_with(self, value):
+
+        evicted = self.evictable()
+        nans    = self.nans + (value != value) - (evicted is not None and evicted != evicted)
+
+        return min(len(self.values) + 1, self.window) == self.window and nans == 0
+
+    # Feeds historical values without computing results. Only the last <window> values matter.
+    def seed(self, values):
+        for value in list(values)[-self.window:]:
+            self.update(value)
+
+
+class RollingMean(RollingWindow):
+
+    def __init__(self, window):
+
+        super().__init__(window)
+
+        # Running sum of the finite values in the window, rebuilt from the window every <window>
+        # updates so floating point error can't accumulate over weeks of uptime.
+        self.sum        = 0.0
+        self.updates    = 0
+
+    def update(self, value):
+
+        evicted = self.push(value)
+
+        if value == value:
+            self.sum += value
+
+        if evicted is not None and evicted == evicted:
+            self.sum -= evicted
+
+        self.updates += 1
+        if self.updates % self.window == 0:
+            self.sum = math.fsum(v for v in self.values if v == v)
+
+        return self.sum / self.window if self.ready() else nan
+
+    # The result update(<value>) would return, without changing the window
+    def peek(self, value):
+
+        if not self.ready_with(value):
+            return nan
+
+        evicted = self.evictable()
+
+        return (self.sum + value - (evicted if evicted is not None and evicted == evicted else 0.0)) / self.window
+
+
+class RollingStd(RollingWindow):
+
+    def __init__(self, window, ddof=0):
+
+        super().__init__(window)
+
+        self.ddof       = ddof
+
+        # Sums are kept relative to a reference value close to the data, which avoids catastrophic
+        # cancellation in sumsq - sum^2/n for prices far from zero. The reference moves along
+        # with the data whenever the sums are rebuilt.
+        self.reference  = None
+        self.sum        = 0.0
+        self.sumsq      = 0.0
+        self.updates    = 0
+
+    def update(self, value):
+
+        if self.reference is None and value == value:
+            self.reference = value
+
+        evicted = self.push(value)
+
+        if value == value:
+            self.sum   += value - self.reference
+            self.sumsq += (value - self.reference) ** 2
+
+        if evicted is not None and evicted == evicted:
+            self.sum   -= evicted - self.reference
+            self.sumsq -= (evicted - self.reference) ** 2
+
+        self.updates += 1
+        if self.updates % self.window == 0:
+            if value == value:
+                self.reference = value
+
+            self.sum   = math.fsum(v - self.reference for v in self.values if v == v)
+            self.sumsq = math.fsum((v - self.reference) ** 2 for v in self.values if v == v)
+
+        if not self.ready():
+            return nan
+
+        variance = (self.sumsq - self.sum * self.sum / self.window) / (self.window - self.ddof)
+        return math.sqrt(max(variance, 0.0))
+
+    # The result update(<value>) would return, without changing the window
+    def peek(self, value):
+
+        if not self.ready_with(value):
+            return nan
+
+        reference   = self.reference if self.reference is not None else value
+        evicted     = self.evictable()
+
+        total       = self.sum + (value - reference)
+        squares     = self.sumsq + (value - reference) ** 2
+
+        if evicted is not None and evicted == evicted:
+            total   -= evicted - reference
+            squares -= (evicted - reference) ** 2
+
+        variance = (squares - total * total / self.window) / (self.window - self.ddof)
+        return math.sqrt(max(variance, 0.0))
+
+
+class RollingExtreme(RollingWindow):
+
+    def __init__(self, window, maximum=True):
+
+        """ Rolling max (or min) using a monotonic deque of (position, value) candidates.
+            Every value enters and leaves the deque once, so updates are O(1) amortized.
+        """
+
+        super().__init__(window)
+
+        self.maximum    = maximum
+        self.candidates = deque()
+        self.position   = 0
+
+    def update(self, value):
+
+        self.push(value)
+
+        if value == value:
+
+            if self.maximum:
+                while self.candidates and self.candidates[-1][1] <= value:
+                    self.candidates.pop()
+            else:
+                while self.candidates and self.candidates[-1][1] >= value:
+                    self.candidates.pop()
+
+            self.candidates.append((self.position, value))
+
+        # Drop candidates that have left the window
+        while self.candidates and self.candidates[0][0] <= self.position - self.window:
+            self.candidates.popleft()
+
+        self.position += 1
+
+        return self.candidates[0][1] if self.ready() else nan
+
+    # The result update(<value>) would return, without changing the window
+    def peek(self, value):
+
+        if not self.ready_with(value):
+            return nan
+
+        # Only the oldest candidate can leave the window with the next value
+        candidates = [candidate[1] for candidate in itertools.islice(self.candidates, 2) if candidate[0] > self.position - self.window][:1]
+
+        return max(candidates + [value]) if self.maximum else min(candidates + [value])
+
+
+class RollingMax(RollingExtreme):
+
+    def __init__(self, window):
+        super().__init__(window, maximum=True)
+
+
+class RollingMin(RollingExtreme):
+
+    def __init__(self, window):
+        super().__init__(window, maximum=False)
+
+
+class ExponentialAverage:
+
+    def __init__(self, span):
+
+        """ Exponential moving average, matching pandas' ewm(span=span, adjust=False).mean().
+            Only the last value is kept. NaN inputs leave the average unchanged.
+        """
+
+        self.span       = span
+        self.alpha      = 2 / (span + 1)
+        self.value      = nan
+
+    def update(self, value):
+
+        if value == value:
+            self.value = value if self.value != self.value else self.value + self.alpha * (value - self.value)
+
+        return self.value
+
+    # Replays the full history of the input
+    def seed(self, values):
+        for value in values:
+            self.update(value)
+
+    # The result update(<value>) would return, without changing the average
+    def peek(self, value):
+
+        if value != value:
+            return self.value
+
+        return value if self.value != self.value else self.value + self.alpha * (value - self.value)
+
+    # Continues from the last value of an already computed average
+    def resume(self, value):
+        self.value = value
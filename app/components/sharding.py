@@ -0,0 +1,126 @@
+import multiprocessing, threading
+from multiprocessing import resource_tracker
+
+from components.logger import Logger
+from components.chartbuffer import ChartBuffer
+from components.indicators import Indicators
+from components.signals import Signals
+
+
+class ShardPool:
+
+    def __init__(self, processes=4, loglevel=3, verify_interval=0, kernels="auto"):
+
+        """ Evaluates indicators and signals in a pool of worker processes, to use more than one core.
+
+            Every stream is assigned to one worker (shard) for its whole lifetime, so the incremental
+            indicator state of a stream lives in a single process. The chart itself is a ChartBuffer
+            in shared memory: the main process appends candles to it, and the worker attaches to the
+            same memory and writes the indicator columns into it. Requests only carry the name and
+            window of the buffer, and workers only send back the compact signal results, so no
+            DataFrames are ever pickled.
+
+            evaluate() blocks until the worker is done, and may be called from several threads at
+            once. Requests to the same worker are serialized, requests to different workers run in
+            parallel.
+
+            Workers are forked, so they start with the modules that are already imported, and don't
+            run app.py again. Create the pool before starting any threads.
+        """
+
+        self.log        = Logger(name="shards", loglevel=loglevel)
+        self.context    = multiprocessing.get_context("fork")
+        self.shards     = []
+        self.assigned   = {}
+
+        # Workers must share the resource tracker of this process. Otherwise each of them starts its own
+        # when attaching to a shared chart, and that one unlinks the chart when the worker exits.
+        resource_tracker.ensure_running()
+
+        for index in range(processes):
+
+            connection, worker_connection = self.context.Pipe()
+
+            process = self.context.Process(target=shard_main, args=(worker_connection, loglevel, verify_interval, kernels), name="shard-{}".format(index), daemon=True)
+            process.start()
+
+            self.shards.append((process, connection, threading.Lock()))
+
+        self.log.info("Started {} shard processes", processes)
+
+
+    # Assigns streams to shards round robin, in the order they are first seen
+    def shard(self, key):
+
+        if key not in self.assigned:
+            self.assigned[key] = len(self.assigned) % len(self.shards)
+
+        return self.shards[self.assigned[key]]
+
+    # Calculates the indicators for the newest row of <buffer> (a shared ChartBuffer) and checks the signals.
+    # With <appended> False (the last row was replaced), the indicators are recalculated for the whole chart.
+    # Returns the results of Signals.results() from the worker.
+    def evaluate(self, key, buffer, appended=True):
+
+        process, connection, lock = self.shard(key)
+
+        request = (key, buffer.shm.name, buffer.capacity, buffer.value_columns, buffer.start, buffer.end, appended)
+
+        with lock:
+            connection.send(request)
+            status, result = connection.recv()
+
+        if status == "error":
+            raise RuntimeError("Shard {} failed to evaluate {}: {}".format(process.name, key, result))
+
+        return result
+
+    def close(self):
+
+        for process, connection, lock in self.shards:
+            with lock:
+                connection.send(None)
+
+        for process, connection, lock in self.shards:
+            process.join(timeout=5)
+
+
+# Entry point of a shard process
+def shard_main(connection, loglevel, verify_interval, kernels):
+
+    streams = {}
+
+    while True:
+
+        request = connection.recv()
+
+        if request is None:
+            break
+
+        key, name, capacity, columns, start, end, appended = request
+
+        try:
+
+            if key not in streams:
+                buffer      = ChartBuffer.attach(name, capacity, columns)
+                indicators  = Indicators(loglevel=loglevel, verify_interval=verify_interval, kernels=kernels)
+                signals     = Signals(loglevel=loglevel)
+
+                streams[key] = (buffer, indicators, signals)
+
+                # First request for this stream: the indicator columns have not been calculated yet
+                appended = False
+
+            buffer, indicators, signals = streams[key]
+            buffer.start, buffer.end = start, end
+
+            indicators.update(buffer) if appended else indicators.warm_up(buffer)
+            signals.check(buffer)
+
+            connection.send(("ok", signals.results()))
+
+        except Exception as e:
+            connection.send(("error", repr(e)))
+
+    for buffer, indicators, signals in streams.values():
+        buffer.close()
@@ -1,126 +1,257 @@
 import pandas as pd
-import datetime
+import numpy as np
 
 from components.logger import Logger
+from components.metrics import metrics
+
+
+class SignalDefinition:
+
+    __slots__ = ("id", "name", "action", "type", "description", "weight", "indicator")
+
+    def __init__(self, id, name, action, type, description, weight, indicator):
+
+        self.id             = id
+        self.name           = name
+        self.action         = action
+        self.type           = type
+        self.description    = description
+        self.weight         = weight
+        self.indicator      = indicator
+
 
 class Signals:
 
-    def __init__(self, loglevel=3):
-   
+    def __init__(self, loglevel=3, moving_averages=("SMA-200-close", "SMA-100-close", "SMA-50-close", "SMA-20-close"), volume_sma="SMA-20-volume", oversold=20, overbought=80):
+
         self.log                = Logger(name="signals", loglevel=loglevel)
 
-        # Signals as Pandas dataframe
+        self.moving_averages    = list(moving_averages)
+        self.volume_sma         = volume_sma
+
+        # Stochastic thresholds
+        self.oversold           = oversold
+        self.overbought         = overbought
+
+        # Every signal that can be raised is known up front. The state of the signals is kept in arrays
+        # indexed by signal id, so setting and clearing a signal and the total weight are O(1).
+        self.definitions        = []
+        self.ids                = {}
+        self.define_signals()
+
+        self.weights            = np.array([definition.weight for definition in self.definitions], dtype=np.float64)
+        self.active             = np.zeros(len(self.definitions), dtype=bool)
+        self.values             = np.full(len(self.definitions), np.nan)
+        self.total_weight       = 0.0
+
         self.signals_columns    = ["Name", "Type", "Action", "Description", "Weight", "Values"]
-        self.signals            = pd.DataFrame(columns=self.signals_columns)
+
+        # Time spent per rule
+        self.timings            = {rule: metrics.histogram("trader_rule_seconds", rule=rule) for rule in ("stochastic_rsi", "trading_volume", "moving_average", "macd")}
 
         self.market_is_bullish = False
 
 
+    # <indicator> names the rule that raises the signal: stochastic, average, volume or macd
+    def define(self, name, action, type, description, weight, indicator):
+
+        definition = SignalDefinition(len(self.definitions), name, action, type, description, weight, indicator)
+
+        self.definitions.append(definition)
+        self.ids[name] = definition.id
+
+    def define_signals(self):
+
+        self.define("stochastic_oversold", "Buy", "Oscillator", "Stochastic Oversold: K and D lines are below the lower threshold ({})".format(self.oversold), 2, "stochastic")
+        self.define("stochastic_overbought", "Sell", "Oscillator", "Stochastic Overbought: K and D lines are above the upper threshold ({})".format(self.overbought), -2, "stochastic")
+        self.define("stochastic_bullish_market", "Buy", "Oscillator", "Stochastic Bullish Market: K line is above D", 1, "stochastic")
+        self.define("stochastic_bearish_market", "Sell", "Oscillator", "Stochastic Bearish Market: K line is below D", -1, "stochastic")
+        self.define("stochastic_bullish_crossover", "Buy", "Oscillator", "Stochastic Bullish Crossover: K crossed over D", 2, "stochastic")
+        self.define("stochastic_bearish_crossover", "Sell", "Oscillator", "Stochastic Bearish Crossover: D crossed over K", -2, "stochastic")
+
+        for ma in self.moving_averages:
+            self.define(f"{ma}_bullish_market", "Buy", "Average", f"Moving Average {ma} bullish market: Closing price is above {ma}", 1, "average")
+            self.define(f"{ma}_bearish_market", "Sell", "Average", f"Moving Average {ma} bearish market: Closing price is below {ma}", -1, "average")
+            self.define(f"price_crossed_over_{ma}", "Buy", "Average", f"Moving Average {ma} bullish crossover: Closing price crossed {ma}", 2, "average")
+            self.define(f"price_crossed_under_{ma}", "Sell", "Average", f"Moving Average {ma} bearish crossover: Closing price crossed {ma}", -2, "average")
+
+        self.define(f"volume_above_{self.volume_sma}", "Buy", "Average", f"Trading volume is higher than {self.volume_sma}", 2, "volume")
+        self.define(f"volume_below_{self.volume_sma}", "Sell", "Average", f"Trading volume is higher than {self.volume_sma}", -2, "volume")
 
+        self.define("macd_bullish_crossover", "Buy", "Oscillator", "MACD Bullish Market: MACD is above the signal line", 1, "macd")
+        self.define("macd_bearish_crossover", "Sell", "Oscillator", "MACD Bearish Market: The signal line is above MACD", -1, "macd")
+
+
+    # Evaluates the rules for the newest bar of the chart, and updates the active signals
     def check(self, chart):
 
-        self.stochastic_rsi(chart)
-        self.trading_volume(chart)
-        self.moving_average(chart)
-        self.macd(chart)
+        # Crossovers need the bar before the newest one, so only two bars are evaluated
+        active, values, direction = self.evaluate(chart, rows=2)
+
+        for definition in self.definitions:
+            self.set_signal(definition.name, active[-1, definition.id], values[-1, definition.id])
+
+        if direction[-1] > 0:
+            self.market_is_bullish = True
+
+        if direction[-1] < 0:
+            self.market_is_bullish = False
+
+    # Evaluates the rules for the newest bar of the chart like check(), and returns the results like results(), but leaves the
+    # active signals as they are. For a bar that is still forming.
+    def peek(self, chart):
+
+        active, values, direction = self.evaluate(chart, rows=2)
+
+        signals = [
+            (definition.name, definition.action, definition.description, definition.weight, float(values[-1, definition.id]))
+            for definition in self.definitions if active[-1, definition.id]
+        ]
+
+        bullish = bool(direction[-1] > 0) if direction[-1] != 0 else self.market_is_bullish
+
+        return float(self.total_weights(active[-1])), bullish, signals
+
+    def evaluate(self, chart, rows=None):
+
+        """ Evaluates every rule over the whole chart at once (or its last <rows> bars), as arrays.
+
+            Returns (active, values, direction):
+
+            active      Boolean array of shape (bars, signals): signal <id> is raised at that bar
+            values      Float array of the same shape, with the value reported by a raised signal
+            direction   Market direction per bar according to the stochastic: 1 bullish, -1 bearish, 0 unchanged
+
+            The chart can be a DataFrame or a ChartBuffer. The live check() and backtests use the
+            same rules, so what fires in a backtest is what would have fired live.
+        """
+
+        length      = len(chart) if rows is None else min(rows, len(chart))
+
+        active      = np.zeros((length, len(self.definitions)), dtype=bool)
+        values      = np.full((length, len(self.definitions)), np.nan)
+        direction   = np.zeros(length, dtype=np.int8)
+
+        with self.timings["stochastic_rsi"].time():
+            self.stochastic_rsi(chart, rows, active, values, direction)
 
-    def add_signal(self, signal):
+        with self.timings["trading_volume"].time():
+            self.trading_volume(chart, rows, active, values)
 
-        if signal[0] not in self.signals["Name"].values:
+        with self.timings["moving_average"].time():
+            self.moving_average(chart, rows, active, values)
 
-            self.signals_columns    = ["Name", "Action", "Type", "Description", "Weight", "Values"]
-            signals                 = pd.DataFrame([signal], columns=self.signals_columns)
+        with self.timings["macd"].time():
+            self.macd(chart, rows, active, values)
 
-            self.signals = self.signals.append(signals, ignore_index=True)
+        return active, values, direction
 
-            self.log.debug("Added signal {}".format(signal[0]))
+    # Total weight of the raised signals per bar, for the <active> array of evaluate()
+    def total_weights(self, active):
+        return active @ self.weights
+
+    def column(self, chart, name, rows):
+
+        column = np.asarray(chart[name], dtype=np.float64)
+        return column if rows is None else column[-rows:]
+
+    def rule(self, active, values, signal_name, condition, value):
+
+        signal_id = self.ids[signal_name]
+
+        active[:, signal_id] = condition
+        values[:, signal_id] = np.where(condition, value, np.nan)
+
+    # The active signals as a DataFrame. Built on request, for display only.
+    @property
+    def signals(self):
+
+        rows = [
+            [definition.name, definition.type, definition.action, definition.description, definition.weight, self.values[definition.id]]
+            for definition in self.definitions if self.active[definition.id]
+        ]
+
+        return pd.DataFrame(rows, columns=self.signals_columns)
+
+    # Compact results of the last check: total weight, market direction, and (name, action, description, weight, value) per active signal
+    def results(self):
+
+        active = [
+            (definition.name, definition.action, definition.description, definition.weight, float(self.values[definition.id]))
+            for definition in self.definitions if self.active[definition.id]
+        ]
+
+        return self.total_weight, self.market_is_bullish, active
+
+    def add_signal(self, signal_name, value):
+
+        signal_id = self.ids[signal_name]
+
+        self.values[signal_id] = value
+
+        if not self.active[signal_id]:
+
+            self.active[signal_id] = True
+            self.total_weight += self.weights[signal_id]
+
+            self.log.debug("Added signal {}", signal_name)
 
     def drop_signal(self, signal_name):
 
-        if signal_name in self.signals["Name"].values:
-            signal_index = self.signals[self.signals["Name"] == signal_name].index
-            self.signals.drop(signal_index, inplace=True)
+        signal_id = self.ids[signal_name]
+
+        if self.active[signal_id]:
 
-            self.log.debug("Dropped signal {}".format(signal_name))
+            self.active[signal_id] = False
+            self.total_weight -= self.weights[signal_id]
 
+            self.log.debug("Dropped signal {}", signal_name)
 
-    def record_signal(self, signal_name, signal):
-        d = datetime.datetime.now()
-        
-        entry = "{}: {} {}".format(d, signal_name, signal)
-        with open("signal-history.log", "a+") as h:
-            h.write(entry)
+    # Sets or clears a signal depending on <condition>
+    def set_signal(self, signal_name, condition, value):
+        self.add_signal(signal_name, value) if condition else self.drop_signal(signal_name)
 
-        self.signals_history[d] = {signal_name: signal}
+
+# Anything compared with NaN is False, so a rule never fires while its indicator is still warming up.
 
 #
 # STOCHASTIC RSI
 #
 
-    def stochastic_rsi(self, chart):
+    def stochastic_rsi(self, chart, rows, active, values, direction):
 
         self.log.debug("Evaluating indicator: Stochastic RSI")
 
         # Indicator exists in chart
         if "stoch_k" in chart and "stoch_d" in chart:
-            
-            # Get latest indicator values
-            k           = chart["stoch_k"].iat[-1]
-            d           = chart["stoch_d"].iat[-1]
 
-            previous_k  = chart["stoch_d"].iat[-2]
-            previous_d  = chart["stoch_d"].iat[-2]
+            k           = self.column(chart, "stoch_k", rows)
+            d           = self.column(chart, "stoch_d", rows)
 
+            previous_k  = previous(k)
+            previous_d  = previous(d)
 
-            # Below threshold of 20, indicates RSI oversold
-            signal_name = "stochastic_oversold"
-            if k < 20 and d < 20:
-                self.add_signal([signal_name, "Buy", "Oscillator", "Stochastic Oversold: K and D lines are below the lower threshold (20)", 2, k])
-            else:
-                self.drop_signal(signal_name)
 
-            # Above threshold of 80, indicates RSI oversold
-            signal_name = "stochastic_overbought"
-            if k > 80 and d > 80:
-                self.add_signal([signal_name, "Sell", "Oscillator", "Stochastic Overbought: K and D lines are above the upper threshold (80)", -2, k])
-            else:
-                self.drop_signal(signal_name)
+            # Below the lower threshold (20 by default), indicates RSI oversold
+            self.rule(active, values, "stochastic_oversold", (k < self.oversold) & (d < self.oversold), k)
 
+            # Above the upper threshold (80 by default), indicates RSI overbought
+            self.rule(active, values, "stochastic_overbought", (k > self.overbought) & (d > self.overbought), k)
 
             # K line higher than D line indicates a bullish market
-            signal_name = "stochastic_bullish_market"
-            if k > d:
-                self.add_signal([signal_name, "Buy", "Oscillator", "Stochastic Bullish Market: K line is above D", 1, k])
-
-                self.market_is_bullish = True
-            else:
-                self.drop_signal(signal_name)
-
+            self.rule(active, values, "stochastic_bullish_market", k > d, k)
 
             # Bearish market
-            signal_name = "stochastic_bearish_market"
-            if k < d:
-                self.add_signal([signal_name, "Sell", "Oscillator", "Stochastic Bearish Market: K line is below D", -1, k])                
-
-                self.market_is_bullish = False
-            else:
-                self.drop_signal(signal_name)
-
-            # Bullish crossover 
-            signal_name = "stochastic_bullish_crossover"
-            if k > d and previous_k < previous_d:
-                self.add_signal([signal_name, "Buy", "Oscillator", "Stochastic Bullish Crossover: K crossed over D", 2, k])
+            self.rule(active, values, "stochastic_bearish_market", k < d, k)
 
-            else:
-                self.drop_signal(signal_name)
+            direction[k > d] = 1
+            direction[k < d] = -1
 
-            # Bearish crossover 
-            signal_name = "stochastic_bearish_crossover"
-            if k < d and previous_k > previous_d:
-                self.add_signal([signal_name, "Sell", "Oscillator", "Stochastic Bearish Crossover: D crossed over K", -2, k])
+            # Bullish crossover
+            self.rule(active, values, "stochastic_bullish_crossover", (k > d) & (previous_k < previous_d), k)
 
-            else:
-                self.drop_signal(signal_name)
+            # Bearish crossover
+            self.rule(active, values, "stochastic_bearish_crossover", (k < d) & (previous_k > previous_d), k)
 
         else:
             self.log.warning("Chart does not have Stocastic indicators.")
@@ -130,61 +261,31 @@ class Signals:
 # Moving Average
 #
 
-    def moving_average(self, chart):
+    def moving_average(self, chart, rows, active, values):
 
         self.log.debug("Evaluating indicator: Simple Moving Average")
-        
-        moving_averages = ["SMA-200-close", "SMA-100-close", "SMA-50-close", "SMA-20-close"]
-        last_close = chart["close"].iat[-1]
-        previous_close = chart["close"].iat[-2]
-        last_open = chart["open"].iat[-1]
-
-        for ma in moving_averages:
-                
-            if ma in chart:
-                
-                # Bullish market
-                signal_name = f"{ma}_bullish_market"
 
-                if last_close > chart[ma].iat[-1]:
-                    self.log.debug(f"Price is higher than {ma}")
-                    
-                    self.add_signal([signal_name, "Buy", "Average", f"Moving Average {ma} bullish market: Closing price is above {ma}", 1, chart[ma].iat[-1]])
+        close           = self.column(chart, "close", rows)
+        previous_close  = previous(close)
 
-                else:
-                    self.log.debug(f"Price is lower than {ma}")
-                    self.drop_signal(signal_name)
+        for ma in self.moving_averages:
 
-                # Bearish market
-                signal_name = f"{ma}_bearish_market"
+            if ma in chart:
 
-                if last_close < chart[ma].iat[-1]:
-                    self.log.debug(f"Price is lower than {ma}")
-                    
-                    self.add_signal([signal_name, "Sell", "Average", f"Moving Average {ma} bearish market: Closing price is below {ma}", -1, chart[ma].iat[-1]])
+                average             = self.column(chart, ma, rows)
+                previous_average    = previous(average)
 
-                else:
-                    self.log.debug(f"Price is higher than {ma}")
-                    self.drop_signal(signal_name)
+                # Bullish market
+                self.rule(active, values, f"{ma}_bullish_market", close > average, average)
 
-                # Bullish crossover
-                signal_name = f"price_crossed_over_{ma}" 
-                if last_close > chart[ma].iat[-1] and previous_close < chart[ma].iat[-2]:
-                    self.log.debug(f"Price crossed over {ma}")
-                    self.add_signal([signal_name, "Buy", "Average", f"Moving Average {ma} bullish crossover: Closing price crossed {ma}", 2, chart[ma].iat[-1]])
-                else:
-                    self.log.debug(f"Price is higher than {ma}")
-                    self.drop_signal(signal_name)
+                # Bearish market
+                self.rule(active, values, f"{ma}_bearish_market", close < average, average)
 
+                # Bullish crossover
+                self.rule(active, values, f"price_crossed_over_{ma}", (close > average) & (previous_close < previous_average), average)
 
                 # Bearish crossover
-                signal_name = f"price_crossed_over_{ma}" 
-                if last_close < chart[ma].iat[-1] and previous_close > chart[ma].iat[-2]:
-                    self.log.debug(f"Price crossed over {ma}")
-                    self.add_signal([signal_name, "Sell", "Average", f"Moving Average {ma} bearish crossover: Closing price crossed {ma}", -2, chart[ma].iat[-1]])
-                else:
-                    self.log.debug(f"Price is higher than {ma}")
-                    self.drop_signal(signal_name)
+                self.rule(active, values, f"price_crossed_under_{ma}", (close < average) & (previous_close > previous_average), average)
 
 #
 # RELATIVE STRENGTH INDEX
@@ -195,31 +296,27 @@ class Signals:
 # VOLUME
 #
 
-    def trading_volume(self, chart, sma="SMA-20-volume"):
+    def trading_volume(self, chart, rows, active, values):
 
         self.log.debug("Evaluating indicator: Trading volume")
 
-        # Volume SMA bullish market
-        signal_name = f"volume_above_{sma}"
+        sma = self.volume_sma
 
         if sma in chart:
-            self.log.debug("Volume: {} ({}: {})".format(chart["volume"].iat[-1], sma, chart["SMA-20-volume"].iat[-1]))
-            if chart["volume"].iat[-1] > chart[sma].iat[-1] and last_close > last_open:
-                self.add_signal([signal_name, "Buy", "Average", f"Trading volume is higher than {sma}", 2, chart["volume"].iat[-1]])
 
-        else:
-            self.log.warning(f"{sma} has not yet been calculated.")
+            volume      = self.column(chart, "volume", rows)
+            average     = self.column(chart, sma, rows)
+            close       = self.column(chart, "close", rows)
+            openprice   = self.column(chart, "open", rows)
 
-        # Volume SMA bearish market
-        signal_name = f"volume_below_{sma}"
+            # Volume SMA bullish market
+            self.rule(active, values, f"volume_above_{sma}", (volume > average) & (close > openprice), volume)
 
-        if sma in chart:
-            self.log.debug("Volume: {} ({}: {})".format(chart["volume"].iat[-1], sma, chart["SMA-20-volume"].iat[-1]))
-            if chart["volume"].iat[-1] > chart[sma].iat[-1] and last_close < last_open:
-                self.add_signal([signal_name, "Sell", "Average", f"Trading volume is higher than {sma}", -2, chart["volume"].iat[-1]])
+            # Volume SMA bearish market
+            self.rule(active, values, f"volume_below_{sma}", (volume > average) & (close < openprice), volume)
 
         else:
-            self.log.warning(f"{sma} has not yet been calculated.")
+            self.log.warning("{} has not yet been calculated.", sma)
 
 
 #
@@ -228,39 +325,32 @@ class Signals:
 
 # https://www.investopedia.com/terms/m/macd.asp
 
-    def macd(self, chart):
-        
+    def macd(self, chart, rows, active, values):
+
         self.log.debug("Evaluating indicator: MACD")
 
         # Indicator exists in chart
         if "MACD" in chart and "MACD-S" in chart:
-            
-            # Get latest indicator values
-            macd            = chart["MACD"].iat[-1]
-            signal          = chart["MACD-S"].iat[-1]
 
-            previous_macd   = chart["MACD"].iat[-2]
-            previous_signal = chart["MACD-S"].iat[-2]
+            macd            = self.column(chart, "MACD", rows)
+            signal          = self.column(chart, "MACD-S", rows)
 
+            previous_macd   = previous(macd)
+            previous_signal = previous(signal)
 
-            # Bullish crossover 
-            signal_name = "macd_bullish_crossover"
-            if macd > signal and previous_macd < previous_signal:
-                self.log.debug("MACD crossed over the signal line")
-                self.add_signal([signal_name, "Buy", "Oscillator", "MACD Bullish Market: MACD is above the signal line", 1, macd]) 
-            else:
-                self.drop_signal(signal_name)
 
-            # Bearish crossover 
-            signal_name = "macd_bearish_crossover"
-            if macd < signal and previous_macd > previous_signal:
-                self.log.debug("Signal line crossed over MACD")
-                self.add_signal([signal_name, "Sell", "Oscillator", "MACD Bearish Market: The signal line is above MACD", -1, macd]) 
-            else:
-                self.drop_signal(signal_name)
+            # Bullish crossover
+            self.rule(active, values, "macd_bullish_crossover", (macd > signal) & (previous_macd < previous_signal), macd)
+
+            # Bearish crossover
+            self.rule(active, values, "macd_bearish_crossover", (macd < signal) & (previous_macd > previous_signal), macd)
 
 
 #
 # Bollinger Bands
 #
 
+
+# Returns the series shifted by one bar, so index i holds the value of bar i-1 (NaN for the first bar)
+def previous(series):
+    return np.concatenate(([np.nan], series[:-1]))
@@ -0,0 +1,372 @@
+import threading
+import numpy as np
+
+from components.logger import Logger
+from components.candles import Candles
+from components.indicators import Indicators
+from components.signals import Signals
+from components.bookmaker import Bookie
+from components.chartbuffer import ChartBuffer
+from components.klinecache import interval_to_milliseconds
+from components.metrics import metrics
+
+
+class Stream:
+
+    def __init__(self, token, interval, timeframe, heikinashi=False, loglevel=3, capacity=1440, cache=None, incremental=True, verify_interval=0, shards=None, history=None, renderer=None, load=True, orders=None, entry_weight=5, exit_weight=-5, timeframes=(), source=None, kernels="auto", backfill=True):
+
+        """ The chart, indicators, signals and bookie of one symbol and interval.
+
+            Every kline stream (like SOLUSDT@1m) gets its own Stream, so one process can follow
+            many symbols and intervals. Its candles must be handed to candle_closed one at a time,
+            in order. Candles that are not newer than the last closed one of the chart are skipped.
+
+            With <shards> (a ShardPool), the chart lives in shared memory, and the indicators and
+            signals are evaluated by a worker process instead of in this one.
+
+            With <history> (a HistoryStore), every closed candle is stored with its indicator columns,
+            along with the signals that were raised or dropped on it.
+
+            With <renderer> (a ChartRenderer), an image of the chart is exported after every candle,
+            as often as the renderer allows.
+
+            With <orders> (an OrderEngine), the bookie places orders when the total weight of the
+            signals reaches <entry_weight>, or drops to <exit_weight>. Every closed candle is
+            handed to the engine as well, so a simulated exchange can fill orders against it.
+
+            Without <load>, the chart is created later by load_history(), which may run on another
+            thread while the websocket is already connected. Candles that close before then are
+            held back, and processed once the history is there.
+
+            candle_updated() evaluates the signals on an update of the kline that is still open, as
+            provisional results. It needs the incremental indicators in this process, so streams
+            with <shards> or without <incremental> ignore the updates.
+
+            Every interval in <timeframes> gets a Stream of its own, whose chart is resampled from
+            this one: its history from the same download, and its candles as the candles of this
+            stream close. Those streams have this one as their <source>, and are in <derived>.
+
+            Candles that are missing before a closed one are fetched from the REST API, unless
+            <backfill> is disabled (for replays, which must not depend on the network). Then the
+            gap is logged, and left in the chart.
+        """
+
+        self.token          = token
+        self.interval       = interval
+        self.incremental    = incremental
+        self.shards         = shards
+        self.history        = history
+        self.renderer       = renderer
+        self.orders         = orders
+
+        self.log            = Logger(name="{}-{}".format(token, interval), loglevel=loglevel)
+
+        self.indicators     = Indicators(loglevel=loglevel, verify_interval=verify_interval, kernels=kernels)
+        self.signals        = Signals(loglevel=loglevel)
+        self.bookie         = Bookie(self.signals, entry_weight, exit_weight, orders.exchange.fee if orders is not None else 0.001, orders)
+
+        # A shared chart needs all of its columns up front: prices, Heikin Ashi shape and indicators
+        buffer = None
+
+        if shards is not None:
+            columns = ["open", "high", "low", "close", "volume"]
+            columns += ["bodysize", "upperwick", "lowerwick"] if heikinashi else []
+            columns += self.indicators.registry.outputs()
+
+            buffer  = ChartBuffer.shared(capacity, columns)
+
+        self.candles        = Candles(token, interval, timeframe, heikinashi=heikinashi, loglevel=loglevel, capacity=capacity, cache=cache, buffer=buffer, load=False, source=source.candles if source is not None else None)
+
+        # Candles that closed while the history was loading, and the lock that hands them over
+        self.ready          = False
+        self.early          = []
+        self.lock           = threading.Lock()
+
+        self.evaluations    = 0
+
+        # Results of the last update of the forming candle, as (opentime, weight, bullish, active), until it closes
+        self.provisional    = None
+
+        # Candles that were missing from the websocket and filled in from the REST API
+        self.backfill       = backfill
+        self.step           = interval_to_milliseconds(interval)
+        self.backfilled     = 0
+
+        # Candles that came in after a newer one, and were skipped
+        self.stale          = 0
+
+        # Signals that were active after the last stored candle, by name
+        self.stored_signals = {}
+
+        # Time spent per stage of candle_closed
+        self.timings        = {stage: metrics.histogram("trader_stage_seconds", stage=stage, stream="{}@{}".format(*self.key)) for stage in ("backfill", "append", "indicators", "signals", "evaluate", "orders", "persist", "output", "provisional")}
+
+        metrics.gauge("trader_candles_backfilled_total", lambda: self.backfilled, stream="{}@{}".format(*self.key))
+
+        self.derived        = {
+            derived: Stream(
+                token, derived, timeframe,
+                heikinashi=heikinashi, loglevel=loglevel, capacity=capacity, cache=cache,
+                incremental=incremental, verify_interval=verify_interval, kernels=kernels,
+                shards=shards, history=history, renderer=renderer, orders=orders,
+                entry_weight=entry_weight, exit_weight=exit_weight, backfill=backfill, load=False, source=self
+            )
+            for derived in timeframes
+        }
+
+        if load:
+            self.load_history()
+
+
+    # Name of the stream, as used by the Binance websocket API
+    @property
+    def name(self):
+        return "{}@kline_{}".format(self.token.lower(), self.interval)
+
+    # Key of the stream, as found in the "s" and "i" fields of a kline
+    @property
+    def key(self):
+        return (self.token.upper(), self.interval)
+
+    # Handles a closed kline. Its prices may be numeric strings, as sent by Binance, or floats, as
+    # returned by the KlineDecoder, which are written to the chart without further conversion.
+    def candle_closed(self, candle):
+
+        with self.lock:
+
+            if not self.ready:
+                self.early.append(candle)
+                return
+
+            self.process(candle)
+
+    # Creates the chart from the history, for a Stream that was created without <load>, and processes the candles
+    # that closed in the meantime. Candles that the history already has are skipped. With <klines> (an (n, 7) array),
+    # the chart is created from those instead of the history of the timeframe.
+    def load_history(self, klines=None):
+
+        self.candles.create_chart(klines)
+
+        # The sharded indicators are warmed up by their worker, on its first request
+        if self.shards is None:
+            self.indicators.warm_up(self.candles.buffer)
+
+        for stream in self.derived.values():
+            stream.load_history()
+
+        with self.lock:
+
+            last = self.candles.buffer.last("opentime") if len(self.candles.buffer) > 0 else -1
+
+            # The history only has closed candles, so the ones it already has are the same
+            for candle in self.early:
+                if candle["t"] > last:
+                    self.process(candle)
+
+            self.log.info("History loaded, {} candles came in meanwhile", len(self.early))
+
+            self.early = []
+            self.ready = True
+
+    # Evaluates an update of the kline that is still open on the forming last row of the chart. The indicators are calculated from
+    # their running state without changing it, and the signals without changing the active ones, so nothing needs to be undone
+    # when the candle closes. Returns the provisional (weight, bullish, active), or None if the update was ignored.
+    def candle_updated(self, candle):
+
+        with self.lock:
+
+            if not self.ready or self.shards is not None or not self.incremental:
+                return None
+
+            # An update of the next candle while the previous one hasn't closed here yet (it is on its way, or missing)
+            if candle["t"] > self.candles.last_closed() + self.step:
+                return None
+
+            with self.timings["provisional"].time():
+
+                if not self.candles.set_forming(candle["t"], float(candle["o"]), float(candle["h"]), float(candle["l"]), float(candle["c"]), float(candle["v"]), candle["T"]):
+                    return None
+
+                if not self.indicators.peek(self.candles.buffer):
+                    return None
+
+                weight, bullish, active = self.signals.peek(self.candles.buffer)
+
+            previous = self.provisional
+            self.provisional = (candle["t"], weight, bullish, active)
+
+            # Logged when the signals change, as the updates come in every second or so
+            if previous is None or previous[0] != candle["t"] or [signal[0] for signal in previous[3]] != [signal[0] for signal in active]:
+                self.log.info("Provisional total weight of signals: {} ({})", weight, lambda: ", ".join(signal[0] for signal in active) or "no signals")
+
+            return weight, bullish, active
+
+    def process(self, candle):
+
+        # A candle that the chart already has (a repeat after a reconnect, or one from before the history of a replay) would
+        # otherwise be appended out of order
+        if candle["t"] <= self.candles.last_closed():
+            self.stale += 1
+            self.log.debug("Skipping candle {}, the chart is at {} already", candle["t"], self.candles.last_closed())
+            return
+
+        # The forming row of the provisional results makes way for the closed candle
+        self.candles.drop_forming()
+        self.provisional = None
+
+        candle_opentime     = candle["t"]
+        candle_open         = float(candle["o"])
+        candle_close        = float(candle["c"])
+        candle_high         = float(candle["h"])
+        candle_low          = float(candle["l"])
+        candle_volume       = float(candle["v"])
+        candle_closetime    = candle["T"]
+
+        with self.timings["backfill"].time():
+            filled = self.fill_gap(candle_opentime)
+
+        with self.timings["append"].time():
+            appended = self.candles.add_candle(candle_opentime, candle_open, candle_high, candle_low, candle_close, candle_volume, candle_closetime)
+
+        # Rows that were filled in have no indicator values yet, so the whole chart is recalculated once, as for a replaced row.
+        # In a shard, this is the whole round trip to the worker process.
+        with self.timings["evaluate"].time():
+            weight, bullish, active = self.shards.evaluate(self.key, self.candles.buffer, appended and not filled) if self.shards is not None else self.evaluate(appended and not filled)
+
+        self.evaluations += 1
+
+        # Only queues the candle and the decision, the orders are placed on the event loop
+        if self.orders is not None:
+            with self.timings["orders"].time():
+                self.trade(candle_opentime, candle_open, candle_high, candle_low, candle_close, weight)
+
+        if self.history is not None:
+            with self.timings["persist"].time():
+                self.persist(candle_opentime, active)
+
+        with self.timings["output"].time():
+            self.output(candle_open, candle_high, candle_low, candle_close, candle_volume, weight, bullish, active)
+
+            if self.renderer is not None:
+                self.renderer.submit(self.key, self.candles.buffer)
+
+        # The candles of the derived streams that closed with this one, including any that were filled in
+        for candle in self.candles.closed_timeframes():
+            self.derived[candle["i"]].candle_closed(candle)
+
+    # Hands a closed candle to the order engine, and the decision of the bookie on it. The prices are the real ones, also on a Heikin Ashi chart.
+    def trade(self, opentime, candle_open, candle_high, candle_low, candle_close, weight):
+
+        self.orders.market(self.key[0], self.interval, {"opentime": opentime, "open": candle_open, "high": candle_high, "low": candle_low, "close": candle_close})
+
+        decision = self.bookie.evaluate_trading_opportunity(weight)
+
+        if decision is not None:
+            self.bookie.place_order(decision, self.key[0], self.interval, opentime, candle_close)
+
+    def output(self, candle_open, candle_high, candle_low, candle_close, candle_volume, weight, bullish, active):
+
+        self.log.console("\n")
+
+        self.log.info("Candle closed at {}. O: {}, H: {}, L: {} V: {}", candle_close, candle_open, candle_high, candle_low, candle_volume)
+        self.log.info("Market is bullish") if bullish else self.log.info("Market is bearish")
+        self.log.info("Total weight of signals: {}", weight)
+
+        self.log.console("\n")
+
+        for name, action, description, signal_weight, value in active:
+            self.log.info("[{}] {} (weight: {})", action, description, signal_weight)
+
+        self.log.console("\n")
+
+        # The last row straight from the buffer. Printing chart.tail(1) would build and render a DataFrame for every candle.
+        self.log.console("  ".join("{}: {}".format(name, value) for name, value in self.candles.buffer.row().items()))
+
+    # Stores the rows of the chart that are newer than the last stored one (usually just the candle that closed, but the
+    # whole history on the first run) with their indicator columns, and the signals that changed with the candle.
+    def persist(self, opentime, active):
+
+        buffer = self.candles.buffer
+
+        try:
+            first = np.searchsorted(buffer["opentime"], self.history.last_opentime(*self.key), side="right")
+            self.history.append(*self.key, {name: buffer[name][first:] for name in buffer.columns})
+
+            current = {name: (weight, value) for name, action, description, weight, value in active}
+            events  = [(name, True, weight, value) for name, (weight, value) in current.items() if name not in self.stored_signals]
+            events += [(name, False, weight, np.nan) for name, (weight, value) in self.stored_signals.items() if name not in current]
+
+            self.history.record_signals(*self.key, opentime, events)
+            self.stored_signals = current
+
+        except Exception as e:
+            self.log.error("Unable to store candle {}: {}", opentime, e)
+
+    # Fills the candles between the last one of the chart and the one that opens at <opentime>, if any are missing,
+    # for example after a reconnect of the websocket. They are fetched from the REST API in one go, and added in order.
+    # Returns the number of candles that were added.
+    def fill_gap(self, opentime):
+
+        if len(self.candles.buffer) == 0:
+            return 0
+
+        last = int(self.candles.buffer.last("opentime"))
+
+        if opentime <= last + self.step:
+            return 0
+
+        if not self.backfill:
+            self.log.warning("{} candles are missing before {}, continuing with a gap in the chart", (opentime - last) // self.step - 1, opentime)
+            return 0
+
+        self.log.warning("{} candles are missing before {}, fetching them", (opentime - last) // self.step - 1, opentime)
+
+        try:
+            klines = self.candles.get_klines_between(last + self.step, opentime - 1)
+        except Exception as e:
+            self.log.error("Unable to fetch the missing candles, continuing with a gap in the chart: {}", e)
+            return 0
+
+        filled = 0
+
+        # Binance may return klines at the edges of the range, which are already there or still to come
+        for kline in klines:
+            if last < kline[0] < opentime:
+                self.candles.add_candle(int(kline[0]), *kline[1:6], int(kline[6]))
+                filled += 1
+
+        self.backfilled += filled
+        self.log.info("Filled {} missing candles", filled)
+
+        return filled
+
+    # Releases the shared chart, if there is one
+    def close(self):
+
+        for stream in self.derived.values():
+            stream.close()
+
+        self.candles.buffer.close(unlink=True)
+
+    # Calculates the indicators and checks the signals in this process
+    def evaluate(self, appended):
+
+        with self.timings["indicators"].time():
+
+            # The signals read the columns straight from the buffer. Only the pandas calculations need the chart view,
+            # which shares memory with the buffer, so they work on the same rows without copying.
+            chart = self.candles.buffer
+
+            if self.incremental:
+
+                # A replaced row invalidates the running state, so the whole chart is recalculated once
+                self.indicators.update(chart) if appended else self.indicators.warm_up(chart)
+
+            else:
+                chart = self.candles.chart
+                self.indicators.calculate(chart)
+
+        with self.timings["signals"].time():
+            self.signals.check(chart)
+
+        return self.signals.results()
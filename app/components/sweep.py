@@ -0,0 +1,270 @@
+import configparser, itertools, multiprocessing, time
+import numpy as np
+import pandas as pd
+
+from components.logger import Logger
+from components.registry import IndicatorRegistry
+from components.kernels import load_kernels
+from components.signals import Signals
+from components.backtest import positions, simulate, count_trades, max_drawdown, market_prices
+
+
+# Parameters that change the indicator columns. The defaults are the strategy as configured.
+INDICATOR_PARAMETERS = {
+    "stochastic_window":    [14],
+    "stochastic_smoothing": [3],
+    "macd_fast":            [12],
+    "macd_slow":            [26],
+    "macd_signal":          [9],
+    "moving_averages":      [(200, 100, 50, 20)]
+}
+
+# Parameters that only change how the signals are weighed. These are evaluated in batches.
+RULE_PARAMETERS = {
+    "oversold":             [20],
+    "overbought":           [80],
+    "entry":                [5],
+    "exit":                 [-5],
+    "stochastic_weight":    [1],
+    "average_weight":       [1],
+    "volume_weight":        [1],
+    "macd_weight":          [1]
+}
+
+# Indicators of Signals, in the order of the weight parameters above
+WEIGHTED_INDICATORS = ["stochastic", "average", "volume", "macd"]
+
+# Smallest drawdown that a score is divided by, so a run that barely moved doesn't get an inflated score
+MIN_DRAWDOWN = 0.01
+
+# Chart with every indicator variant of the running sweep, the prices it fills at, and the sweep itself.
+# Set before the workers are forked, so they share the chart instead of receiving a copy.
+shared = {}
+
+
+class Sweep:
+
+    def __init__(self, grid=None, fee=0.001, slippage=0.0, processes=4, batch_size=2**21, loglevel=3, kernels="auto"):
+
+        """ Grid search over the parameters of the indicators and signals, using the backtest simulation.
+
+            <grid> maps parameter names (see INDICATOR_PARAMETERS and RULE_PARAMETERS) to the values
+            to try. Parameters that are left out keep their configured value. Every combination is
+            backtested over the same chart, and the results are ranked by their score (see score()).
+
+            The work is split in two levels. Every distinct indicator column (each SMA, EMA, rolling
+            max and min) is calculated once up front, and shared by all variants that need it.
+            Every combination of indicator parameters (a variant) is then evaluated by a process
+            pool, and within a variant, all combinations of thresholds, weights and entry and exit
+            levels are simulated together as (bars, strategies) arrays of at most <batch_size>
+            elements.
+
+            The indicator columns are calculated with the kernels of a backend (see kernels.py), or
+            with pandas if <kernels> is "pandas".
+        """
+
+        self.grid       = {name: list(values) for name, values in {**INDICATOR_PARAMETERS, **RULE_PARAMETERS, **(grid or {})}.items()}
+        self.fee        = fee
+        self.slippage   = slippage
+        self.processes  = processes
+        self.batch_size = batch_size
+        self.loglevel   = loglevel
+        self.kernels    = kernels
+        self.log        = Logger(name="sweep", loglevel=loglevel)
+
+        unknown = set(self.grid) - set(INDICATOR_PARAMETERS) - set(RULE_PARAMETERS)
+
+        if unknown:
+            raise ValueError("Unknown sweep parameters: {}".format(", ".join(sorted(unknown))))
+
+
+    # Combinations of the indicator parameters. MACD variants with a fast period that isn't faster than the slow one are skipped.
+    def variants(self):
+
+        names = list(INDICATOR_PARAMETERS)
+
+        for values in itertools.product(*(self.grid[name] for name in names)):
+
+            variant = dict(zip(names, values))
+
+            if variant["macd_fast"] < variant["macd_slow"]:
+                yield variant
+
+    # Combinations of the rule parameters, as an array with one row per strategy. The thresholds are stored as indices into the grid.
+    def strategies(self):
+
+        axes = [range(len(self.grid["oversold"])), range(len(self.grid["overbought"]))]
+        axes += [self.grid[name] for name in list(RULE_PARAMETERS)[2:]]
+
+        return np.array(list(itertools.product(*axes)), dtype=np.float64)
+
+    # Indicator configuration with every column that any variant needs. Columns that only differ by a parameter get its value in their name.
+    def indicators(self):
+
+        config   = configparser.ConfigParser()
+        periods  = sorted({period for periods in self.grid["moving_averages"] for period in periods})
+
+        for window, smoothing in itertools.product(self.grid["stochastic_window"], self.grid["stochastic_smoothing"]):
+            config["stochastic-{}-{}".format(window, smoothing)] = {"type": "stochastic", "window": window, "smoothing": smoothing, "k": "stoch_k-{}".format(window), "d": "stoch_d-{}-{}".format(window, smoothing)}
+
+        for fast, slow, signal in itertools.product(self.grid["macd_fast"], self.grid["macd_slow"], self.grid["macd_signal"]):
+            if fast < slow:
+                config["macd-{}-{}-{}".format(fast, slow, signal)] = {"type": "macd", "fast": fast, "slow": slow, "signal": signal, "output": "MACD-{}-{}".format(fast, slow), "signal_output": "MACD-S-{}-{}-{}".format(fast, slow, signal)}
+
+        for period in periods:
+            config["SMA-{}-close".format(period)] = {"type": "sma", "period": period, "source": "close"}
+
+        config["SMA-20-volume"] = {"type": "sma", "period": 20, "source": "volume"}
+
+        return config
+
+    # Runs the sweep over a chart (a DataFrame of klines), and returns the results ranked from best to worst. The fills are
+    # simulated at the prices of <klines> (the (n, 7) array the chart was created from, with the real prices of a Heikin Ashi
+    # chart), or at the prices of the chart without them.
+    def run(self, chart, klines=None):
+
+        started  = time.time()
+
+        registry = IndicatorRegistry(self.indicators(), ["open", "high", "low", "close", "volume"])
+        columns  = {name: np.ascontiguousarray(chart[name], dtype=np.float64) for name in ["open", "high", "low", "close", "volume"]}
+        kernels  = load_kernels(self.kernels)
+
+        if kernels is not None:
+            frame = pd.DataFrame(registry.compute(columns, kernels), copy=False)
+        else:
+            frame = pd.DataFrame(columns, copy=False)
+
+            for node in registry:
+                node.calculate(frame)
+
+        variants = list(self.variants())
+        self.log.info("Calculated {} indicator columns in {:.1f}s. Evaluating {} variants of {} strategies", len(registry.outputs()), time.time() - started, len(variants), lambda: len(self.strategies()))
+
+        shared["chart"]  = frame
+        shared["prices"] = market_prices(chart, klines)
+        shared["sweep"]  = self
+
+        try:
+            if self.processes > 1:
+                with multiprocessing.get_context("fork").Pool(self.processes) as pool:
+                    results = [result for results in pool.imap_unordered(evaluate_variant, variants) for result in results]
+            else:
+                results = [result for variant in variants for result in evaluate_variant(variant)]
+
+        finally:
+            shared.clear()
+
+        results.sort(key=lambda result: (result["score"], result["pnl"]), reverse=True)
+
+        self.log.info("Evaluated {} strategies in {:.1f}s", len(results), time.time() - started)
+
+        return results
+
+
+# Evaluates every strategy of one indicator variant, in batches. Runs in a worker process.
+def evaluate_variant(variant):
+
+    chart   = shared["chart"]
+    sweep   = shared["sweep"]
+
+    window, smoothing   = variant["stochastic_window"], variant["stochastic_smoothing"]
+    fast, slow, signal  = variant["macd_fast"], variant["macd_slow"], variant["macd_signal"]
+    averages            = ["SMA-{}-close".format(period) for period in variant["moving_averages"]]
+
+    # The variant's columns under the names that Signals expects
+    columns = {name: chart[name].to_numpy() for name in ["open", "high", "low", "close", "volume", "SMA-20-volume"] + averages}
+    columns.update({
+        "stoch_k":  chart["stoch_k-{}".format(window)].to_numpy(),
+        "stoch_d":  chart["stoch_d-{}-{}".format(window, smoothing)].to_numpy(),
+        "MACD":     chart["MACD-{}-{}".format(fast, slow)].to_numpy(),
+        "MACD-S":   chart["MACD-S-{}-{}-{}".format(fast, slow, signal)].to_numpy()
+    })
+
+    view    = pd.DataFrame(columns, copy=False)
+    signals = Signals(loglevel=sweep.loglevel, moving_averages=averages)
+
+    active, values, direction = signals.evaluate(view)
+
+    # Weight of every indicator's signals per bar, without the stochastic thresholds, which are evaluated per threshold below
+    oversold_id     = signals.ids["stochastic_oversold"]
+    overbought_id   = signals.ids["stochastic_overbought"]
+
+    weights = signals.weights.copy()
+    weights[[oversold_id, overbought_id]] = 0
+
+    indicators      = np.array([definition.indicator for definition in signals.definitions])
+    contributions   = np.stack([active @ np.where(indicators == indicator, weights, 0) for indicator in WEIGHTED_INDICATORS], axis=1)
+
+    k, d = columns["stoch_k"][:, None], columns["stoch_d"][:, None]
+    oversold_levels, overbought_levels = np.array(sweep.grid["oversold"]), np.array(sweep.grid["overbought"])
+
+    oversold        = ((k < oversold_levels) & (d < oversold_levels)) * signals.weights[oversold_id]
+    overbought      = ((k > overbought_levels) & (d > overbought_levels)) * signals.weights[overbought_id]
+
+    openprice, closeprice = shared["prices"]
+
+    strategies  = sweep.strategies()
+    batch       = max(1, sweep.batch_size // len(view))
+    results     = []
+
+    for first in range(0, len(strategies), batch):
+
+        rules = strategies[first:first + batch]
+
+        oversold_index, overbought_index    = rules[:, 0].astype(int), rules[:, 1].astype(int)
+        entry, exit, scales                 = rules[:, 2], rules[:, 3], rules[:, 4:]
+
+        total = contributions @ scales.T + (oversold[:, oversold_index] + overbought[:, overbought_index]) * scales[:, 0]
+
+        held, equity = simulate(positions(total, entry, exit), openprice, closeprice, sweep.fee + sweep.slippage)
+
+        pnl         = equity[-1] - 1
+        drawdown    = max_drawdown(equity)
+        trades      = count_trades(held)
+        scores      = score(pnl, drawdown)
+
+        for index, rule in enumerate(rules):
+
+            result = dict(variant, moving_averages=" ".join(str(period) for period in variant["moving_averages"]))
+            result.update({
+                "oversold":         sweep.grid["oversold"][oversold_index[index]],
+                "overbought":       sweep.grid["overbought"][overbought_index[index]]
+            })
+            result.update(zip(list(RULE_PARAMETERS)[2:], rule[2:].tolist()))
+            result.update({
+                "pnl":              float(pnl[index]),
+                "max_drawdown":     float(drawdown[index]),
+                "trades":           int(trades[index]),
+                "score":            float(scores[index])
+            })
+
+            results.append(result)
+
+    return results
+
+# Score of backtests by their PnL and max drawdown (arrays). A gain is divided by the drawdown, and a loss multiplied by it,
+# so at the same drawdown a higher PnL always scores higher, every gain scores above every loss, and a deeper drawdown
+# makes either worse. The drawdown counts as at least MIN_DRAWDOWN.
+def score(pnl, drawdown):
+
+    drawdown = np.maximum(drawdown, MIN_DRAWDOWN)
+    return np.where(pnl >= 0, pnl / drawdown, pnl * drawdown)
+
+# Reads a sweep grid from a ConfigParser section. Values are comma separated. The moving averages are
+# sets of periods, separated by "|": 200 100 50 20 | 100 50 20
+def read_grid(section):
+
+    grid = {}
+
+    for name, value in section.items():
+
+        if name == "moving_averages":
+            grid[name] = [tuple(int(period) for period in periods.split()) for periods in value.split("|")]
+
+        elif name in INDICATOR_PARAMETERS:
+            grid[name] = [int(number) for number in value.split(",")]
+
+        else:
+            grid[name] = [float(number) for number in value.split(",")]
+
+    return grid
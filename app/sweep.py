@@ -0,0 +1,63 @@
+import sys, configparser, argparse, json
+
+import pandas as pd
+
+from components.logger import flush
+from components.klinecache import KlineCache
+from components.backtest import load_klines, create_chart
+from components.sweep import Sweep, read_grid
+
+
+#
+# Grid search over the indicator and signal parameters in config/sweep.ini, on the kline cache or a local file.
+#
+# python sweep.py SOLUSDT 1m
+# python sweep.py SOLUSDT 1m --file klines.npy --processes 8 --top 20 --output results.csv
+#
+
+config = configparser.ConfigParser()
+config.read("config/config.ini")
+config.read("config/sweep.ini")
+
+parser = argparse.ArgumentParser(description="Backtest every combination of the parameters in config/sweep.ini")
+parser.add_argument("token", help="Symbol, like SOLUSDT")
+parser.add_argument("interval", help="Kline interval, like 1m")
+parser.add_argument("--file", help="Klines as .npy or .csv (opentime, open, high, low, close, volume, closetime) instead of the kline cache")
+parser.add_argument("--processes", type=int, default=4, help="Number of worker processes")
+parser.add_argument("--top", type=int, default=10, help="Number of results to print")
+parser.add_argument("--output", help="Write all results to this .csv file")
+
+args = parser.parse_args()
+
+heikinashi  = config.getboolean("trading", "heikinashi", fallback=False)
+loglevel    = config.getint("logging", "loglevel", fallback=2)
+kernels     = config.get("indicators", "kernels", fallback="auto")
+
+fee         = config.getfloat("backtest", "fee", fallback=0.001)
+slippage    = config.getfloat("backtest", "slippage", fallback=0.0)
+grid        = read_grid(config["grid"]) if config.has_section("grid") else {}
+
+
+def historical_klines():
+
+    if args.file is None:
+        return KlineCache(config.get("cache", "directory", fallback="cache"), loglevel=loglevel).read(args.token.upper(), args.interval)
+
+    return load_klines(args.file)
+
+
+if __name__ == "__main__":
+
+    klines = historical_klines()
+
+    if len(klines) < 2:
+        sys.exit("No klines found for {} {}".format(args.token, args.interval))
+
+    results = Sweep(grid, fee, slippage, args.processes, loglevel=loglevel, kernels=kernels).run(create_chart(klines, heikinashi), klines)
+
+    if args.output is not None:
+        pd.DataFrame(results).to_csv(args.output, index=False)
+
+    # The results come after the log lines of the run
+    flush()
+    print(json.dumps(results[:args.top], indent=4))
@@ -0,0 +1,4 @@
+import os, sys
+
+# The components are imported as in app.py, from the app directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from components.backtest import Backtest, create_chart
+from components.bookmaker import Bookie
+from components.indicators import Indicators
+from components.signals import Signals
+from components.sweep import Sweep
+from benchmarks.synthetic import SyntheticMarket
+
+
+def backtest(klines, heikinashi, entry=2, exit=-2):
+
+    chart = create_chart(klines, heikinashi)
+    Indicators(loglevel=-1).calculate(chart)
+
+    signals  = Signals(loglevel=-1)
+    backtest = Backtest(signals, Bookie(signals, entry, exit, 0.001), loglevel=-1)
+
+    return backtest, backtest.run(chart, klines)
+
+# On a Heikin Ashi chart, the signals see the Heikin Ashi prices, and the orders fill at the real ones
+def test_heikin_ashi_fills_at_the_real_prices():
+
+    klines              = SyntheticMarket(volatility=0.01).klines(2000)
+    result, summary     = backtest(klines, heikinashi=True)
+
+    assert summary["trades"] > 0
+    assert summary["buy_and_hold"] == pytest.approx(klines[-1, 4] / klines[0, 1] - 1)
+
+    # Trades are entered and exited at the real opening prices. One that is still open at the end is left out.
+    for entry, exit, returns in result.trades[:-1]:
+        assert returns == pytest.approx(klines[exit, 1] / klines[entry, 1] * 0.999 ** 2 - 1)
+
+def test_sweep_fills_at_the_real_prices():
+
+    klines  = SyntheticMarket(volatility=0.01).klines(2000)
+    chart   = create_chart(klines, True)
+
+    # The sweep of the configured strategy gives the PnL of the backtest
+    results = Sweep({"entry": [2], "exit": [-2]}, processes=1, loglevel=-1).run(chart, klines)
+    summary = backtest(klines, heikinashi=True)[1]
+
+    assert len(results) == 1
+    assert results[0]["pnl"] == pytest.approx(summary["pnl"])
+    assert results[0]["pnl"] != pytest.approx(Sweep({"entry": [2], "exit": [-2]}, processes=1, loglevel=-1).run(chart)[0]["pnl"])
@@ -0,0 +1,38 @@
+import numpy as np
+
+from components.candles import Candles, heikin_ashi, heikin_ashi_candle
+from benchmarks.synthetic import SyntheticMarket, SyntheticCache
+
+
+# The vectorized Heikin Ashi chart is the recursion of heikin_ashi_candle(), applied bar by bar
+def test_heikin_ashi_matches_the_recursion():
+
+    klines  = SyntheticMarket(volatility=0.01).klines(500)
+    chart   = heikin_ashi(*(klines[:, column] for column in (1, 2, 3, 4)))
+
+    # The first bar has no previous one, its own open and close stand in for it. Wicks and bodies are differences
+    # of prices, so they are compared with an absolute tolerance as well.
+    previous = (klines[0, 1], klines[0, 4])
+
+    for index, kline in enumerate(klines):
+
+        candle   = heikin_ashi_candle(*previous, *kline[1:5])
+        previous = (candle["open"], candle["close"])
+
+        for name, value in candle.items():
+            assert np.isclose(chart[name][index], value, rtol=1e-9, atol=1e-9), (index, name)
+
+# Closed candles extend a Heikin Ashi history like the vectorized chart over all of them
+def test_heikin_ashi_candles_continue_the_history():
+
+    market  = SyntheticMarket(volatility=0.01)
+    klines  = market.klines(350)
+    candles = Candles(market.symbol, market.interval, "1 day ago UTC", heikinashi=True, loglevel=-1, cache=SyntheticCache(market, 300))
+
+    for kline in klines[300:]:
+        candles.add_candle(int(kline[0]), *kline[1:6], int(kline[6]))
+
+    chart   = heikin_ashi(*(klines[:, column] for column in (1, 2, 3, 4)))
+
+    for name, values in chart.items():
+        assert np.allclose(candles.buffer[name], values, rtol=1e-9, atol=1e-9), name
@@ -0,0 +1,113 @@
+import numpy as np
+import pytest
+
+from components.chartbuffer import ChartBuffer
+
+
+def row(number):
+    return {"opentime": number * 60000, "open": number, "high": number + 1, "low": number - 1, "close": number + 0.5, "volume": 10 * number, "closetime": number * 60000 + 59999}
+
+
+def test_keeps_the_newest_rows_across_wraps():
+
+    buffer = ChartBuffer(capacity=5)
+
+    # The arrays hold twice the capacity, so the rows are copied back to the front every few appends
+    for number in range(23):
+
+        buffer.append(row(number))
+
+        newest = list(range(max(0, number - 4), number + 1))
+
+        assert len(buffer) == len(newest)
+        assert list(buffer["open"]) == newest
+        assert list(buffer["opentime"]) == [number * 60000 for number in newest]
+        assert buffer.last("close") == number + 0.5
+        assert buffer.end <= buffer.size
+
+def test_replaces_and_drops_the_last_row():
+
+    buffer = ChartBuffer(capacity=3)
+
+    for number in range(4):
+        buffer.append(row(number))
+
+    buffer.replace_last(row(10))
+    assert list(buffer["open"]) == [1, 2, 10]
+
+    buffer.drop_last()
+    assert list(buffer["open"]) == [1, 2]
+    assert buffer.row()["open"] == 2
+
+def test_new_columns_are_nan_before_they_exist():
+
+    buffer = ChartBuffer(capacity=4)
+
+    for number in range(6):
+        buffer.append(row(number))
+
+        if number == 4:
+            buffer.set_last("SMA-2-close", 1.0)
+
+    assert "SMA-2-close" in buffer
+    assert np.isnan(buffer["SMA-2-close"][:2]).all()
+    assert buffer["SMA-2-close"][2] == 1.0
+
+    # A column that an appended row leaves out is NaN for that row
+    assert np.isnan(buffer["SMA-2-close"][3])
+
+def test_load_keeps_the_newest_rows():
+
+    buffer  = ChartBuffer(capacity=4)
+    rows    = [row(number) for number in range(10)]
+
+    buffer.load({name: np.array([row[name] for row in rows]) for name in rows[0]})
+
+    assert list(buffer["open"]) == [6, 7, 8, 9]
+
+    buffer.append(row(10))
+
+    assert list(buffer["open"]) == [7, 8, 9, 10]
+
+def test_frame_shares_memory_with_the_buffer():
+
+    buffer = ChartBuffer(capacity=4)
+
+    for number in range(3):
+        buffer.append(row(number))
+
+    frame = buffer.frame()
+
+    assert list(frame.columns) == ["opentime", "open", "high", "low", "close", "volume", "closetime"]
+    assert frame["opentime"].iloc[-1] == np.datetime64(2 * 60000, "ms")
+
+    buffer.set_last("close", 99.0)
+
+    assert frame["close"].iloc[-1] == 99.0
+
+def test_shared_buffers_are_seen_by_attached_ones():
+
+    columns = ["open", "high", "low", "close", "volume", "SMA-2-close"]
+    buffer  = ChartBuffer.shared(5, columns)
+
+    try:
+        for number in range(12):
+            buffer.append(row(number))
+
+        attached = ChartBuffer.attach(buffer.shm.name, 5, columns)
+
+        # The window isn't shared, the owner hands it over
+        attached.start, attached.end = buffer.start, buffer.end
+
+        assert list(attached["open"]) == list(range(7, 12))
+
+        attached.set_last("SMA-2-close", 10.5)
+        assert buffer.last("SMA-2-close") == 10.5
+
+        with pytest.raises(ValueError):
+            attached.add_column("new")
+
+        attached.close()
+
+    finally:
+        buffer.close(unlink=True)
@@ -0,0 +1,223 @@
+import asyncio, time
+
+import numpy as np
+import websockets
+
+from components import connection as connection_module
+from components.connection import Connection
+from components.decoder import KlineDecoder
+from components.stream import Stream
+from benchmarks.synthetic import SyntheticMarket, SyntheticCache
+
+
+# Local websocket server that serves every connection with the next handler of <sessions>. A handler gets the websocket,
+# and the connection is closed by the server when it returns.
+async def serve(sessions):
+
+    sessions = iter(sessions)
+
+    async def handler(ws):
+        await next(sessions)(ws)
+
+    server = await websockets.serve(handler, "127.0.0.1", 0)
+    url    = "ws://127.0.0.1:{}".format(server.sockets[0].getsockname()[1])
+
+    return server, url
+
+# Waits until <condition>() holds, for at most <timeout> seconds
+async def until(condition, timeout=5.0):
+
+    deadline = time.monotonic() + timeout
+
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+def send(messages):
+
+    async def session(ws):
+        for message in messages:
+            await ws.send(message)
+
+    return session
+
+def silent(messages):
+
+    async def session(ws):
+        await send(messages)(ws)
+        await ws.wait_closed()
+
+    return session
+
+
+# Fake python-binance client for the REST API, serving the klines of a synthetic market
+class FakeClient:
+
+    def __init__(self, market, n):
+        self.klines = market.rest_klines(n)
+        self.calls  = []
+
+    def get_historical_klines(self, symbol, interval, start, end=None):
+        self.calls.append((start, end))
+        return [kline for kline in self.klines if start <= kline[0] <= (end if end is not None else kline[0])]
+
+
+def test_reconnects_after_the_server_disconnects():
+
+    received = []
+
+    async def on_message(ws, message):
+        received.append(message)
+
+    async def main():
+
+        # The first session closes the connection after two messages
+        server, url = await serve([send(["a", "b"]), silent(["c"])])
+        client      = Connection(url, on_message, reconnect_delay=0.01, loglevel=-1)
+        running     = asyncio.create_task(client.run())
+
+        await until(lambda: len(received) == 3)
+        await client.stop()
+        await running
+
+        server.close()
+        await server.wait_closed()
+
+        return client
+
+    client = asyncio.run(main())
+
+    assert received == ["a", "b", "c"]
+    assert client.connects == 2
+
+def test_drops_a_stale_connection():
+
+    received = []
+
+    async def on_message(ws, message):
+        received.append(message)
+
+    async def main():
+
+        # The first session sends one message and then stays silent, but keeps answering pings
+        server, url = await serve([silent(["a"]), silent(["b"])])
+        client      = Connection(url, on_message, reconnect_delay=0.01, stale_timeout=0.2, loglevel=-1)
+        running     = asyncio.create_task(client.run())
+
+        await until(lambda: len(received) == 2)
+        await client.stop()
+        await running
+
+        server.close()
+        await server.wait_closed()
+
+        return client
+
+    client = asyncio.run(main())
+
+    assert received == ["a", "b"]
+    assert client.connects == 2
+    assert client.failures == 1
+
+def test_keeps_reading_after_a_message_fails():
+
+    received = []
+
+    async def on_message(ws, message):
+
+        if message == "bad":
+            raise ValueError("can't handle this one")
+
+        received.append(message)
+
+    async def main():
+
+        server, url = await serve([silent(["a", "bad", "b"])])
+        client      = Connection(url, on_message, reconnect_delay=0.01, loglevel=-1)
+        running     = asyncio.create_task(client.run())
+
+        await until(lambda: len(received) == 2)
+        await client.stop()
+        await running
+
+        server.close()
+        await server.wait_closed()
+
+        return client
+
+    client = asyncio.run(main())
+
+    assert received == ["a", "b"]
+    assert (client.connects, client.errors) == (1, 1)
+
+def test_backs_off_exponentially(monkeypatch):
+
+    attempts = []
+
+    # Every attempt fails right away, and the random part of the delay is left out
+    def connect(*args, **kwargs):
+        attempts.append(time.monotonic())
+        raise OSError("refused")
+
+    monkeypatch.setattr(connection_module.websockets, "connect", connect)
+    monkeypatch.setattr(connection_module.random, "uniform", lambda low, high: high)
+
+    async def main():
+
+        client  = Connection("ws://127.0.0.1:9", None, reconnect_delay=0.05, max_reconnect_delay=0.2, loglevel=-1)
+        running = asyncio.create_task(client.run())
+
+        await until(lambda: len(attempts) == 6)
+        await client.stop()
+        await running
+
+        return client
+
+    client = asyncio.run(main())
+    gaps   = [b - a for a, b in zip(attempts, attempts[1:])]
+
+    assert client.failures >= 6
+
+    for gap, delay in zip(gaps, [0.05, 0.1, 0.2, 0.2, 0.2]):
+        assert delay * 0.9 <= gap < delay + 0.1
+
+def test_missed_candles_are_filled_in_after_a_reconnect():
+
+    market  = SyntheticMarket()
+    klines  = market.klines(320)
+    decoder = KlineDecoder()
+
+    stream  = Stream(market.symbol, market.interval, "1 day ago UTC", loglevel=-1, capacity=1000, cache=SyntheticCache(market, 300))
+    client  = FakeClient(market, 320)
+
+    stream.candles.binance = client
+
+    async def on_message(ws, message):
+
+        candle = decoder.decode(message)
+
+        if candle is not None:
+            stream.candle_closed(candle)
+
+    async def main():
+
+        # Klines 305 to 309 close while the connection is down. The second session starts with a repeat of kline 304.
+        server, url = await serve([send(market.messages(300, 305, updates=2)), silent(market.messages(304, 305, updates=2) + market.messages(310, 315, updates=2))])
+        connection  = Connection(url, on_message, reconnect_delay=0.01, loglevel=-1)
+        running     = asyncio.create_task(connection.run())
+
+        await until(lambda: stream.candles.buffer.last("opentime") == klines[314, 0])
+        await connection.stop()
+        await running
+
+        server.close()
+        await server.wait_closed()
+
+    asyncio.run(main())
+
+    opentimes = stream.candles.buffer["opentime"]
+
+    assert client.calls == [(int(klines[305, 0]), int(klines[310, 0]) - 1)]
+    assert stream.backfilled == 5
+    assert list(opentimes) == list(klines[:315, 0])
+    assert np.allclose(stream.candles.buffer["close"], klines[:315, 4])
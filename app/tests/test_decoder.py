@@ -0,0 +1,27 @@
+import pytest
+
+from components.decoder import KlineDecoder, BACKENDS
+from benchmarks.synthetic import SyntheticMarket
+
+
+@pytest.mark.parametrize("backend", sorted(BACKENDS))
+def test_decodes_closed_klines_only(backend):
+
+    market      = SyntheticMarket()
+    decoder     = KlineDecoder(backend)
+    candles     = [candle for candle in map(decoder.decode, market.messages(0, 10, updates=3)) if candle is not None]
+
+    klines      = market.klines(10)
+
+    assert [candle["t"] for candle in candles] == list(klines[:, 0])
+    assert [candle["c"] for candle in candles] == pytest.approx(list(klines[:, 4]))
+    assert (decoder.decoded, decoder.skipped) == (10, 20)
+
+@pytest.mark.parametrize("backend", sorted(BACKENDS))
+def test_skips_messages_without_a_kline(backend):
+
+    decoder     = KlineDecoder(backend)
+    messages    = ['{"result":null,"id":1}', '{"code":2,"msg":"Invalid request"}', b'{"stream":"solusdt@kline_1m","data":{"e":"error"}}', "[]", "null"]
+
+    assert [decoder.decode(message) for message in messages] == [None] * len(messages)
+    assert (decoder.decoded, decoder.skipped) == (0, len(messages))
@@ -0,0 +1,55 @@
+import sys, threading
+
+from components.history import HistoryStore, DAY
+
+
+# Streams are processed on a pool of threads, which all write to the same store
+def test_streams_write_concurrently(tmp_path):
+
+    store   = HistoryStore(str(tmp_path), loglevel=-1)
+    symbols = ["SYMBOL{}".format(number) for number in range(8)]
+    start   = 20000 * DAY - 250 * 60000
+    errors  = []
+
+    def write(symbol):
+
+        try:
+            for row in range(500):
+
+                opentime = start + row * 60000
+
+                store.append(symbol, "1m", {"opentime": [opentime], "close": [float(row)], "SMA-{}-close".format(row // 100): [float(row)]})
+                store.record_signals(symbol, "1m", opentime, [("signal-{}".format(row % 7), row % 2 == 0, 1.0, float(row))])
+
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(symbol,)) for symbol in symbols]
+
+    # Threads switch far more often than usual, so unguarded state would be caught halfway through an update
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+
+    try:
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+    finally:
+        sys.setswitchinterval(interval)
+
+    store.close()
+
+    assert errors == []
+
+    for symbol in symbols:
+
+        columns = store.read(symbol, "1m")
+        signals = store.signals(symbol, "1m")
+
+        assert len(store.list_days(symbol, "1m")) == 2
+        assert list(columns["opentime"]) == [start + row * 60000 for row in range(500)]
+        assert list(columns["close"]) == list(range(500))
+        assert [(name, active, value) for opentime, name, active, weight, value in signals] == [("signal-{}".format(row % 7), row % 2 == 0, row) for row in range(500)]
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from components.chartbuffer import ChartBuffer
+from components.indicators import Indicators
+from benchmarks.synthetic import SyntheticMarket
+
+
+def rows(klines):
+    return [dict(zip(("opentime", "open", "high", "low", "close", "volume", "closetime"), kline)) for kline in klines]
+
+
+# The incremental columns match a full recompute, also after the rows of the buffer are copied back to the front
+@pytest.mark.parametrize("kernels", ["pandas", "numpy"])
+def test_updates_match_a_full_recompute_across_wraps(kernels):
+
+    klines      = SyntheticMarket().klines(1400)
+    buffer      = ChartBuffer(capacity=400)
+    indicators  = Indicators(loglevel=-1, kernels=kernels)
+
+    buffer.load({name: klines[:400, column] for column, name in enumerate(("opentime", "open", "high", "low", "close", "volume", "closetime"))})
+    indicators.warm_up(buffer)
+
+    wraps       = 0
+
+    for number, row in enumerate(rows(klines[400:]), 1):
+
+        end = buffer.end
+        buffer.append(row)
+        wraps += buffer.end < end
+
+        indicators.update(buffer)
+
+        if number % 50 == 0:
+            assert indicators.verify(buffer) == []
+
+    assert wraps == 2
+    assert list(buffer["opentime"]) == list(klines[-400:, 0])
+
+    chart = buffer.frame().copy()
+    Indicators(loglevel=-1, kernels="pandas").calculate(chart)
+
+    for column in indicators.registry.outputs():
+        assert np.allclose(buffer[column][-100:], chart[column].to_numpy()[-100:], rtol=1e-6, atol=1e-6, equal_nan=True), column
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from components.kernels import BACKENDS, NumbaKernels
+from benchmarks.synthetic import SyntheticMarket
+
+
+# Every backend, and the Numba loops also where Numba is not installed, as plain Python
+KERNELS = dict(BACKENDS, numba=NumbaKernels)
+
+WINDOWS = [3, 14, 20, 50]
+
+# Rolling statistics as the pandas calculations of the indicators do them
+EXPECTED = {
+    "rolling_means":    lambda series, window: series.rolling(window).mean(),
+    "rolling_stds":     lambda series, window: series.rolling(window).std(ddof=0),
+    "rolling_maxs":     lambda series, window: series.rolling(window).max(),
+    "rolling_mins":     lambda series, window: series.rolling(window).min(),
+    "ewms":             lambda series, span: series.ewm(span=span, adjust=False).mean()
+}
+
+
+def prices(gaps):
+
+    values = SyntheticMarket(volatility=0.01).klines(1000)[:, 4].copy()
+
+    # Columns calculated from other indicators start with NaNs, and the rolling statistics are NaN while a window has one
+    values[:30] = np.nan
+
+    if gaps:
+        values[500] = np.nan
+
+    return values
+
+
+@pytest.mark.parametrize("backend", sorted(KERNELS))
+@pytest.mark.parametrize("kernel", sorted(EXPECTED))
+def test_kernels_match_pandas(backend, kernel):
+
+    # NaNs leave an exponential average unchanged, where pandas moves the weights on, so ewms only get the leading NaNs
+    values  = prices(gaps=kernel != "ewms")
+    results = getattr(KERNELS[backend](), kernel)(values, WINDOWS)
+
+    assert len(results) == len(WINDOWS)
+
+    for window, result in zip(WINDOWS, results):
+
+        expected = EXPECTED[kernel](pd.Series(values), window).to_numpy()
+
+        assert np.allclose(result, expected, rtol=1e-9, atol=1e-9, equal_nan=True), window
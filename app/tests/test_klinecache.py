@@ -0,0 +1,72 @@
+import time
+import numpy as np
+
+from components.klinecache import KlineCache
+
+
+STEP = 60 * 1000
+
+
+# Fake of python-binance's get_historical_klines: 1m klines from <start> until now, with the calls recorded
+class FakeFetcher:
+
+    def __init__(self):
+        self.calls      = []
+        self.fetched    = []
+
+    def __call__(self, symbol, interval, start):
+
+        now     = time.time() * 1000
+        klines  = [[t, "1", "2", "0.5", "1.5", "10", t + STEP - 1] for t in range(int(-(-start // STEP) * STEP), int(now), STEP)]
+
+        self.calls.append(start)
+        self.fetched.append(len(klines))
+
+        return klines
+
+
+def test_warm_start_only_fetches_the_tail(tmp_path):
+
+    fetcher = FakeFetcher()
+    cache   = KlineCache(str(tmp_path), fetcher, loglevel=-1)
+    start   = (time.time() * 1000 // STEP - 60) * STEP
+
+    first   = cache.load("SOLUSDT", "1m", start)
+    second  = cache.load("SOLUSDT", "1m", start)
+
+    # The second load starts after the last closed kline, so it only gets the one that is still forming
+    assert fetcher.calls[0] == start
+    assert fetcher.calls[1] == first[-2, 6] + 1
+    assert fetcher.fetched[1] <= 2
+
+    assert first[0, 0] == second[0, 0] == start
+    assert np.array_equal(first[:-1], second[:len(first) - 1])
+
+def test_cache_keeps_history_before_the_window(tmp_path):
+
+    fetcher = FakeFetcher()
+    cache   = KlineCache(str(tmp_path), fetcher, loglevel=-1)
+    now     = time.time() * 1000 // STEP * STEP
+
+    cache.load("SOLUSDT", "1m", now - 120 * STEP)
+    klines  = cache.load("SOLUSDT", "1m", now - 30 * STEP)
+    cached  = cache.read("SOLUSDT", "1m")
+
+    # The window is returned, the cache still starts at the first load
+    assert klines[0, 0] == now - 30 * STEP
+    assert cached[0, 0] == now - 120 * STEP
+    assert len(cached) >= 119
+    assert np.all(np.diff(cached[:, 0]) == STEP)
+
+def test_window_before_the_cache_is_fetched_and_merged(tmp_path):
+
+    fetcher = FakeFetcher()
+    cache   = KlineCache(str(tmp_path), fetcher, loglevel=-1)
+    now     = time.time() * 1000 // STEP * STEP
+
+    cache.load("SOLUSDT", "1m", now - 30 * STEP)
+    klines  = cache.load("SOLUSDT", "1m", now - 90 * STEP)
+
+    assert fetcher.calls[-1] == now - 90 * STEP
+    assert klines[0, 0] == now - 90 * STEP
+    assert np.all(np.diff(cache.read("SOLUSDT", "1m")[:, 0]) == STEP)
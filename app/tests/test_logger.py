@@ -0,0 +1,51 @@
+import pytest
+
+from components.logger import Logger, flush
+
+
+# Output that earlier tests left in the queue is written before the test starts
+@pytest.fixture(autouse=True)
+def drained(capsys):
+    flush()
+    capsys.readouterr()
+
+def test_flush_writes_the_queue_before_a_print(capsys):
+
+    log = Logger(name="test", loglevel=0, persist=False)
+
+    for number in range(1000):
+        log.info("Line {}", number)
+
+    flush()
+    print("results")
+
+    lines = capsys.readouterr().out.splitlines()
+
+    assert [line.split("] ")[1] for line in lines[:-1]] == ["Line {}".format(number) for number in range(1000)]
+    assert lines[-1] == "results"
+
+def test_console_output_stays_in_order_with_the_log(capsys):
+
+    log = Logger(name="test", loglevel=0, persist=False)
+
+    for number in range(100):
+        log.console("Row {}", number)
+        log.info("Line {}", number)
+
+    flush()
+
+    lines = capsys.readouterr().out.splitlines()
+
+    assert lines[0::2] == ["Row {}".format(number) for number in range(100)]
+    assert [line.split("] ")[1] for line in lines[1::2]] == ["Line {}".format(number) for number in range(100)]
+
+def test_console_output_ignores_the_loglevel(capsys):
+
+    log = Logger(name="test", loglevel=-1, persist=False)
+
+    log.info("Line")
+    log.console("Row")
+
+    flush()
+
+    assert capsys.readouterr().out == "Row\n"
@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+from components.orders import OrderEngine, SimulatedExchange, Exchange, FLAT, ENTERING
+
+
+def bar(opentime, price):
+    return {"opentime": opentime, "open": price, "high": price * 1.01, "low": price * 0.99, "close": price}
+
+
+# Runs the engine over <items>: ("buy" or "sell", opentime, price) decisions and (opentime, price) bars, in order
+def trade(engine, items):
+
+    async def main():
+
+        running = asyncio.create_task(engine.run())
+
+        for item in items:
+            if isinstance(item[0], str):
+                engine.decide("SOLUSDT", "1m", item[1], item[0], item[2])
+            else:
+                engine.market("SOLUSDT", "1m", bar(*item))
+
+        await engine.stop()
+        await running
+
+    asyncio.run(main())
+
+
+def test_trades_on_the_simulated_exchange():
+
+    exchange    = SimulatedExchange(fee=0.001)
+    engine      = OrderEngine(exchange, order_size=100.0, loglevel=-1)
+
+    # The decision is taken at the close of a candle, and filled at the opening of the next one
+    trade(engine, [(0, 10.0), ("buy", 0, 10.0), ("buy", 0, 10.0), (1, 10.0), (2, 11.0), ("sell", 2, 11.0), (3, 12.0)])
+
+    position = engine.position("SOLUSDT", "1m")
+
+    assert position.state == FLAT
+    assert position.trades == 1
+    assert position.realized == pytest.approx(10 * (12.0 - 10.0) - 100 * 0.001 - 120 * 0.001)
+
+def test_forgets_orders_once_they_are_filled():
+
+    # Without fees, the flat trades don't add up to the loss limit
+    exchange    = SimulatedExchange(fee=0.0)
+    engine      = OrderEngine(exchange, loglevel=-1)
+    items       = []
+
+    for opentime in range(0, 1000, 2):
+        items += [("buy", opentime, 10.0), (opentime + 1, 10.0), ("sell", opentime + 1, 10.0), (opentime + 2, 10.0)]
+
+    trade(engine, items)
+
+    assert engine.position("SOLUSDT", "1m").trades == 500
+    assert engine.placed == set()
+    assert exchange.orders == {}
+
+def test_keeps_open_orders():
+
+    exchange    = SimulatedExchange()
+    engine      = OrderEngine(exchange, loglevel=-1)
+
+    trade(engine, [("buy", 0, 10.0), ("buy", 0, 10.0)])
+
+    # A repeated decision on the same candle is recognized while its order is open
+    assert engine.position("SOLUSDT", "1m").state == ENTERING
+    assert len(engine.placed) == 1
+    assert len(exchange.orders) == 1
+
+class RejectingExchange(Exchange):
+
+    async def submit(self, order):
+        raise RuntimeError("rejected")
+
+def test_forgets_rejected_orders():
+
+    engine = OrderEngine(RejectingExchange(), loglevel=-1)
+
+    trade(engine, [("buy", 0, 10.0)])
+
+    assert engine.position("SOLUSDT", "1m").state == FLAT
+    assert engine.placed == set()
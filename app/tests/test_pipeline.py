@@ -0,0 +1,72 @@
+import asyncio
+import pytest
+
+from components.pipeline import Pipeline
+
+
+def candle(t, symbol="SOLUSDT"):
+    return {"s": symbol, "i": "1m", "t": t, "T": t + 59999}
+
+
+@pytest.mark.parametrize("policy", ["block", "drop", "merge"])
+def test_stop_finishes_a_full_queue(policy):
+
+    processed = []
+
+    async def main():
+
+        pipeline = Pipeline(lambda candle: processed.append(candle["t"]), maxsize=3, policy=policy, offload=False, loglevel=-1)
+
+        # The queue is filled before the processing stage runs, and stopped while it is full
+        for t in range(3):
+            await pipeline.put(candle(t * 60000))
+
+        await pipeline.stop()
+        await pipeline.run()
+
+    asyncio.run(main())
+
+    assert processed == [0, 60000, 120000]
+
+def test_candles_of_a_stream_stay_in_order():
+
+    processed = []
+
+    async def main():
+
+        pipeline    = Pipeline(lambda candle: processed.append((candle["s"], candle["t"])), maxsize=100, workers=4, loglevel=-1)
+        running     = asyncio.create_task(pipeline.run())
+
+        for t in range(50):
+            await pipeline.put(candle(t, "SOLUSDT"))
+            await pipeline.put(candle(t, "BTCUSDT"))
+
+        await pipeline.stop()
+        await running
+
+    asyncio.run(main())
+
+    for symbol in ("SOLUSDT", "BTCUSDT"):
+        assert [t for s, t in processed if s == symbol] == list(range(50))
+
+def test_replays_only_measure_the_processing_time():
+
+    pipeline = Pipeline(lambda candle: None, offload=False, loglevel=-1, lag=False)
+
+    async def main():
+
+        running = asyncio.create_task(pipeline.run())
+
+        # Candles closed long ago, as in a recording
+        for t in range(5):
+            await pipeline.put(candle(t * 60000, "REPLAYUSDT"))
+
+        await pipeline.stop()
+        await running
+
+    asyncio.run(main())
+
+    assert pipeline.processed == 5
+    assert pipeline.lags == {}
+    assert pipeline.max_latency == 0.0
+    assert pipeline.summary()["REPLAYUSDT@1m"]["count"] == 5
@@ -0,0 +1,100 @@
+import configparser
+
+import pytest
+
+from components.registry import IndicatorRegistry, Node
+
+
+def registry(text):
+
+    config = configparser.ConfigParser()
+    config.read_string(text)
+
+    return IndicatorRegistry(config, ["open", "high", "low", "close", "volume"])
+
+
+# SMA-20-close is configured on its own and needed by the Bollinger Bands, and is calculated once
+def test_shared_nodes_are_calculated_once():
+
+    nodes = registry("""
+        [SMA-20-close]
+        type = sma
+        period = 20
+        source = close
+
+        [bollinger]
+        type = bollinger
+        period = 20
+        deviations = 2
+        source = close
+    """)
+
+    assert [node.outputs for node in nodes] == [["SMA-20-close"], ["STD-20-close"], ["BBU", "BBL"]]
+
+def test_two_calculations_of_one_column_are_refused():
+
+    with pytest.raises(ValueError):
+        registry("""
+            [bollinger]
+            type = bollinger
+            period = 20
+            deviations = 2
+
+            [bollinger-3]
+            type = bollinger
+            period = 20
+            deviations = 3
+        """)
+
+# Every node comes after the nodes of its inputs, in the configured order otherwise
+def test_nodes_come_after_their_inputs():
+
+    nodes   = registry("""
+        [macd]
+        type = macd
+
+        [stochastic]
+        type = stochastic
+        window = 14
+        smoothing = 3
+
+        [EMA-12-close]
+        type = ema
+        period = 12
+        source = close
+    """)
+
+    outputs = [node.outputs[0] for node in nodes]
+
+    assert outputs == ["EMA-12-close", "EMA-26-close", "MAX-14-high", "MIN-14-low", "MACD", "stoch_k", "MACD-S", "stoch_d"]
+
+    for node in nodes:
+        for column in node.inputs:
+            assert column in ("high", "low", "close") or outputs.index(column) < outputs.index(node.outputs[0])
+
+def test_unknown_types_and_inputs_are_refused():
+
+    with pytest.raises(ValueError):
+        registry("""
+            [rsi]
+            type = rsi
+        """)
+
+    # The SMA of a column that nothing produces
+    with pytest.raises(ValueError):
+        registry("""
+            [SMA-3-RSI]
+            type = sma
+            period = 3
+            source = RSI
+        """)
+
+def test_cycles_are_refused():
+
+    nodes = IndicatorRegistry(configparser.ConfigParser(), ["close"])
+
+    nodes.add(Node(["close", "B"], ["A"]))
+    nodes.add(Node(["A"], ["B"]))
+
+    with pytest.raises(ValueError, match="cycle"):
+        nodes.sort()
@@ -0,0 +1,32 @@
+import asyncio
+
+from components.recorder import Recorder, recordings
+from components.replayer import Replayer
+from benchmarks.synthetic import SyntheticMarket
+
+
+def test_replays_a_recording(tmp_path):
+
+    market      = SyntheticMarket()
+    messages    = ['{"result":null,"id":1}'] + market.messages(0, 5, updates=2)
+
+    recorder    = Recorder(str(tmp_path), flush_interval=60, loglevel=-1)
+
+    for message in messages:
+        recorder.record(message)
+
+    recorder.close()
+
+    replayed    = []
+
+    async def on_message(ws, message):
+        replayed.append(message)
+
+    replayer    = Replayer(recordings(str(tmp_path)), on_message, speed=0, loglevel=-1)
+
+    # The reply to the subscription has no kline, and doesn't count as the start of a stream
+    assert replayer.starts() == {(market.symbol, market.interval): int(market.klines(1)[0, 0])}
+
+    asyncio.run(replayer.run())
+
+    assert replayed == messages
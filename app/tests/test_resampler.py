@@ -0,0 +1,70 @@
+import numpy as np
+
+from components.resampler import Resampler, resample
+
+
+HOUR = 60 * 60 * 1000
+
+# Base klines of 1m from <start>, with the index of every kline as its open and a volume of 1
+def klines(start, n):
+
+    index   = np.arange(n, dtype=np.float64)
+    klines  = np.column_stack([start + index * 60000, index, index + 0.5, index - 0.5, index + 0.25, np.ones(n), start + index * 60000 + 59999])
+
+    return klines
+
+def add(resampler, klines):
+    return [kline for row in klines for kline in resampler.add(int(row[0]), *row[1:6])]
+
+
+def test_continues_the_history_like_resampling_all_of_it():
+
+    base        = klines(100 * 24 * HOUR, 1000)
+    resampler   = Resampler("1h")
+
+    history     = resampler.load(base[:330])
+    closed      = add(resampler, base[330:])
+
+    assert np.array_equal(np.vstack([history, closed]), resample(base, HOUR, 60000)[0])
+
+def test_history_that_starts_within_a_kline():
+
+    # 4h klines from 1m, with a history from 10:30 to 10:59. The 08:00 kline is incomplete, and left out
+    # when the history is loaded as well as when its last base klines come in.
+    start       = 100 * 24 * HOUR
+    base        = klines(start + 10 * HOUR + 30 * 60000, 90 + 8 * 60)
+    resampler   = Resampler("4h")
+
+    assert len(resampler.load(base[:30])) == 0
+    assert resampler.current is None
+
+    closed = add(resampler, base[30:])
+
+    assert [kline[0] for kline in closed] == [start + 12 * HOUR, start + 16 * HOUR]
+    assert [kline[1] for kline in closed] == [90, 330]
+    assert [kline[5] for kline in closed] == [240, 240]
+
+def test_history_shorter_than_one_kline():
+
+    start       = 100 * 24 * HOUR
+    resampler   = Resampler("5m")
+
+    # The history starts at a boundary, so the forming kline is complete so far, and continued
+    assert len(resampler.load(klines(start, 3))) == 0
+
+    closed = add(resampler, klines(start, 10)[3:])
+
+    assert [(kline[0], kline[1], kline[4], kline[5]) for kline in closed] == [(start, 0, 4.25, 5), (start + 300000, 5, 9.25, 5)]
+
+def test_kline_that_misses_its_first_base_klines():
+
+    start       = 100 * 24 * HOUR
+    base        = klines(start, 15)
+    resampler   = Resampler("5m")
+
+    resampler.load(base[:5])
+
+    # The klines of 5 to 7 never come, so the kline of 5 is left out, instead of opening at the price of 8
+    closed = add(resampler, base[8:])
+
+    assert [kline[0] for kline in closed] == [start + 600000]
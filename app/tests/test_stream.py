@@ -0,0 +1,159 @@
+import asyncio
+
+import numpy as np
+import pytest
+import websockets
+
+from components.connection import Connection
+from components.decoder import KlineDecoder
+from components.pipeline import Pipeline
+from components.stream import Stream
+from benchmarks.synthetic import SyntheticMarket, SyntheticCache
+
+
+# Two symbols on one combined websocket, served by a local server, through the decoder and the pipeline like app.py does
+def test_streams_follow_their_own_klines_offline():
+
+    markets = [SyntheticMarket("SOLUSDT", seed=1), SyntheticMarket("BTCUSDT", seed=2, price=30000.0)]
+    streams = {(market.symbol, market.interval): Stream(market.symbol, market.interval, "1 day ago UTC", loglevel=-1, cache=SyntheticCache(market, 300)) for market in markets}
+    decoder = KlineDecoder()
+
+    # The messages of the streams interleaved, as the combined stream sends them
+    messages = [message for pair in zip(*(market.messages(300, 330, updates=3) for market in markets)) for message in pair]
+
+    def candle_closed(candle):
+        streams[(candle["s"], candle["i"])].candle_closed(candle)
+
+    async def main():
+
+        async def handler(ws):
+            for message in messages:
+                await ws.send(message)
+
+            await ws.wait_closed()
+
+        server      = await websockets.serve(handler, "127.0.0.1", 0)
+        url         = "ws://127.0.0.1:{}/stream?streams={}".format(server.sockets[0].getsockname()[1], "/".join(stream.name for stream in streams.values()))
+        pipeline    = Pipeline(candle_closed, workers=2, loglevel=-1)
+        received    = []
+
+        async def on_message(ws, message):
+
+            received.append(message)
+            candle = decoder.decode(message)
+
+            if candle is not None:
+                await pipeline.put(candle)
+
+            if len(received) == len(messages):
+                await connection.stop()
+
+        connection  = Connection(url, on_message, loglevel=-1)
+        processing  = asyncio.create_task(pipeline.run())
+
+        await connection.run()
+        await pipeline.stop()
+        await processing
+
+        server.close()
+        await server.wait_closed()
+
+    asyncio.run(main())
+
+    assert decoder.decoded == 60
+    assert decoder.skipped == 120
+
+    for market in markets:
+
+        klines = market.klines(330)
+        stream = streams[(market.symbol, market.interval)]
+
+        assert stream.evaluations == 30
+        assert list(stream.candles.buffer["opentime"]) == list(klines[:, 0])
+        assert np.allclose(stream.candles.buffer["close"], klines[:, 4])
+
+# The incremental path checks the signals on the buffer, without building a DataFrame, with the same results as the pandas path
+def test_incremental_signals_skip_the_frame(monkeypatch):
+
+    market  = SyntheticMarket()
+    streams = [Stream(market.symbol, market.interval, "1 day ago UTC", loglevel=-1, cache=SyntheticCache(market, 300), incremental=incremental) for incremental in (True, False)]
+    candles = [{"t": int(k[0]), "T": int(k[6]), "o": k[1], "h": k[2], "l": k[3], "c": k[4], "v": k[5]} for k in market.klines(340)[300:]]
+
+    def frame():
+        raise AssertionError("frame() was called")
+
+    monkeypatch.setattr(streams[0].candles.buffer, "frame", frame)
+
+    for candle in candles:
+
+        results = [stream.evaluate(stream.candles.add_candle(*candle.values())) for stream in streams]
+
+        # The values of the signals may differ in rounding between the incremental and pandas calculations
+        results = [(weight, bullish, [signal[0] for signal in active]) for weight, bullish, active in results]
+
+        assert results[0] == results[1]
+
+def test_candles_that_are_not_newer_are_skipped():
+
+    market  = SyntheticMarket()
+    klines  = market.klines(302)
+    stream  = Stream(market.symbol, market.interval, "1 day ago UTC", loglevel=-1, cache=SyntheticCache(market, 300))
+    candles = [{"t": int(k[0]), "T": int(k[6]), "o": k[1], "h": k[2], "l": k[3], "c": k[4], "v": k[5]} for k in klines]
+
+    # A repeat of the last candle of the history, one from long before it, the next one, and a repeat of that
+    for index in (299, 250, 300, 300, 301):
+        stream.candle_closed(candles[index])
+
+    assert stream.stale == 3
+    assert stream.evaluations == 2
+    assert list(stream.candles.buffer["opentime"]) == list(klines[:, 0])
+
+# A replay must not depend on the network, so without backfill a gap stays in the chart
+def test_gaps_are_left_without_backfill():
+
+    market  = SyntheticMarket()
+    klines  = market.klines(310)
+    stream  = Stream(market.symbol, market.interval, "1 day ago UTC", loglevel=-1, cache=SyntheticCache(market, 300), backfill=False)
+    candles = [{"t": int(k[0]), "T": int(k[6]), "o": k[1], "h": k[2], "l": k[3], "c": k[4], "v": k[5]} for k in klines]
+
+    class Offline:
+        def get_historical_klines(self, *args):
+            raise AssertionError("the REST API was called")
+
+    stream.candles.binance = Offline()
+
+    for index in (300, 305, 306):
+        stream.candle_closed(candles[index])
+
+    assert stream.backfilled == 0
+    assert stream.evaluations == 3
+    assert list(stream.candles.buffer["opentime"]) == list(klines[:301, 0]) + list(klines[305:307, 0])
+
+# Provisional results on the updates of a forming candle leave the indicators and signals as they are, so a candle closes
+# the same with or without them
+@pytest.mark.parametrize("heikinashi", [False, True])
+def test_updates_leave_the_closed_candles_as_they_are(heikinashi):
+
+    market  = SyntheticMarket(volatility=0.01)
+    streams = [Stream(market.symbol, market.interval, "1 day ago UTC", heikinashi=heikinashi, loglevel=-1, cache=SyntheticCache(market, 300)) for _ in range(2)]
+
+    for k in market.klines(360)[300:]:
+
+        # Updates that move away from the closing price, and back
+        for fraction in (0.3, -2.0, 0.9):
+
+            close   = k[1] + fraction * (k[4] - k[1])
+            update  = {"t": int(k[0]), "T": int(k[6]), "o": k[1], "h": max(k[1], close), "l": min(k[1], close), "c": close, "v": abs(fraction) * k[5]}
+
+            assert streams[0].candle_updated(update) is not None
+
+        for stream in streams:
+            stream.candle_closed({"t": int(k[0]), "T": int(k[6]), "o": k[1], "h": k[2], "l": k[3], "c": k[4], "v": k[5]})
+
+        peeked, closed = (stream.candles.buffer for stream in streams)
+
+        assert peeked.columns == closed.columns
+        assert all(np.array_equal(peeked[name], closed[name], equal_nan=True) for name in closed.columns)
+
+        assert streams[0].signals.results() == streams[1].signals.results()
+        assert streams[0].signals.market_is_bullish == streams[1].signals.market_is_bullish
@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+
+from components.sweep import Sweep, score
+from benchmarks.synthetic import SyntheticMarket
+
+
+def test_score_is_monotonic_in_pnl_at_equal_drawdown():
+
+    pnl = np.linspace(-0.5, 0.5, 101)
+
+    for drawdown in (0.0, 1e-6, 0.01, 0.1, 0.5):
+
+        scores = score(pnl, np.full(len(pnl), drawdown))
+
+        assert np.all(np.diff(scores) > 0)
+
+def test_gains_score_above_losses():
+
+    assert score(np.array([0.001]), np.array([0.9])) > score(np.array([-0.001]), np.array([0.0]))
+
+    # A deeper drawdown makes a loss worse, not better
+    assert score(np.array([-0.1]), np.array([0.5])) < score(np.array([-0.1]), np.array([0.1]))
+
+def test_results_are_ranked_by_score():
+
+    klines  = SyntheticMarket().klines(1000)
+    chart   = pd.DataFrame(klines[:, 1:6], columns=["open", "high", "low", "close", "volume"])
+    results = Sweep({"entry": [1, 2, 3], "exit": [-1, -2, -3]}, processes=1, loglevel=-1).run(chart)
+
+    scores  = [result["score"] for result in results]
+
+    assert len(results) == 9
+    assert scores == sorted(scores, reverse=True)
+    assert np.allclose(scores, score(np.array([result["pnl"] for result in results]), np.array([result["max_drawdown"] for result in results])))